@@ -4,6 +4,7 @@ import os
 import sys
 import yaml 
 import datetime
+import time
 
 # --- SET PAGE CONFIG FIRST! ---
 # This MUST be the first Streamlit command in your script.
@@ -17,8 +18,13 @@ if project_root not in sys.path:
 # --- Import Aletheia's Core Functions ---
 # These imports happen after set_page_config, which is fine.
 try:
-    from core.llm_interface import get_llm_completion
-    from core.corememory_system import retrieve_relevant_chunks, ingest_interaction_text
+    from core.llm_interface import stream_llm_completion, get_embedding_cache_stats, CompletionStreamError
+    from core.corememory_system import retrieve_relevant_chunks, ingest_interaction_text, get_memory_store, warm_up_memory
+    from core.retrieval_cache import get_retrieval_cache_stats
+    from core.context_assembly import assemble_context, context_budget, CONTEXT_CANDIDATES
+    from core.lens_registry import get_lens_registry
+    from core.openai_client import warm_up_client
+    from core.telemetry import telemetry, start_metrics_export
     print("[app.py] Core functions imported successfully.")
 except ImportError as e:
     st.error(f"Error importing core functions: {e}. Please ensure core modules are present and error-free.")
@@ -29,6 +35,26 @@ CONFIGS_DIR = "configs/"
 SYSTEM_PROMPT_FILE = os.path.join(CONFIGS_DIR, "system_prompt_aletheia_v0_1.yaml")
 REASONING_LENSES_FILE = os.path.join(CONFIGS_DIR, "reasoning_lenses_v0_1.yaml")
 
+# --- Shared Resources ---
+# st.cache_resource objects are created by the first script run after the server starts and then shared,
+# not copied, by every rerun and every browser session in the process.
+@st.cache_resource(show_spinner="Opening Aletheia's memory...")
+def get_shared_memory_store():
+    """Opens the memory store, lexical index and embedding provider once per server process."""
+    warm_up_memory(background=False)
+    return get_memory_store()
+
+@st.cache_resource(show_spinner=False)
+def get_shared_llm_client() -> bool:
+    """Starts the shared OpenAI client and connection pool once per server process. False without an API key."""
+    return warm_up_client()
+
+@st.cache_resource(show_spinner=False)
+def start_shared_metrics_export() -> bool:
+    """Starts the metrics file (and optional HTTP) export once per server process."""
+    start_metrics_export()
+    return True
+
 # --- Function to Load YAML ---
 # This is a top-level function definition, no leading spaces.
 def load_yaml(file_path):
@@ -68,24 +94,49 @@ def build_system_prompt():
 
 # --- Function to Load Reasoning Lenses ---
 # Decorator and function definition at the top level (no leading spaces)
-@st.cache_data 
-def get_loaded_lenses():
-    """Loads reasoning lenses from the YAML file into a dictionary."""
-    lenses_config = load_yaml(REASONING_LENSES_FILE)
-    loaded_lenses_map = {}
-    if lenses_config and 'lenses' in lenses_config:
-        for lens in lenses_config['lenses']:
-            if 'name' in lens:
-                loaded_lenses_map[lens['name'].lower()] = lens 
-    if not loaded_lenses_map:
+@st.cache_resource(show_spinner=False)
+def get_shared_lens_registry():
+    """Loads and compiles the reasoning lenses once per server process (see core/lens_registry.py)."""
+    lens_registry = get_lens_registry(REASONING_LENSES_FILE)
+    if not lens_registry:
         st.warning("Reasoning lenses could not be loaded. Lens selection will be unavailable.")
-    return loaded_lenses_map
+    return lens_registry
 
 # --- Initialize Aletheia's Core Components ---
 # These are top-level assignments
 ALETHEIA_SYSTEM_PROMPT = build_system_prompt()
-LOADED_LENSES = get_loaded_lenses()
-LENS_NAMES = ["None"] + ([lens_data['name'] for lens_data in LOADED_LENSES.values()] if LOADED_LENSES else [])
+LENS_REGISTRY = get_shared_lens_registry()
+LENS_NAMES = ["None"] + LENS_REGISTRY.names()
+MEMORY_STORE = get_shared_memory_store()
+LLM_CLIENT_READY = get_shared_llm_client()
+start_shared_metrics_export()
+
+# --- Health and Metrics Panel ---
+def render_health_panel():
+    """Sidebar summary of the shared resources, cache hit rates and per-stage latency (process-wide)."""
+    with st.sidebar.expander("Health & metrics"):
+        if MEMORY_STORE.is_open:
+            st.markdown(f"**Memory:** '{MEMORY_STORE.collection_name}' open, {MEMORY_STORE.collection.count()} chunks "
+                        f"(opened in {MEMORY_STORE.startup_stats.get('total_seconds', 0.0):.2f}s)")
+        else:
+            st.error(f"Memory unavailable: {MEMORY_STORE.last_error}")
+        st.markdown(f"**LLM client:** {'ready' if LLM_CLIENT_READY else 'no API key configured'}")
+        retrieval_stats, embedding_stats = get_retrieval_cache_stats(), get_embedding_cache_stats()
+        retrieval_column, embedding_column = st.columns(2)
+        retrieval_column.metric("Retrieval cache hits", f"{retrieval_stats['hit_rate']:.0%}",
+                                help=f"{retrieval_stats['exact_hits']} exact, {retrieval_stats['similar_hits']} similar, {retrieval_stats['misses']} misses")
+        embedding_column.metric("Embedding cache hits", f"{embedding_stats['hit_rate']:.0%}",
+                                help=f"{embedding_stats['memory_hits']} memory, {embedding_stats['disk_hits']} disk, {embedding_stats['misses']} misses")
+        counters = telemetry.get_counters()
+        tokens_in = sum(value for name, value in counters.items() if name.startswith("llm_tokens_in_total"))
+        tokens_out = sum(value for name, value in counters.items() if name.startswith("llm_tokens_out_total"))
+        errors = sum(value for name, value in counters.items() if name.startswith("errors_total"))
+        st.markdown(f"**LLM tokens:** {tokens_in:,.0f} in, {tokens_out:,.0f} out. **Errors:** {errors:.0f}")
+        timings = telemetry.get_span_summary()
+        if timings:
+            st.table(timings)
+        else:
+            st.caption("Stage latencies appear after the first turn.")
 
 
 # --- Streamlit App Layout ---
@@ -119,47 +170,66 @@ if prompt := st.chat_input("What would you like to discuss with Aletheia?"):
         st.markdown(prompt)
 
     # Prepare for Aletheia's response
-    with st.chat_message("assistant"):
+    with st.chat_message("assistant"), telemetry.trace("chat_turn", frontend="streamlit", lens=selected_lens_display_name):
         message_placeholder = st.empty()
         message_placeholder.markdown("Thinking...")
 
-        # 1. Retrieve Context from Memory
-        context_chunks = retrieve_relevant_chunks(prompt, n_results=3)
-        context_text = "\n--- Relevant Context ---\n"
-        if context_chunks:
-            for i, chunk_data in enumerate(context_chunks): 
-                context_text += f"Context {i+1} (Source: {chunk_data.get('metadata', {}).get('source_file_name', 'N/A')} - Title: {chunk_data.get('metadata', {}).get('document_title', 'N/A')}):\n"
-                context_text += f"{chunk_data.get('text_chunk', '')}\n---\n"
-        else:
-            context_text += "No specific context found in memory for this query.\n"
-
-        # 2. Construct the Full Prompt (with or without lens)
-        user_query_for_llm = prompt
-        full_llm_prompt = ""
-        
-        selected_lens_data = None
-        if selected_lens_display_name != "None" and LOADED_LENSES:
-            selected_lens_data = LOADED_LENSES.get(selected_lens_display_name.lower())
-
-        if selected_lens_data and 'prompt_archetype' in selected_lens_data:
-            lens_archetype = selected_lens_data['prompt_archetype']
-            full_llm_prompt = lens_archetype.replace("{CONTEXT_CHUNKS}", context_text.strip())
-            full_llm_prompt = full_llm_prompt.replace("{USER_QUERY}", user_query_for_llm)
-            st.sidebar.info(f"Using Lens: **{selected_lens_display_name}**")
-        else:
-            full_llm_prompt = f"{context_text}\nBased on the above context (if any) and your core identity, respond to the following:\nUser: {user_query_for_llm}"
-
-        # 3. Get LLM Response
-        ai_response_text = get_llm_completion(full_llm_prompt, system_prompt=ALETHEIA_SYSTEM_PROMPT)
-
-        # 4. Display Aletheia's Response
-        if ai_response_text:
+        # 1. Match the selected lens
+        with telemetry.span("lens_matching"):
+            selected_lens = LENS_REGISTRY.get(selected_lens_display_name) if selected_lens_display_name != "None" else None
+
+        # 2. Retrieve Context from Memory (a lens may narrow it to its own sources or fetch more candidates)
+        with telemetry.span("retrieval") as span:
+            context_chunks = retrieve_relevant_chunks(prompt, n_results=(selected_lens and selected_lens.n_results) or CONTEXT_CANDIDATES,
+                                                      content_types=selected_lens.content_types if selected_lens else None)
+            span["chunks"] = len(context_chunks)
+
+        # 3. Construct the Full Prompt (with or without lens)
+        with telemetry.span("prompt_construction") as span:
+            user_query_for_llm = prompt
+            # Deduplicated, merged context that fits what the lens template leaves of the prompt budget
+            context = assemble_context(context_chunks, token_budget=context_budget(selected_lens and selected_lens.template.static_text, user_query_for_llm))
+            context_text = context["text"]
+            span.update(tokens=context["tokens"], passages=len(context["passages"]),
+                        duplicates=context["duplicates"], merged=context["merged"], omitted=context["omitted"])
+
+            full_llm_prompt = ""
+            if selected_lens:
+                full_llm_prompt = selected_lens.render_prompt(context_text.strip(), user_query_for_llm)
+                st.sidebar.info(f"Using Lens: **{selected_lens_display_name}**")
+            else:
+                full_llm_prompt = f"{context_text}\nBased on the above context (if any) and your core identity, respond to the following:\nUser: {user_query_for_llm}"
+
+        # 4. Get LLM Response, updating the placeholder in place as tokens stream in
+        ai_response_text = ""
+        completion_started = time.perf_counter()
+        stream_error = None
+        try:
+            with telemetry.span("completion"):
+                for fragment in stream_llm_completion(full_llm_prompt, system_prompt=ALETHEIA_SYSTEM_PROMPT):
+                    if not ai_response_text:
+                        telemetry.record_span("first_token", time.perf_counter() - completion_started)
+                    ai_response_text += fragment
+                    message_placeholder.markdown(ai_response_text + "▌")
+        except CompletionStreamError as e:
+            stream_error = e
+
+        # 5. Display Aletheia's Response
+        if stream_error is not None:
+            # A cut-off answer is shown as such and not saved, so memory only holds complete turns
             message_placeholder.markdown(ai_response_text)
-            # 5. Save interaction to memory
-            ingest_interaction_text(prompt, ai_response_text) 
+            st.error(f"The response was cut off ({stream_error}). This turn was not saved to memory.")
+        elif ai_response_text:
+            message_placeholder.markdown(ai_response_text)
+            # 6. Save interaction to memory
+            with telemetry.span("memory_write"):
+                ingest_interaction_text(prompt, ai_response_text) 
         else:
             ai_response_text = "I seem to be having trouble processing that right now. Could you rephrase?"
             message_placeholder.markdown(ai_response_text)
             
         # Add assistant response to chat history
-        st.session_state.messages.append({"role": "assistant", "content": ai_response_text})
\ No newline at end of file
+        st.session_state.messages.append({"role": "assistant", "content": ai_response_text})
+
+# Rendered last, so the figures include the turn that just ran
+render_health_panel()
@@ -0,0 +1,269 @@
+# benchmark.py
+# Offline benchmark for ingestion and retrieval. Ingests data/ and configs/ into a throwaway ChromaDB store
+# with the hashing embedding stand-in (no network or API key needed), scores recall against the labelled
+# query set, then grows the collection with synthetic chunks and measures query latency at each size.
+# Results are written as JSON; pass --compare with an earlier results file to see what changed.
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+QUERIES_FILE = os.path.join("benchmarks", "labelled_queries.json")
+RESULTS_DIR = os.path.join("benchmarks", "results")
+DEFAULT_SIZES = [1000, 10000, 100000] # Total chunks in the collection at each measuring point
+RECALL_KS = (1, 3, 5, 10)
+MODES = ("vector", "lexical", "hybrid")
+SYNTHETIC_WORDS_PER_CHUNK = 160
+SYNTHETIC_BATCH_SIZE = 1000
+LATENCY_REPEATS = 3 # Passes over the query set per mode and size
+
+# --- Measurement Helpers ---
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource # Unix only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # Bytes on macOS, KB on Linux
+
+def _current_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+def _percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99),
+            "mean_ms": sum(ordered) / len(ordered), "max_ms": ordered[-1], "samples": len(ordered)}
+
+def _memory_snapshot(store_dir: str) -> Dict[str, Any]:
+    return {"rss_mb": _current_rss_mb(), "peak_rss_mb": _peak_rss_mb(), "store_mb": _directory_mb(store_dir)}
+
+# --- Benchmark Stages ---
+def label_relevant_chunks(memory, queries: List[Dict[str, Any]]) -> Dict[str, set]:
+    """Finds the ids of the chunks each query should retrieve, by the phrases it is labelled with."""
+    relevant = {query["query"]: set() for query in queries}
+    offset = 0
+    while True:
+        page = memory.get_collection().get(limit=SYNTHETIC_BATCH_SIZE, offset=offset, include=['documents'])
+        if not page['ids']:
+            break
+        for chunk_id, document in zip(page['ids'], page['documents']):
+            text = (document or "").lower()
+            for query in queries:
+                if any(phrase.lower() in text for phrase in query["relevant_phrases"]):
+                    relevant[query["query"]].add(chunk_id)
+        offset += len(page['ids'])
+    return relevant
+
+def evaluate_queries(memory, queries: List[Dict[str, Any]], relevant: Dict[str, set], repeats: int) -> Dict[str, Any]:
+    """Runs every labelled query in every mode (uncached), scoring recall@k and MRR and timing each call."""
+    results = {}
+    depth = max(RECALL_KS)
+    for mode in MODES:
+        latencies, recalls, reciprocal_ranks = [], {k: [] for k in RECALL_KS}, []
+        for repeat in range(repeats):
+            for query in queries:
+                relevant_ids = relevant[query["query"]]
+                start = time.perf_counter()
+                retrieved = memory.retrieve_relevant_chunks(query["query"], n_results=depth, use_cache=False, mode=mode)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if repeat or not relevant_ids:
+                    continue # Quality is scored once; unlabelled queries only count towards latency
+                ids = [result["id"] for result in retrieved]
+                for k in RECALL_KS:
+                    recalls[k].append(len(relevant_ids.intersection(ids[:k])) / min(k, len(relevant_ids)))
+                rank = next((i for i, chunk_id in enumerate(ids, 1) if chunk_id in relevant_ids), None)
+                reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        results[mode] = {
+            "latency": _percentiles(latencies),
+            "recall": {f"@{k}": sum(values) / len(values) if values else None for k, values in recalls.items()},
+            "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else None,
+        }
+    return results
+
+def measure_cache_hits(memory, queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Latency of repeated queries answered from the retrieval cache."""
+    for query in queries:
+        memory.retrieve_relevant_chunks(query["query"], n_results=5)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        memory.retrieve_relevant_chunks(query["query"], n_results=5)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return _percentiles(latencies)
+
+def measure_batch(memory, queries: List[Dict[str, Any]], repeats: int) -> Dict[str, Any]:
+    """The whole query set as one uncached hybrid retrieve_relevant_chunks_batch call against one call per query."""
+    texts = [query["query"] for query in queries]
+    batched, sequential = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        memory.retrieve_relevant_chunks_batch(texts, n_results=max(RECALL_KS), use_cache=False, mode="hybrid")
+        batched.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        for text in texts:
+            memory.retrieve_relevant_chunks(text, n_results=max(RECALL_KS), use_cache=False, mode="hybrid")
+        sequential.append((time.perf_counter() - start) * 1000)
+    return {"queries": len(texts), "batch_ms": _percentiles(batched)["p50_ms"], "sequential_ms": _percentiles(sequential)["p50_ms"]}
+
+def add_synthetic_chunks(memory, vocabulary: List[str], weights: List[int], count: int, start_index: int, rng: random.Random):
+    """Grows the collection with chunks of words drawn from the corpus vocabulary, through the normal write path."""
+    from core.embedding_providers import get_embeddings
+    for batch_start in range(0, count, SYNTHETIC_BATCH_SIZE):
+        records = []
+        for i in range(start_index + batch_start, start_index + min(count, batch_start + SYNTHETIC_BATCH_SIZE)):
+            title = f"Synthetic_{i // SYNTHETIC_BATCH_SIZE}"
+            records.append({
+                "id": f"{title}_chunk_{i}",
+                "document": " ".join(rng.choices(vocabulary, weights, k=SYNTHETIC_WORDS_PER_CHUNK)),
+                "metadata": {"source_file_name": "benchmark", "document_title": title,
+                             "content_type": "SyntheticBenchmark", "chunk_sequence_id": i}
+            })
+        memory.add_document_chunks(records[0]["metadata"]["document_title"], records, get_embeddings([r["document"] for r in records]))
+
+def run_benchmark(sizes: List[int], workers: int, repeats: int, dimension: int, seed: int, keep_store: bool) -> Dict[str, Any]:
+    store_dir = tempfile.mkdtemp(prefix="aletheia_benchmark_")
+    # Configured before core is imported: an isolated store and the offline embedding stand-in
+    os.environ.update({"ALETHEIA_EMBEDDING_PROVIDER": "hashing", "ALETHEIA_EMBEDDING_DIMENSION": str(dimension),
+                       "ALETHEIA_CHROMA_PATH": store_dir, "ALETHEIA_COLLECTION_NAME": "benchmark"})
+    try:
+        import_started = time.perf_counter()
+        from core import corememory_system as memory
+        from core.lexical_index import tokenize
+        import ingest_all
+        import_seconds = time.perf_counter() - import_started
+        memory.get_memory_store().open()
+
+        with open(QUERIES_FILE, 'r', encoding='utf-8') as f:
+            queries = json.load(f)["queries"]
+        report: Dict[str, Any] = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+            "settings": {"embedding_provider": "hashing", "embedding_dimension": dimension, "workers": workers,
+                         "vector_backend": memory.get_memory_store().backend,
+                         "repeats": repeats, "sizes": sizes, "seed": seed, "query_count": len(queries)},
+            "startup": dict(memory.get_memory_store().startup_stats, core_import_seconds=import_seconds),
+            "memory": {"baseline": _memory_snapshot(store_dir)},
+        }
+
+        # 1. Ingest the real corpus
+        print("\n[benchmark.py] --- Ingesting data/ and configs/ ---")
+        summary = ingest_all.run_ingestion(force=True, workers=workers) or {}
+        seconds = summary.get("seconds") or 0.0
+        megabytes = summary.get("bytes", 0) / (1024 * 1024)
+        report["ingest"] = dict(summary, megabytes=megabytes,
+                                chunks_per_second=summary.get("chunks", 0) / seconds if seconds else None,
+                                megabytes_per_second=megabytes / seconds if seconds else None)
+        report["memory"]["after_ingest"] = _memory_snapshot(store_dir)
+
+        # 2. Recall and latency on the real corpus, then at each synthetic size
+        relevant = label_relevant_chunks(memory, queries)
+        report["labelled_chunks"] = {query: len(ids) for query, ids in relevant.items()}
+        unlabelled = [query for query, ids in relevant.items() if not ids]
+        if unlabelled:
+            print(f"[benchmark.py] Warning: {len(unlabelled)} queries have no relevant chunks in the corpus: {unlabelled}")
+
+        corpus_words = Counter()
+        for page_start in range(0, memory.get_collection().count(), SYNTHETIC_BATCH_SIZE):
+            page = memory.get_collection().get(limit=SYNTHETIC_BATCH_SIZE, offset=page_start, include=['documents'])
+            for document in page['documents']:
+                corpus_words.update(tokenize(document or ""))
+        vocabulary, weights = list(corpus_words), list(corpus_words.values())
+        rng = random.Random(seed)
+
+        report["scales"] = []
+        for size in [memory.get_collection().count()] + sorted(s for s in sizes if s > memory.get_collection().count()):
+            current = memory.get_collection().count()
+            if size > current:
+                print(f"\n[benchmark.py] --- Growing the collection from {current} to {size} chunks ---")
+                start = time.perf_counter()
+                add_synthetic_chunks(memory, vocabulary, weights, size - current, current, rng)
+                print(f"[benchmark.py] Added {size - current} synthetic chunks in {time.perf_counter() - start:.1f}s.")
+            print(f"[benchmark.py] Querying at {memory.get_collection().count()} chunks...")
+            scale = {"chunks": memory.get_collection().count(), "modes": evaluate_queries(memory, queries, relevant, repeats),
+                     "cached": measure_cache_hits(memory, queries), "batch": measure_batch(memory, queries, repeats),
+                     "memory": _memory_snapshot(store_dir)}
+            report["scales"].append(scale)
+            for mode, result in scale["modes"].items():
+                print(f"[benchmark.py]   {mode:<8} p50 {result['latency']['p50_ms']:.2f}ms  p99 {result['latency']['p99_ms']:.2f}ms  "
+                      f"recall@5 {result['recall']['@5'] or 0:.3f}  MRR {result['mrr'] or 0:.3f}")
+            print(f"[benchmark.py]   batch of {scale['batch']['queries']} hybrid queries {scale['batch']['batch_ms']:.1f}ms "
+                  f"(one call per query {scale['batch']['sequential_ms']:.1f}ms)")
+        report["memory"]["peak_rss_mb"] = _peak_rss_mb()
+        return report
+    finally:
+        if keep_store:
+            print(f"[benchmark.py] Benchmark store kept at {store_dir}")
+        else:
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+# --- Comparing Runs ---
+def _headline_metrics(report: Dict[str, Any]) -> Dict[str, float]:
+    startup = report.get("startup", {})
+    metrics = {"core import s": startup.get("core_import_seconds"), "store open s": startup.get("total_seconds"),
+               "ingest chunks/s": report.get("ingest", {}).get("chunks_per_second")}
+    for scale in report.get("scales", []):
+        for mode, result in scale["modes"].items():
+            metrics[f"{scale['chunks']} chunks {mode} p50 ms"] = result["latency"]["p50_ms"]
+            metrics[f"{scale['chunks']} chunks {mode} recall@5"] = result["recall"]["@5"]
+        if "batch" in scale:
+            metrics[f"{scale['chunks']} chunks batch ms"] = scale["batch"]["batch_ms"]
+    metrics["peak RSS MB"] = report.get("memory", {}).get("peak_rss_mb")
+    return metrics
+
+def compare_reports(previous: Dict[str, Any], current: Dict[str, Any]):
+    """Prints each headline metric from both runs side by side, with the relative change."""
+    before, after = _headline_metrics(previous), _headline_metrics(current)
+    print(f"\n--- Compared with run from {previous.get('timestamp', 'unknown')} ---")
+    for name, value in after.items():
+        old = before.get(name)
+        if value is None or old is None:
+            print(f"{name:<40} {'n/a' if old is None else f'{old:.3f}':>12} -> {'n/a' if value is None else f'{value:.3f}':>12}")
+            continue
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{name:<40} {old:>12.3f} -> {value:>12.3f}  ({change})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and retrieval offline with the hashing embedding provider.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Collection sizes (in chunks) to measure query latency at.")
+    parser.add_argument("--workers", type=int, default=1, help="Chunking processes used for the ingest stage.")
+    parser.add_argument("--repeats", type=int, default=LATENCY_REPEATS, help="Passes over the query set per mode and size.")
+    parser.add_argument("--dimension", type=int, default=256, help="Dimension of the hashing embeddings.")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for the synthetic chunks.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/benchmark_<timestamp>.json).")
+    parser.add_argument("--compare", help="An earlier results file to compare this run against.")
+    parser.add_argument("--keep-store", action="store_true", help="Keep the temporary ChromaDB store for inspection.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.workers, args.repeats, args.dimension, args.seed, args.keep_store)
+    output_path = args.output or os.path.join(RESULTS_DIR, f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n[benchmark.py] Results written to {output_path}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_reports(json.load(f), results)
@@ -0,0 +1,28 @@
+import argparse
+import json
+import os
+import sys
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+try:
+    from core.memory_tiers import HOT_TIER_MAX_AGE_HOURS, compact_interactions, get_compaction_stats, get_tier_counts
+except ImportError as e:
+    print(f"[compact_memory.py] Error: Could not import memory tiering: {e}")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consolidate old live interactions into session summaries and archive the originals.")
+    parser.add_argument("--max-age-hours", type=float, default=HOT_TIER_MAX_AGE_HOURS, help="Interactions younger than this stay in the hot tier.")
+    parser.add_argument("--no-llm", action="store_true", help="Use extractive session summaries instead of asking the LLM.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be compacted without changing anything.")
+    parser.add_argument("--stats", action="store_true", help="Only print tier sizes and the stats of earlier runs.")
+    args = parser.parse_args()
+
+    if not args.stats:
+        compact_interactions(max_age_hours=args.max_age_hours, use_llm=not args.no_llm, dry_run=args.dry_run)
+    print(f"[compact_memory.py] Tier sizes: {get_tier_counts()}")
+    print(f"[compact_memory.py] Compaction history: {json.dumps(get_compaction_stats(), indent=1)}")
@@ -0,0 +1,226 @@
+# core/chunking.py
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Pattern, Tuple
+
+from core.tokens import count_tokens
+
+# --- Chunking Defaults ---
+DEFAULT_CHUNK_SIZE = 1200 # Characters, for CharacterChunker
+DEFAULT_CHUNK_OVERLAP = 150
+DEFAULT_MAX_TOKENS = 256 # Per chunk, for the token-aware chunkers
+DEFAULT_OVERLAP_TOKENS = 32
+DEFAULT_DIALOGUE_MAX_TOKENS = 320
+TOKENIZER_MODEL = "text-embedding-3-small" # Chunks are sized for the embedding model
+
+# A unit ends after sentence punctuation followed by whitespace, or at a line break
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+# A dialogue turn starts at a speaker line, as in the exported chat logs ("user", "ChatGPT", "You said:")
+# and in ingested live interactions ("User: ...", "Aletheia: ...")
+TURN_BOUNDARY = re.compile(r"^(?=(?:user|you said|chatgpt(?: said)?|aletheia)(?:[ \t]*:|[ \t]*$))", re.IGNORECASE | re.MULTILINE)
+WORD_BOUNDARY = re.compile(r"\s+")
+BOUNDARY_LOOKAHEAD = 64 # Characters kept unscanned at a buffer's end, in case a boundary straddles two segments
+MAX_UNIT_CHARS = 16384 # Text without a boundary is handed on in pieces of about this size (cut at whitespace)
+
+# --- Character Chunking ---
+def iter_chunk_text(segments: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> Iterator[str]:
+    """
+    Yields overlapping fixed-size character chunks from a stream of text segments as soon as each one is complete.
+    Produces exactly the same chunks as slicing the concatenated text, while holding
+    at most one chunk plus one segment in memory.
+    """
+    step = chunk_size - chunk_overlap
+    buffer = ""
+    for segment in segments:
+        buffer += segment
+        if step <= 0:
+            if len(buffer) >= chunk_size:
+                break
+            continue
+        # Strictly greater: a chunk that reaches the end of the text is only known to be last once the stream ends
+        while len(buffer) > chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[step:]
+    if buffer:
+        yield buffer[:chunk_size]
+    if step <= 0 and len(buffer) > chunk_size:
+        print(f"Warning: Chunking parameters might lead to infinite loop (size: {chunk_size}, overlap: {chunk_overlap}). Breaking.")
+
+# --- Boundary-Aware Helpers ---
+def iter_units(segments: Iterable[str], boundary: Pattern) -> Iterator[str]:
+    """
+    Splits a stream of text into units that end where `boundary` matches.
+    Units keep their trailing whitespace, so joining them gives back the original text.
+    A stretch without any boundary (e.g. a dialogue chunker given text without speaker lines) is cut at
+    whitespace once it passes MAX_UNIT_CHARS, so memory stays bounded by that rather than the file size.
+    """
+    buffer = ""
+    for segment in segments:
+        buffer += segment
+        scan_limit = len(buffer) - BOUNDARY_LOOKAHEAD
+        start = 0
+        for match in boundary.finditer(buffer):
+            if match.end() > scan_limit:
+                break
+            if match.end() > start:
+                yield buffer[start:match.end()]
+                start = match.end()
+        while scan_limit - start > MAX_UNIT_CHARS:
+            cut = buffer.rfind(" ", start + 1, start + MAX_UNIT_CHARS)
+            cut = cut + 1 if cut != -1 else start + MAX_UNIT_CHARS
+            yield buffer[start:cut]
+            start = cut
+        buffer = buffer[start:]
+    if not buffer:
+        return
+    start = 0
+    for match in boundary.finditer(buffer):
+        if match.end() > start:
+            yield buffer[start:match.end()]
+            start = match.end()
+    if start < len(buffer):
+        yield buffer[start:]
+
+def _split_by(text: str, boundary: Pattern, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """Greedily packs the pieces of `text` between boundary matches into parts of at most max_tokens."""
+    parts, current = [], ""
+    for piece in iter_units([text], boundary):
+        if current and count(current + piece) > max_tokens:
+            parts.append(current)
+            current = ""
+        current += piece
+    if current:
+        parts.append(current)
+    return parts
+
+def split_oversized_unit(unit: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """Breaks a unit that exceeds the budget at sentence, then word, then character boundaries."""
+    if count(unit) <= max_tokens:
+        return [unit]
+    pieces = []
+    for boundary in (SENTENCE_BOUNDARY, WORD_BOUNDARY):
+        parts = _split_by(unit, boundary, max_tokens, count)
+        if len(parts) > 1:
+            for part in parts:
+                pieces.extend(split_oversized_unit(part, max_tokens, count))
+            return pieces
+    # A single unbroken run (e.g. a long URL or base64 blob): cut by characters in proportion to its tokens
+    step = max(1, len(unit) * max_tokens // count(unit))
+    return [unit[i:i + step] for i in range(0, len(unit), step)]
+
+def pack_units(units: Iterable[str], max_tokens: int, overlap_tokens: int,
+               count: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+    """
+    Packs units into chunks of at most max_tokens (as counted per unit), carrying trailing units worth
+    up to overlap_tokens into the next chunk. Yields (chunk_text, token_count) pairs.
+    """
+    window: List[Tuple[str, int]] = []
+    window_tokens = 0
+    has_new_content = False
+    for unit in units:
+        for piece in split_oversized_unit(unit, max_tokens, count):
+            piece_tokens = count(piece)
+            if window and window_tokens + piece_tokens > max_tokens:
+                if has_new_content:
+                    yield "".join(text for text, _ in window), window_tokens
+                carried, carried_tokens = [], 0
+                for text, tokens in reversed(window):
+                    if carried_tokens + tokens > overlap_tokens:
+                        break
+                    carried.insert(0, (text, tokens))
+                    carried_tokens += tokens
+                while carried and carried_tokens + piece_tokens > max_tokens:
+                    carried_tokens -= carried.pop(0)[1]
+                window, window_tokens, has_new_content = carried, carried_tokens, False
+            window.append((piece, piece_tokens))
+            window_tokens += piece_tokens
+            has_new_content = has_new_content or bool(piece.strip())
+    if window and has_new_content:
+        yield "".join(text for text, _ in window), window_tokens
+
+# --- Chunker Interface ---
+class Chunker:
+    """
+    Base class for chunking strategies. Subclasses implement iter_chunks over a stream of text segments,
+    so they work for both whole documents and streamed files.
+    """
+    name = "base"
+
+    @property
+    def signature(self) -> str:
+        """Identifies the strategy and its settings; recorded in the ingest manifest."""
+        return self.name
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        raise NotImplementedError
+
+    def chunk(self, text: str) -> List[str]:
+        if not text: return []
+        return list(self.iter_chunks([text]))
+
+class CharacterChunker(Chunker):
+    """Fixed-size character windows with overlap (the original chunk_text behaviour)."""
+    name = "chars"
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.chunk_size}:{self.chunk_overlap}"
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        return iter_chunk_text(segments, self.chunk_size, self.chunk_overlap)
+
+class TokenBudgetChunker(Chunker):
+    """Packs whole sentences and lines into chunks of a fixed token budget, with token-based overlap."""
+    name = "tokens"
+    boundary = SENTENCE_BOUNDARY
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, model: str = TOKENIZER_MODEL):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.model = model
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.max_tokens}:{self.overlap_tokens}:{self.model}"
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[str]:
+        for chunk, _ in pack_units(iter_units(segments, self.boundary), self.max_tokens, self.overlap_tokens, self.count):
+            chunk = chunk.strip()
+            if chunk:
+                yield chunk
+
+class DialogueTurnChunker(TokenBudgetChunker):
+    """
+    Keeps dialogue turns (User:/Aletheia:, user/ChatGPT in exported logs) whole, packing consecutive turns
+    up to the token budget. Turns longer than the budget are split at sentence boundaries.
+    Text without speaker lines degrades to sentence packing.
+    """
+    name = "dialogue"
+    boundary = TURN_BOUNDARY
+
+    def __init__(self, max_tokens: int = DEFAULT_DIALOGUE_MAX_TOKENS, overlap_tokens: int = 0, model: str = TOKENIZER_MODEL):
+        super().__init__(max_tokens, overlap_tokens, model)
+
+# --- Chunker Registry ---
+CHUNKERS: Dict[str, type] = {
+    CharacterChunker.name: CharacterChunker,
+    TokenBudgetChunker.name: TokenBudgetChunker,
+    DialogueTurnChunker.name: DialogueTurnChunker,
+}
+
+def get_chunker(name: str, **settings) -> Chunker:
+    """Builds a registered chunker by name ('chars', 'tokens' or 'dialogue')."""
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{name}'. Available: {', '.join(CHUNKERS)}")
+    return CHUNKERS[name](**settings)
+
+def register_chunker(chunker_class: type):
+    """Makes a Chunker subclass available to get_chunker under its `name`."""
+    CHUNKERS[chunker_class.name] = chunker_class
+    return chunker_class
@@ -0,0 +1,179 @@
+# core/completion_cache.py
+# Stores chat completions on disk by a hash of everything that determines them: model, system prompt,
+# prompt, sampling parameters and the configs/*.yaml files the system prompt and lenses are built from.
+# Editing a config file changes every key, so answers written under the old config are never replayed.
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import get_setting
+from core.telemetry import telemetry
+
+# --- Cache Settings ---
+# Chosen via environment variables (or .env), read on every completion:
+#   ALETHEIA_COMPLETION_CACHE   disabled (default, for live chat) or replay (tests, benchmarks, scripted
+#                               evaluations: a repeated request is answered from the cache, a new one is
+#                               sent to the API and its answer stored)
+COMPLETION_CACHE_MODES = ("disabled", "replay")
+DEFAULT_COMPLETION_CACHE_MODE = "disabled"
+COMPLETION_CACHE_PATH = "cache/completion_cache.sqlite3" # Relative to the project root, like the embedding cache
+COMPLETION_CACHE_MAX_BYTES = 64 * 1024 * 1024 # Least recently used answers are evicted beyond this
+CONFIG_FILES_PATTERN = "configs/*.yaml"
+
+def get_completion_cache_mode() -> str:
+    mode = (get_setting("ALETHEIA_COMPLETION_CACHE", DEFAULT_COMPLETION_CACHE_MODE) or DEFAULT_COMPLETION_CACHE_MODE).lower()
+    if mode not in COMPLETION_CACHE_MODES:
+        print(f"[completion_cache] Unknown mode '{mode}' (expected {' or '.join(COMPLETION_CACHE_MODES)}). Cache disabled.")
+        return "disabled"
+    return mode
+
+# --- Keys ---
+_fingerprint: Optional[Tuple[Tuple[Tuple[str, int, int], ...], str]] = None
+_fingerprint_lock = threading.Lock()
+
+def config_fingerprint(pattern: str = CONFIG_FILES_PATTERN) -> str:
+    """A hash of the config files' names and contents, re-read only when a file's size or mtime changes."""
+    global _fingerprint
+    signature = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    signature = tuple(signature)
+    with _fingerprint_lock:
+        if _fingerprint is not None and _fingerprint[0] == signature:
+            return _fingerprint[1]
+        digest = hashlib.sha256()
+        for path, _, _ in signature:
+            digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+            try:
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            except OSError as e:
+                print(f"[completion_cache] Error reading {path} for the config fingerprint: {e}")
+            digest.update(b"\0")
+        _fingerprint = (signature, digest.hexdigest())
+        return _fingerprint[1]
+
+def make_completion_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    """The cache key for a request: model, messages (system prompt and prompt), sampling parameters and config fingerprint."""
+    payload = json.dumps({"model": model, "messages": messages, "params": params, "configs": config_fingerprint()},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# --- Cache ---
+class CompletionCache:
+    """
+    Completions in a SQLite table, with the time each was last used. Once the stored answers take up more
+    than max_bytes, the least recently used are deleted.
+    """
+
+    def __init__(self, path: str = COMPLETION_CACHE_PATH, max_bytes: int = COMPLETION_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection: Optional[sqlite3.Connection] = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._connection is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+                )
+                self._connection.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+                self._connection.commit()
+                self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+            except Exception as e:
+                print(f"[completion_cache] Error opening completion cache at '{self.path}': {e}. Completions are not cached.")
+                self._connection = None
+        return self._connection
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return None
+            try:
+                row = connection.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+                    connection.commit()
+            except Exception as e:
+                print(f"[completion_cache] Error reading completion cache: {e}")
+                row = None
+            self.stats["hits" if row is not None else "misses"] += 1
+            return row[0] if row is not None else None
+
+    def put(self, key: str, model: str, response: str):
+        size = len(response.encode("utf-8")) + len(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+            try:
+                previous = connection.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+                connection.execute("INSERT OR REPLACE INTO completions (key, model, response, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                                   (key, model, response, size, time.time()))
+                self._total_bytes += size - (previous[0] if previous else 0)
+                self.stats["writes"] += 1
+                self._evict(connection)
+                connection.commit()
+            except Exception as e:
+                print(f"[completion_cache] Error writing completion cache: {e}")
+
+    def _evict(self, connection: sqlite3.Connection):
+        """Deletes least recently used answers until the cache fits in max_bytes. Caller holds the lock."""
+        while self._total_bytes > self.max_bytes:
+            rows = connection.execute("SELECT key, size FROM completions ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["bytes"] = self._total_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            if connection is not None:
+                connection.execute("DELETE FROM completions")
+                connection.commit()
+                self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+# --- Shared Cache Instance ---
+completion_cache = CompletionCache()
+telemetry.register_collector("completion_cache", completion_cache.get_stats)
@@ -0,0 +1,29 @@
+# core/config.py
+# Settings come from environment variables, with .env loaded the first time a setting is read rather
+# than as a side effect of importing a module.
+import os
+import threading
+from typing import Optional
+
+from dotenv import load_dotenv
+
+_environment_loaded = False
+_environment_lock = threading.Lock()
+
+def load_environment():
+    """Loads .env into the environment once per process. Variables already set take precedence."""
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    with _environment_lock:
+        if not _environment_loaded:
+            load_dotenv()
+            _environment_loaded = True
+
+def get_setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    load_environment()
+    return os.getenv(name, default)
+
+def get_flag(name: str) -> bool:
+    """True when the setting is 1, true or yes."""
+    return (get_setting(name) or "").lower() in ("1", "true", "yes")
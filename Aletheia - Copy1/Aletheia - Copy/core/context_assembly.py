@@ -0,0 +1,207 @@
+# core/context_assembly.py
+# Turns retrieved chunks into the "Relevant Context" block of a prompt, within a token budget:
+# near-duplicate chunks are dropped, neighbouring chunks of one document are merged with their shared
+# overlap removed, and passages are added best-ranked first until the budget is spent.
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from core.chunking import CHUNKERS, Chunker, get_chunker
+from core.tokens import count_tokens
+
+# --- Context Budget Settings ---
+CONTEXT_CANDIDATES = 8 # Chunks to retrieve per turn; the budget decides how many of them are used
+CONTEXT_TOKEN_BUDGET = 1200 # Tokens for the context block when no prompt template is involved
+PROMPT_TOKEN_BUDGET = 3000 # Whole user prompt (template + query + context) when a lens template is used
+MIN_CONTEXT_TOKENS = 300 # Context always gets at least this much, however long the template
+NEAR_DUPLICATE_THRESHOLD = 0.8 # Jaccard similarity of word shingles at which two chunks count as the same text
+SHINGLE_SIZE = 3
+MIN_OVERLAP_CHARS = 16 # Shorter matches between neighbouring chunks only count as overlap if they start a sentence or line
+
+CONTEXT_HEADER = "\n--- Relevant Context ---\n"
+NO_CONTEXT_TEXT = "No specific context found in memory for this query.\n"
+PLACEHOLDER_PATTERN = re.compile(r"\{[A-Z_]+\}")
+WORD_PATTERN = re.compile(r"\w+")
+UNIT_END_PATTERN = re.compile(r"(?:[.!?][\"')\]]*\s+|\n\s*)$") # Where the token chunker's sentence and line units end
+
+def context_budget(template: Optional[str], query: str, total_budget: int = PROMPT_TOKEN_BUDGET) -> int:
+    """The tokens left for context once a prompt template (without its placeholders) and the query are counted."""
+    if not template:
+        return CONTEXT_TOKEN_BUDGET
+    used = count_tokens(PLACEHOLDER_PATTERN.sub("", template)) + count_tokens(query)
+    return max(MIN_CONTEXT_TOKENS, total_budget - used)
+
+# --- Deduplication and Merging ---
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def drop_near_duplicates(chunks: List[Dict[str, Any]], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Keeps the first (best-ranked) of any chunks whose word shingles overlap by at least `threshold`
+    (Jaccard), or whose text is contained in a kept chunk. Returns the kept chunks and how many were dropped.
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    for chunk in chunks:
+        text = chunk.get("text_chunk") or ""
+        shingles = _shingles(text)
+        duplicate = False
+        for other, other_shingles in zip(kept, kept_shingles):
+            union = len(shingles | other_shingles)
+            if text in (other.get("text_chunk") or "") or (union and len(shingles & other_shingles) / union >= threshold):
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+    return kept, len(chunks) - len(kept)
+
+def strip_overlap(previous: str, following: str, min_overlap: int = MIN_OVERLAP_CHARS) -> str:
+    """
+    Returns `following` without the longest prefix that repeats the end of `previous` (the chunker's overlap).
+    A repeat shorter than min_overlap only counts if it starts a sentence or line in `previous`, as the
+    units carried over by the token chunker do (e.g. a lone "4." or "---").
+    """
+    if not following:
+        return following
+    position = previous.find(following[0], max(0, len(previous) - len(following)))
+    while position != -1:
+        # The earliest match that runs to the end of `previous` is the longest overlap
+        overlap = len(previous) - position
+        if following.startswith(previous[position:]) and (overlap >= min_overlap or UNIT_END_PATTERN.search(previous, 0, position)):
+            return following[overlap:]
+        position = previous.find(following[0], position + 1)
+    return following
+
+def chunker_overlaps(chunker: Chunker) -> bool:
+    """Whether neighbouring chunks from this chunker repeat text (the dialogue chunker's do not)."""
+    return bool(getattr(chunker, "overlap_tokens", getattr(chunker, "chunk_overlap", 1)))
+
+def merge_adjacent_chunks(chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Groups chunks that are consecutive (by chunk_sequence_id) in the same document into passages, with
+    the overlap between neighbours stripped. A passage takes the rank of its best member.
+    Returns the passages, best-ranked first, and how many chunks were merged into another.
+    """
+    groups: Dict[Any, List[Tuple[int, int, Dict[str, Any]]]] = {}
+    passages: List[Dict[str, Any]] = []
+    for rank, chunk in enumerate(chunks):
+        metadata = chunk.get("metadata") or {}
+        sequence_id = metadata.get("chunk_sequence_id")
+        if metadata.get("document_title") is None or not isinstance(sequence_id, int):
+            passages.append(_passage([chunk], rank))
+            continue
+        groups.setdefault(metadata["document_title"], []).append((sequence_id, rank, chunk))
+
+    merged_count = 0
+    for members in groups.values():
+        members.sort(key=lambda member: member[0])
+        run = [members[0]]
+        for member in members[1:]:
+            if member[0] == run[-1][0] + 1:
+                run.append(member)
+                continue
+            passages.append(_passage([chunk for _, _, chunk in run], min(rank for _, rank, _ in run)))
+            merged_count += len(run) - 1
+            run = [member]
+        passages.append(_passage([chunk for _, _, chunk in run], min(rank for _, rank, _ in run)))
+        merged_count += len(run) - 1
+    passages.sort(key=lambda passage: passage["rank"])
+    return passages, merged_count
+
+def join_chunk_texts(texts: List[str], overlapping: bool = True) -> str:
+    """
+    Joins consecutive chunks of one document, with the overlap between neighbours removed if `overlapping`.
+    Neighbours without overlap are separated by a line break (chunks are stored without their edge
+    whitespace), so a speaker turn never runs into the last sentence of the chunk before it.
+    """
+    text = texts[0] if texts else ""
+    for previous, following in zip(texts, texts[1:]):
+        rest = strip_overlap(previous, following) if overlapping else following
+        if len(rest) == len(following) and text and rest and not text[-1].isspace() and not rest[0].isspace():
+            text += "\n"
+        text += rest
+    return text
+
+def _passage(chunks: List[Dict[str, Any]], rank: int) -> Dict[str, Any]:
+    chunker_name = (chunks[0].get("metadata") or {}).get("chunker")
+    overlapping = chunker_overlaps(get_chunker(chunker_name)) if chunker_name in CHUNKERS else True
+    text = join_chunk_texts([chunk.get("text_chunk") or "" for chunk in chunks], overlapping)
+    return {"text": text.strip(), "metadata": chunks[0].get("metadata") or {}, "rank": rank, "chunks": chunks}
+
+# --- Budgeted Assembly ---
+def _format_passage(number: int, passage: Dict[str, Any]) -> str:
+    metadata = passage["metadata"]
+    return (f"Context {number} (Source: {metadata.get('source_file_name', 'N/A')} - Title: {metadata.get('document_title', 'N/A')}):\n"
+            f"{passage['text']}\n---\n")
+
+def _truncate_to_tokens(text: str, max_tokens: int, model: Optional[str]) -> str:
+    """The longest prefix of `text`, cut at a word boundary, that fits in max_tokens."""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle], model) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    return cut[:cut.rfind(" ")] if " " in cut and low < len(text) else cut
+
+def assemble_context(chunks: List[Dict[str, Any]], token_budget: int = CONTEXT_TOKEN_BUDGET, model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Builds the context block from retrieval results (best first) within `token_budget` tokens.
+    Returns the block as "text" along with what went into it: "passages", "tokens", and the
+    numbers of chunks that were "duplicates", "merged" or "omitted" for lack of budget.
+    """
+    unique, duplicates = drop_near_duplicates(chunks)
+    queue, merged = merge_adjacent_chunks(unique)
+    used = count_tokens(CONTEXT_HEADER, model)
+    selected: List[Dict[str, Any]] = []
+    omitted = 0
+    while queue:
+        passage = queue.pop(0)
+        tokens = count_tokens(_format_passage(len(selected) + 1, passage), model)
+        if used + tokens <= token_budget:
+            selected.append(passage)
+            used += tokens
+        elif len(passage["chunks"]) > 1:
+            # Too long as a whole: offer its chunks separately, in their place in the ranking
+            parts = [_passage([chunk], passage["rank"]) for chunk in passage["chunks"]]
+            merged -= len(parts) - 1
+            queue = sorted(parts + queue, key=lambda candidate: candidate["rank"])
+        elif not selected:
+            # Nothing fits yet: keep as much of the best chunk as the budget allows
+            overhead = count_tokens(_format_passage(1, dict(passage, text="")), model)
+            passage = dict(passage, text=_truncate_to_tokens(passage["text"], token_budget - used - overhead, model) + " ...")
+            selected.append(passage)
+            used += count_tokens(_format_passage(1, passage), model)
+        else:
+            omitted += 1
+
+    body = "".join(_format_passage(number, passage) for number, passage in enumerate(selected, start=1))
+    text = CONTEXT_HEADER + (body or NO_CONTEXT_TEXT)
+    return {"text": text, "passages": selected, "tokens": count_tokens(text, model),
+            "duplicates": duplicates, "merged": merged, "omitted": omitted}
+
+if __name__ == "__main__":
+    # Direct check: merging a document's consecutive chunks gives back its text (whitespace normalized)
+    import glob
+    import os
+
+    MERGE_CHECK_CHUNKS = 6
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    failures = 0
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.txt"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        source = " ".join(text.split())
+        for chunker_name in ("tokens", "dialogue"):
+            chunker = get_chunker(chunker_name)
+            chunks = chunker.chunk(text)[:MERGE_CHECK_CHUNKS]
+            merged = " ".join(join_chunk_texts(chunks, chunker_overlaps(chunker)).split())
+            ok = source.startswith(merged)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {chunker_name:<8} {os.path.basename(path)} ({len(chunks)} chunks)")
+    print(f"{failures} merge mismatches.")
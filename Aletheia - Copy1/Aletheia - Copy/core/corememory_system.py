@@ -1,225 +1,961 @@
 # core/memory_system.py (or corememory_system.py)
 
-import chromadb
-from docx import Document # pip install python-docx
+import atexit
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 import datetime
 
 # --- Import the REAL embedding function ---
-from core.llm_interface import get_openai_embedding 
+# Embeddings come from the configured provider (OpenAI by default; see core/embedding_providers.py)
+from core.config import get_setting, get_flag
+from core.embedding_providers import get_embedding, get_embeddings, get_embedding_provider
+from core.ingest_manifest import IngestManifest, MANIFEST_FILE_NAME, hash_chunk, hash_file
+from core.chunking import Chunker
+from core.interaction_writer import InteractionWriteBehind, JOURNAL_FILE_NAME
+from core.retrieval_cache import retrieval_cache
+from core.reranking import get_reranker, rerank, RERANK_CANDIDATES
+from core.lexical_index import LexicalIndex, LEXICAL_INDEX_FILE_NAME
+from core.metadata_index import MetadataIndex
+from core.sharded_collection import ShardedCollection, content_types_in_filter
+from core.telemetry import telemetry
+# Loaders and chunking live in core/documents.py (free of ChromaDB, so worker processes can use them)
+from core.documents import (
+    load_text_file, load_docx_file, iter_document_text, chunk_text,
+    get_chunker_for_content_type, iter_document_chunks
+)
 # ----------------------------------------
 
 # --- ChromaDB Setup ---
+# Defaults; ALETHEIA_CHROMA_PATH, ALETHEIA_COLLECTION_NAME and ALETHEIA_SHARD_BY_CONTENT_TYPE override them
 CHROMA_DATA_PATH = "db_data/" # Path relative to the project root where ingest_all.py is
+# The collection records the embedding space (provider, model, dimension) it was built with and rejects other
+# vectors, so switching to a different provider means pointing ALETHEIA_COLLECTION_NAME at another collection
 COLLECTION_NAME = "aletheia_memory"
+STORE_RETRY_SECONDS = 30.0 # After a failed open, callers get None for this long before ChromaDB is tried again
+# "chroma" (HNSW index) or "numpy" (exact search over a memory-mapped file; see core/numpy_collection.py).
+# ALETHEIA_VECTOR_BACKEND overrides it, and ALETHEIA_VECTOR_DTYPE picks float32, float16 or int8 storage for numpy
+VECTOR_BACKEND = "chroma"
+BACKEND_LABELS = {"chroma": "ChromaDB", "numpy": "NumPy"}
 
-try:
+def _resolve_data_path(path: str) -> str:
     # When scripts in core/ are run directly for testing, the path might need adjustment
     # However, for ingest_all.py in the root, this should be fine.
-    if not os.path.exists(CHROMA_DATA_PATH) and not os.path.isabs(CHROMA_DATA_PATH):
-         # Attempt to create path relative to project root if core script is run directly
+    if not os.path.exists(path) and not os.path.isabs(path):
         if __name__ == "__main__" and os.path.basename(os.getcwd()) == "core":
-            persistent_path = os.path.join("..", CHROMA_DATA_PATH)
-        else:
-            persistent_path = CHROMA_DATA_PATH
-    else:
-        persistent_path = CHROMA_DATA_PATH
-
-    client = chromadb.PersistentClient(path=persistent_path)
-except Exception as e:
-    print(f"Error initializing ChromaDB persistent client at '{persistent_path}': {e}")
-    client = chromadb.Client() 
-    print("Initialized in-memory ChromaDB client as a fallback.")
-
-try:
-    collection = client.get_or_create_collection(name=COLLECTION_NAME)
-    print(f"ChromaDB collection '{COLLECTION_NAME}' loaded/created successfully.")
-except Exception as e:
-    print(f"Error getting or creating ChromaDB collection: {e}")
-    collection = None 
-    print("Failed to initialize ChromaDB collection.")
-
-# --- Document Loaders ---
-def load_text_file(file_path: str) -> Optional[str]:
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return None
-    except Exception as e:
-        print(f"Error loading text file {file_path}: {e}")
-        return None
+            return os.path.join("..", path)
+    return path
 
-def load_docx_file(file_path: str) -> Optional[str]:
-    try:
-        doc = Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return None
-    except Exception as e:
-        print(f"Error loading DOCX file {file_path}: {e}")
+class MemoryStore:
+    """
+    The vector store client and collection (ChromaDB, or the NumPy backend), opened on first use instead of
+    at import time and reused afterwards.
+
+    open() records how long each startup step took in `startup_stats`. If ChromaDB cannot be opened, the
+    error is kept in `last_error` and callers get None, so memory is reported unavailable rather than
+    silently replaced by an empty in-memory store; the next attempt is made after STORE_RETRY_SECONDS.
+    """
+
+    def __init__(self, path: Optional[str] = None, collection_name: Optional[str] = None,
+                 shard_by_content_type: Optional[bool] = None, backend: Optional[str] = None):
+        self.path = _resolve_data_path(path or get_setting("ALETHEIA_CHROMA_PATH", CHROMA_DATA_PATH))
+        self.collection_name = collection_name or get_setting("ALETHEIA_COLLECTION_NAME", COLLECTION_NAME)
+        self.backend = (backend or get_setting("ALETHEIA_VECTOR_BACKEND", VECTOR_BACKEND)).lower()
+        # One collection per content_type (see core/sharded_collection.py); queries filtered by content_type only search those shards
+        self.shard_by_content_type = get_flag("ALETHEIA_SHARD_BY_CONTENT_TYPE") if shard_by_content_type is None else shard_by_content_type
+        self.startup_stats: Dict[str, float] = {}
+        self.last_error: Optional[str] = None
+        self._client = None
+        self._collection = None
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._collection is not None
+
+    @property
+    def collection(self):
+        return self.open()
+
+    @property
+    def client(self):
+        self.open()
+        return self._client
+
+    def open(self):
+        """Returns the collection, opening ChromaDB on the first call. None if it cannot be opened."""
+        if self._collection is not None:
+            return self._collection
+        with self._lock:
+            if self._collection is not None:
+                return self._collection
+            if self._failed_at is not None and time.monotonic() - self._failed_at < STORE_RETRY_SECONDS:
+                return None
+            label = BACKEND_LABELS.get(self.backend, self.backend)
+            started = time.perf_counter()
+            try:
+                if self.backend == "numpy":
+                    from core.numpy_collection import NumpyClient, DEFAULT_VECTOR_DTYPE
+                    imported = time.perf_counter()
+                    client = NumpyClient(self.path, get_setting("ALETHEIA_VECTOR_DTYPE", DEFAULT_VECTOR_DTYPE))
+                elif self.backend == "chroma":
+                    import chromadb # Deferred: importing it is the largest part of a cold start
+                    imported = time.perf_counter()
+                    client = chromadb.PersistentClient(path=self.path)
+                else:
+                    raise ValueError(f"unknown vector backend '{self.backend}' (use {' or '.join(BACKEND_LABELS)})")
+                connected = time.perf_counter()
+                collection = self._open_collection(client)
+            except Exception as e:
+                self.last_error = str(e)
+                self._failed_at = time.monotonic()
+                print(f"[corememory] Error opening {label} store at '{self.path}': {e}. "
+                      f"Memory is unavailable; retrying in {STORE_RETRY_SECONDS:.0f}s.")
+                return None
+            finished = time.perf_counter()
+            self._client, self._collection = client, collection
+            self.last_error, self._failed_at = None, None
+            self.startup_stats = {"import_seconds": imported - started, "client_seconds": connected - imported,
+                                  "collection_seconds": finished - connected, "total_seconds": finished - started}
+            telemetry.record_span("store_open", finished - started)
+            shards = f", {len(collection.shard_names())} content-type shards" if isinstance(collection, ShardedCollection) else ""
+            print(f"[corememory] {label} collection '{self.collection_name}' opened in {finished - started:.2f}s "
+                  f"(import {imported - started:.2f}s, client {connected - imported:.2f}s, "
+                  f"collection {finished - connected:.2f}s{shards}).")
+            return collection
+
+    def _open_collection(self, client):
+        if not self.shard_by_content_type:
+            collection = client.get_or_create_collection(name=self.collection_name)
+            if self.backend == "numpy" and not collection.count():
+                self._import_chroma_store(collection)
+            return collection
+        sharded = ShardedCollection(client, self.collection_name)
+        if self.backend == "numpy" and not sharded.shard_names():
+            self._import_chroma_store(sharded)
+        self._split_legacy_collection(client, sharded)
+        return sharded
+
+    def _split_legacy_collection(self, client, sharded: ShardedCollection):
+        """
+        First use of sharding: copy an existing single collection (embeddings included) into the shards.
+        The registry's metadata records the copy as started ("migrating_from") and then as finished
+        ("migrated_from"), so a copy that was interrupted is resumed the next time the store opens.
+        """
+        metadata = dict(sharded.metadata or {})
+        if metadata.get("migrated_from") == self.collection_name:
+            return
+        try:
+            legacy = client.get_collection(name=self.collection_name)
+        except Exception:
+            return
+        total = legacy.count()
+        if not total:
+            return
+        resuming = bool(sharded.shard_names())
+        if resuming and metadata.get("migrating_from") != self.collection_name and sharded.count() >= total:
+            # Split before the copy was recorded, and the shards hold at least as much: nothing to resume
+            sharded.modify(metadata=dict(metadata, migrated_from=self.collection_name))
+            return
+        print(f"{'Resuming the split of' if resuming else 'Splitting'} {total} chunks from '{self.collection_name}' into per-content-type shards...")
+        metadata = {**(legacy.metadata or {}), **metadata, "migrating_from": self.collection_name}
+        sharded.modify(metadata=metadata)
+        copied = sharded.import_from(legacy, skip_existing=resuming)
+        metadata.pop("migrating_from")
+        sharded.modify(metadata=dict(metadata, migrated_from=self.collection_name))
+        print(f"Copied {copied} chunks into {len(sharded.shard_names())} shards. '{self.collection_name}' itself is left unchanged.")
+
+    def _import_chroma_store(self, target):
+        """First use of the NumPy backend where a ChromaDB store exists: copy its collection, embeddings included."""
+        if not os.path.exists(os.path.join(self.path, "chroma.sqlite3")):
+            return
+        source_client = None
+        try:
+            import chromadb
+            source_client = chromadb.PersistentClient(path=self.path)
+            source = source_client.get_collection(name=self.collection_name)
+            if not source.count():
+                return
+            print(f"Copying {source.count()} chunks from ChromaDB collection '{self.collection_name}' into the NumPy store...")
+            copied = target.import_from(source)
+            if source.metadata:
+                target.modify(metadata=dict(source.metadata))
+            print(f"Copied {copied} chunks. The ChromaDB store itself is left unchanged.")
+        except Exception as e:
+            print(f"[corememory] Could not copy the ChromaDB collection into the NumPy store: {e}")
+        finally:
+            if source_client is not None and hasattr(source_client, "close"):
+                source_client.close()
+
+    def close(self):
+        """Releases the vector store client. A later call to open() opens it again."""
+        with self._lock:
+            client, self._client, self._collection = self._client, None, None
+        if client is not None and hasattr(client, "close"): # Older ChromaDB clients have no close()
+            try:
+                client.close()
+            except Exception as e:
+                print(f"[corememory] Error closing {BACKEND_LABELS.get(self.backend, self.backend)} client: {e}")
+
+_store: Optional[MemoryStore] = None
+_store_lock = threading.Lock()
+
+def get_memory_store() -> MemoryStore:
+    """Returns the process-wide memory store (not yet opened; see MemoryStore.open)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MemoryStore()
+        return _store
+
+def get_collection():
+    """The process-wide collection, opened on first use. None if ChromaDB is unavailable."""
+    return get_memory_store().open()
+
+def __getattr__(name: str):
+    # `collection`, `client` and `persistent_path` used to be module globals set at import time
+    if name == "collection":
+        return get_collection()
+    if name == "client":
+        return get_memory_store().client
+    if name == "persistent_path":
+        return get_memory_store().path
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Embedding Space ---
+EMBEDDING_SPACE_KEYS = ("embedding_provider", "embedding_model", "embedding_dimension")
+_verified_embedding_space: Optional[Dict[str, Any]] = None
+
+def get_embedding_space() -> Dict[str, Any]:
+    """The embedding provider, model and dimension recorded on the collection ({} if none recorded yet)."""
+    collection = get_collection()
+    metadata = (collection.metadata if collection else None) or {}
+    return {key: metadata[key] for key in EMBEDDING_SPACE_KEYS if key in metadata}
+
+def check_embedding_space(dimension: int, stamp: bool = False) -> Optional[str]:
+    """
+    Checks that vectors of `dimension` from the configured provider belong in the collection.
+    Returns an error message if they do not, else None. With stamp=True, a collection that has no
+    embedding space recorded yet is stamped with the provider's (after checking any vectors already in it).
+    """
+    global _verified_embedding_space
+    provider = get_embedding_provider()
+    expected = dict(provider.signature, embedding_dimension=dimension)
+    if _verified_embedding_space == expected:
         return None
+    collection, collection_name = get_collection(), get_memory_store().collection_name
+    if collection is None:
+        return f"ChromaDB is unavailable ({get_memory_store().last_error})"
+    space = get_embedding_space()
+    if not space:
+        if not stamp:
+            return None
+        try:
+            # Collections created before spaces were recorded: the stored vectors decide the dimension
+            existing = collection.get(limit=1, include=['embeddings'])
+            stored = existing.get('embeddings')
+            if stored is not None and len(stored) > 0 and len(stored[0]) != dimension:
+                return (f"collection '{collection_name}' holds {len(stored[0])}-dimensional vectors, but the "
+                        f"'{provider.name}' provider produces {dimension}-dimensional ones")
+            collection.modify(metadata=dict(collection.metadata or {}, **expected))
+            print(f"[corememory] Recorded embedding space on '{collection_name}': {provider.name}/{provider.model}, {dimension} dimensions.")
+        except Exception as e:
+            return f"could not record the embedding space on collection '{collection_name}': {e}"
+    elif space != expected:
+        return (f"collection '{collection_name}' was built with {space.get('embedding_provider')}/{space.get('embedding_model')} "
+                f"({space.get('embedding_dimension')} dimensions), but the configured provider is "
+                f"{provider.name}/{provider.model} ({dimension} dimensions). Use a different ALETHEIA_COLLECTION_NAME.")
+    _verified_embedding_space = expected
+    return None
 
-# --- Text Chunking Strategy ---
-def chunk_text(text: str, chunk_size: int = 1200, chunk_overlap: int = 150) -> List[str]:
-    if not text: return []
-    chunks = []
-    start_index = 0
-    text_len = len(text)
-    while start_index < text_len:
-        end_index = min(start_index + chunk_size, text_len)
-        chunks.append(text[start_index:end_index])
-        if end_index == text_len: break
-        start_index += (chunk_size - chunk_overlap)
-        if (chunk_size - chunk_overlap) <= 0: 
-            print(f"Warning: Chunking parameters might lead to infinite loop (size: {chunk_size}, overlap: {chunk_overlap}). Breaking.")
-            break 
-    return chunks
+# --- Lexical Index ---
+LEXICAL_REBUILD_PAGE_SIZE = 1000
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
 
-# --- Ingestion into ChromaDB ---
-def ingest_document(file_path: str, document_title: str, content_type: str):
-    if not collection:
-        print("Error: ChromaDB collection not initialized. Skipping ingestion.")
-        return
-    print(f"Starting ingestion for: {file_path} (Title: {document_title})")
-    _, file_extension = os.path.splitext(file_path)
-    file_name = os.path.basename(file_path)
-
-    text_content = None 
-    if file_extension.lower() == '.txt' or file_extension.lower() == '.yaml': 
-        text_content = load_text_file(file_path)
-    elif file_extension.lower() == '.docx':
-        text_content = load_docx_file(file_path)
-    else:
-        print(f"Warning: Unsupported file type '{file_extension}' for {file_path}. Skipping.")
-        return 
+def rebuild_lexical_index(index: LexicalIndex):
+    """Re-indexes every chunk in the collection, page by page."""
+    collection = get_collection()
+    index.clear()
+    offset = 0
+    while True:
+        page = collection.get(limit=LEXICAL_REBUILD_PAGE_SIZE, offset=offset, include=['documents', 'metadatas'])
+        if not page.get('ids'):
+            break
+        index.add(page['ids'], page['documents'], page['metadatas'])
+        offset += len(page['ids'])
+    print(f"[corememory] Lexical index rebuilt with {index.count()} chunks.")
 
-    if not text_content: 
-        print(f"Warning: No text content loaded from {file_path}. Skipping.")
-        return
-        
-    chunks = chunk_text(text_content)
-    if not chunks:
-        print(f"Warning: No chunks generated for {document_title}. Skipping.")
-        return
-        
-    print(f"Generated {len(chunks)} chunks for {document_title}.")
+def get_lexical_index() -> LexicalIndex:
+    """
+    Returns the BM25 index mirroring the collection, loading it on first use.
+    It is rebuilt from the collection if the two have drifted apart (e.g. chunks written before it existed).
+    """
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            index = LexicalIndex(os.path.join(get_memory_store().path, LEXICAL_INDEX_FILE_NAME))
+            collection = get_collection()
+            if collection is None:
+                return index # Not kept, so it is checked against the collection once ChromaDB opens
+            try:
+                if index.count() != collection.count():
+                    rebuild_lexical_index(index)
+            except Exception as e:
+                print(f"[corememory] Error rebuilding lexical index: {e}")
+            _lexical_index = index
+        return _lexical_index
 
-    embeddings_to_add, documents_to_add, metadatas_to_add, ids_to_add = [], [], [], []
+# --- Metadata Index ---
+METADATA_INDEX_PAGE_SIZE = 1000
+_metadata_index: Optional[MetadataIndex] = None
+_metadata_index_lock = threading.Lock()
 
-    for i, chunk in enumerate(chunks):
-        chunk_sequence_id = i + 1
-        
-        embedding_vector = get_openai_embedding(chunk) 
+def get_metadata_index() -> Optional[MetadataIndex]:
+    """
+    Returns the index of filterable metadata (content_type, document_title, source_file_name, timestamp),
+    built from the collection on first use and kept in step with it by every write and delete.
+    """
+    global _metadata_index
+    with _metadata_index_lock:
+        if _metadata_index is None:
+            collection = get_collection()
+            if collection is None:
+                return None
+            index = MetadataIndex()
+            offset = 0
+            try:
+                while True:
+                    page = collection.get(limit=METADATA_INDEX_PAGE_SIZE, offset=offset, include=['metadatas'])
+                    if not page.get('ids'):
+                        break
+                    index.add(page['ids'], page['metadatas'])
+                    offset += len(page['ids'])
+            except Exception as e:
+                print(f"[corememory] Error building metadata index: {e}")
+                return None
+            print(f"[corememory] Metadata index built with {index.count()} chunks.")
+            _metadata_index = index
+        return _metadata_index
 
+def _prefilter(filters: Optional[Dict[str, Any]]) -> Tuple[Optional[List[str]], Optional[Dict[str, Any]]]:
+    """
+    Resolves the indexed conditions of a `where` filter to candidate chunk ids. Returns (candidate ids, rest
+    of the filter); candidate ids are None when the filter has no indexed conditions (or there is no index).
+    """
+    if not filters:
+        return None, filters
+    index = get_metadata_index()
+    if index is None:
+        return None, filters
+    with telemetry.span("metadata_prefilter") as span:
+        candidate_ids, residual = index.candidates(filters)
+        span.update(candidates=len(candidate_ids) if candidate_ids is not None else None, residual=residual is not None)
+    return candidate_ids, residual
+
+# --- Ingestion into ChromaDB ---
+INGEST_BATCH_SIZE = 512 # Chunks embedded and written per batch while streaming a document
+
+def add_document_chunks(document_title: str, records: List[Dict[str, Any]], embeddings: List[Optional[List[float]]]) -> List[str]:
+    """
+    Upserts prepared chunk records and their embeddings into ChromaDB, skipping chunks without an embedding.
+    Returns the ids that were written.
+    """
+    embeddings_to_add, documents_to_add, metadatas_to_add, ids_to_add = [], [], [], []
+    for record, embedding_vector in zip(records, embeddings):
         if embedding_vector is None:
-            print(f"Warning: Could not generate embedding for chunk {chunk_sequence_id} of {document_title}. Skipping.")
-            continue # This 'continue' is correctly in the loop
-
-        metadata = {
-            "source_file_name": file_name, "document_title": document_title,
-            "content_type": content_type, "chunk_sequence_id": chunk_sequence_id,
-            "original_text_preview": chunk[:200] + "..." 
-        }
+            print(f"Warning: Could not generate embedding for chunk {record['metadata']['chunk_sequence_id']} of {record['metadata']['document_title']}. Skipping.")
+            continue
         embeddings_to_add.append(embedding_vector)
-        documents_to_add.append(chunk) 
-        metadatas_to_add.append(metadata)
-        
-        sane_title = "".join(c if c.isalnum() else "_" for c in document_title)
-        ids_to_add.append(f"{sane_title}_chunk_{chunk_sequence_id}")
+        documents_to_add.append(record["document"])
+        metadatas_to_add.append(record["metadata"])
+        ids_to_add.append(record["id"])
 
     if documents_to_add: 
+        dimensions = {len(vector) for vector in embeddings_to_add}
+        space_error = f"mixed embedding dimensions {sorted(dimensions)} in one batch" if len(dimensions) > 1 else check_embedding_space(dimensions.pop(), stamp=True)
+        if space_error:
+            print(f"Error: Refusing to write chunks from {document_title}: {space_error}")
+            return []
+        collection = get_collection()
+        lexical_index = get_lexical_index() # Loaded (and synced) before the write, so this batch is indexed once
         try:
-            collection.add(
+            # upsert, not add: chunk ids are deterministic and may already exist from an earlier run
+            collection.upsert(
                 embeddings=embeddings_to_add,
                 documents=documents_to_add, 
                 metadatas=metadatas_to_add,
                 ids=ids_to_add
             )
-            print(f"Successfully added {len(documents_to_add)} chunks from {document_title} to ChromaDB.")
+            print(f"Successfully upserted {len(documents_to_add)} chunks from {document_title} to ChromaDB.")
+            lexical_index.add(ids_to_add, documents_to_add, metadatas_to_add)
+            if _metadata_index is not None:
+                _metadata_index.add(ids_to_add, metadatas_to_add)
+            return ids_to_add
         except Exception as e:
             print(f"Error adding chunks to ChromaDB for {document_title}: {e}")
+        finally:
+            # After the write, even a failed one (it may be partial), so no stale results get cached in between
+            retrieval_cache.invalidate()
     else:
         print(f"No valid chunks with embeddings to add for {document_title}.")
+    return []
 
-# --- Retrieval from ChromaDB ---
-def retrieve_relevant_chunks(query_text: str, filters: Optional[Dict[str, Any]] = None, n_results: int = 5) -> List[Dict[str, Any]]:
-    if not collection or not query_text: return []
+def delete_chunks(chunk_ids: List[str], label: str) -> bool:
+    """Deletes chunks from ChromaDB and the lexical index. Returns False (after printing the error) on failure."""
+    if not chunk_ids:
+        return True
+    collection = get_collection()
+    if collection is None:
+        print(f"Error deleting chunks from {label}: ChromaDB is unavailable.")
+        return False
+    try:
+        collection.delete(ids=chunk_ids)
+        get_lexical_index().remove(chunk_ids)
+        if _metadata_index is not None:
+            _metadata_index.remove(chunk_ids)
+        print(f"Deleted {len(chunk_ids)} chunks from {label}.")
+        return True
+    except Exception as e:
+        print(f"Error deleting chunks from {label}: {e}")
+        return False
+    finally:
+        retrieval_cache.invalidate()
+
+class ChunkBatchWriter:
+    """
+    Collects chunk records and embeds + upserts them in bounded batches, so ingestion memory
+    stays flat however large the source files are. Records from several documents may share a batch.
+
+    With embed_concurrency > 1, up to that many batches are embedded at once on worker threads,
+    while every ChromaDB write still happens on the thread that owns the writer (a single writer).
+    """
+
+    def __init__(self, batch_size: int = INGEST_BATCH_SIZE, embed_concurrency: int = 1):
+        self.batch_size = batch_size
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.pending: List[Dict[str, Any]] = []
+        self.failed_ids = set()
+        self.written_count = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="embed") if self.embed_concurrency > 1 else None
+        self._in_flight = deque() # (records, future) in submission order
+
+    def add(self, record: Dict[str, Any]):
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
 
-    query_embedding = get_openai_embedding(query_text)
-    if query_embedding is None: return []
+    def _write(self, records: List[Dict[str, Any]], embeddings: List[Optional[List[float]]]):
+        titles = list(dict.fromkeys(record["metadata"]["document_title"] for record in records))
+        written_ids = set(add_document_chunks(", ".join(titles), records, embeddings))
+        self.written_count += len(written_ids)
+        self.failed_ids.update(record["id"] for record in records if record["id"] not in written_ids)
 
+    def _write_oldest(self):
+        records, future = self._in_flight.popleft()
+        try:
+            embeddings = future.result()
+        except Exception as e:
+            print(f"Error embedding batch of {len(records)} chunks: {e}")
+            embeddings = [None] * len(records)
+        self._write(records, embeddings)
+
+    def flush(self):
+        """Sends pending records for embedding. Blocks only while the concurrency limit is reached."""
+        if self.pending:
+            records, self.pending = self.pending, []
+            texts = [record["document"] for record in records]
+            if self._executor is None:
+                self._write(records, get_embeddings(texts))
+            else:
+                while len(self._in_flight) >= self.embed_concurrency:
+                    self._write_oldest()
+                self._in_flight.append((records, self._executor.submit(get_embeddings, texts)))
+
+    def drain(self):
+        """Flushes pending records and waits until every in-flight batch has been written."""
+        self.flush()
+        while self._in_flight:
+            self._write_oldest()
+
+    def close(self):
+        self.drain()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+# --- Incremental Ingestion ---
+def load_ingest_manifest() -> IngestManifest:
+    return IngestManifest.load(os.path.join(get_memory_store().path, MANIFEST_FILE_NAME))
+
+def _stored_chunk_hashes(document_title: str) -> Dict[str, str]:
+    """Reads the chunk hashes already in ChromaDB for a document (used when the manifest has no entry yet)."""
     try:
-        results = collection.query(query_embeddings=[query_embedding], n_results=n_results, where=filters, include=['metadatas', 'documents', 'distances'])
+        existing = get_collection().get(where={"document_title": document_title}, include=['documents'])
+    except Exception as e:
+        print(f"Error reading existing chunks for {document_title}: {e}")
+        return {}
+    return {chunk_id: hash_chunk(document or "") for chunk_id, document in zip(existing.get('ids', []), existing.get('documents') or [])}
+
+def stage_document_ingestion(file_path: str, document_title: str, content_type: str, manifest: IngestManifest,
+                             writer: ChunkBatchWriter, force: bool = False, chunker: Optional[Chunker] = None,
+                             records: Optional[Iterable[Dict[str, Any]]] = None, content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Streams one file's chunks, diffs them against the manifest and hands new or modified chunks to `writer`.
+    Returns None when the file is unchanged since the last ingestion, otherwise a plan with the
+    ids that were staged, the ids that no longer exist, and the file's new state.
+    The plan is completed by finalize_document_ingestion once the writer has been drained.
+
+    Callers that chunked the file elsewhere (e.g. in a worker process) pass `records` and `content_hash`;
+    the unchanged-file check is then assumed to have been done by the caller.
+    """
+    chunker = chunker or get_chunker_for_content_type(content_type)
+    if records is None:
+        if not force and manifest.is_unchanged(file_path, document_title, content_type, chunker.signature):
+            print(f"Unchanged since last ingestion: {file_path}. Skipping.")
+            return None
+        print(f"Starting ingestion for: {file_path} (Title: {document_title})")
+        content_hash = hash_file(file_path)
+        records = iter_document_chunks(file_path, document_title, content_type, chunker)
+    previous_hashes = manifest.get_chunk_hashes(file_path)
+    if previous_hashes is None:
+        previous_hashes = _stored_chunk_hashes(document_title)
+    entry = manifest.get_entry(file_path)
+    if entry and (entry.get("document_title"), entry.get("content_type"), entry.get("chunker")) != (document_title, content_type, chunker.signature):
+        # Chunk hashes only cover the text, so a new title, content type or chunker rewrites every chunk
+        force = True
+        if entry.get("content_type") != content_type and previous_hashes:
+            # The ids stay the same under a new content type: drop the old copies (with sharding, in the old shard) first
+            if not delete_chunks(list(previous_hashes), f"{document_title} (was {entry.get('content_type')})"):
+                raise RuntimeError(f"could not remove the {entry.get('content_type')} chunks before re-ingesting as {content_type}")
+            previous_hashes = {}
+
+    chunk_hashes: Dict[str, str] = {}
+    staged_ids = []
+    for record in records:
+        chunk_hashes[record["id"]] = record["metadata"]["chunk_hash"]
+        if force or previous_hashes.get(record["id"]) != record["metadata"]["chunk_hash"]:
+            staged_ids.append(record["id"])
+            writer.add(record)
+
+    orphan_ids = [chunk_id for chunk_id in previous_hashes if chunk_id not in chunk_hashes]
+    print(f"{document_title}: {len(chunk_hashes)} chunks, {len(staged_ids)} new/modified, {len(orphan_ids)} orphaned.")
+    return {
+        "file_path": file_path, "document_title": document_title, "content_type": content_type,
+        "chunker": chunker.signature, "content_hash": content_hash, "chunk_hashes": chunk_hashes,
+        "staged_ids": staged_ids, "orphan_ids": orphan_ids
+    }
+
+def finalize_document_ingestion(plan: Dict[str, Any], writer: ChunkBatchWriter, manifest: IngestManifest) -> bool:
+    """
+    Deletes the plan's orphaned ids and records the result in the manifest. Call after writer.drain().
+    Returns False if anything failed; the file is then left marked as changed so the next run retries it.
+    """
+    document_title = plan["document_title"]
+    failed_ids = {chunk_id for chunk_id in plan["staged_ids"] if chunk_id in writer.failed_ids}
+    success = not failed_ids
+
+    orphans_deleted = delete_chunks(plan["orphan_ids"], f"{document_title} (orphaned)")
+    success = success and orphans_deleted
+
+    # Chunks that failed to write are left out, so they count as new next time
+    chunk_hashes = {chunk_id: chunk_hash for chunk_id, chunk_hash in plan["chunk_hashes"].items() if chunk_id not in failed_ids}
+    if not orphans_deleted:
+        # Keep orphans in the manifest until their deletion succeeds
+        chunk_hashes.update({chunk_id: "" for chunk_id in plan["orphan_ids"]})
+    manifest.record_file(plan["file_path"], document_title, plan["content_type"], plan["chunker"],
+                         plan["content_hash"] if success else None, chunk_hashes)
+    return success
+
+def ingest_document(file_path: str, document_title: str, content_type: str, force: bool = False, chunker: Optional[Chunker] = None):
+    """
+    Ingests a document incrementally and in a streaming fashion: only new or modified chunks are
+    embedded and written, in batches of INGEST_BATCH_SIZE, as the file is read.
+    """
+    if not get_collection():
+        print("Error: ChromaDB collection not initialized. Skipping ingestion.")
+        return
+    manifest = load_ingest_manifest()
+    writer = ChunkBatchWriter()
+    try:
+        plan = stage_document_ingestion(file_path, document_title, content_type, manifest, writer, force=force, chunker=chunker)
+    except Exception as e:
+        # Already-flushed chunks are valid; nothing is deleted or recorded so the next run retries the file
+        print(f"Error ingesting {file_path}: {e}")
+        writer.close()
+        return
+    writer.close()
+    if plan is not None:
+        finalize_document_ingestion(plan, writer, manifest)
+    manifest.save()
+
+# --- Retrieval from ChromaDB ---
+RETRIEVAL_MODE = "hybrid" # hybrid, vector or lexical; ALETHEIA_RETRIEVAL_MODE overrides it
+RRF_K = 60 # Reciprocal rank fusion constant; higher flattens the advantage of top ranks
+HYBRID_CANDIDATE_FACTOR = 4 # Each retriever returns n_results * this candidates for fusion
+
+def _vector_search_batch(query_embeddings: List[List[float]], filters: Optional[Dict[str, Any]], n_results: int) -> List[List[Dict[str, Any]]]:
+    """
+    One collection.query for every embedding; the result lists are aligned with `query_embeddings`.
+    Filter conditions the metadata index resolves are passed to the query as candidate ids.
+    """
+    try:
+        candidate_ids, residual = _prefilter(filters)
+        if candidate_ids is not None and not candidate_ids:
+            return [[] for _ in query_embeddings]
+        collection = get_collection()
+        query_filter: Dict[str, Any] = {"where": filters}
+        if candidate_ids is not None and isinstance(collection, ShardedCollection):
+            # Each shard only takes its own ids; the content types still pick the shards
+            content_types = content_types_in_filter(filters)
+            query_filter = {"where": restrict_to_content_types(residual, content_types) if content_types else residual,
+                            "ids_by_content_type": get_metadata_index().content_types_of(candidate_ids)}
+        elif candidate_ids is not None:
+            query_filter = {"where": residual, "ids": candidate_ids}
+        with telemetry.span("vector_query", queries=len(query_embeddings)) as span:
+            results = collection.query(query_embeddings=query_embeddings, n_results=n_results, include=['metadatas', 'documents', 'distances'], **query_filter)
+            if results.get("partial"):
+                span.update(partial=True, failed_shards=len(results["failed_shards"]))
+                print(f"[corememory] Vector results are partial: shards {', '.join(results['failed_shards'])} could not be searched.")
     except Exception as e:
         print(f"Error querying ChromaDB: {e}")
+        return [[] for _ in query_embeddings]
+
+    batches = []
+    for q in range(len(query_embeddings)):
+        formatted_results = []
+        if results and results.get('ids') and len(results['ids']) > q and len(results['ids'][q]) > 0:
+            for i in range(len(results['ids'][q])):
+                distance = results['distances'][q][i] if results['distances'] and results['distances'][q] else None
+                formatted_results.append({
+                    "id": results['ids'][q][i],
+                    "text_chunk": results['documents'][q][i] if results['documents'] and results['documents'][q] else "N/A",
+                    "metadata": results['metadatas'][q][i] if results['metadatas'] and results['metadatas'][q] else {},
+                    "similarity_score": (1 - distance) if distance is not None else None
+                })
+        batches.append(formatted_results)
+    return batches
+
+def _vector_search(query_embedding: List[float], filters: Optional[Dict[str, Any]], n_results: int) -> List[Dict[str, Any]]:
+    return _vector_search_batch([query_embedding], filters, n_results)[0]
+
+def _lexical_search(query_text: str, filters: Optional[Dict[str, Any]], n_results: int) -> List[Dict[str, Any]]:
+    try:
+        candidate_ids, residual = _prefilter(filters)
+        with telemetry.span("lexical_query"):
+            hits = get_lexical_index().search(query_text, n_results, residual, set(candidate_ids)) if candidate_ids is not None else \
+                get_lexical_index().search(query_text, n_results, filters)
+            if not hits:
+                return []
+            stored = get_collection().get(ids=[chunk_id for chunk_id, _ in hits], include=['documents', 'metadatas'])
+    except Exception as e:
+        print(f"Error running lexical search: {e}")
         return []
+    by_id = {chunk_id: (document, metadata) for chunk_id, document, metadata in zip(stored['ids'], stored['documents'], stored['metadatas'])}
+    return [{
+        "id": chunk_id,
+        "text_chunk": by_id[chunk_id][0] or "N/A",
+        "metadata": by_id[chunk_id][1] or {},
+        "similarity_score": None,
+        "lexical_score": score
+    } for chunk_id, score in hits if chunk_id in by_id]
+
+def fuse_ranked_results(ranked_lists: List[List[Dict[str, Any]]], n_results: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merges ranked result lists by reciprocal rank fusion: each chunk scores sum(1 / (k + rank)) over the lists
+    it appears in. Scores from every list are kept on the merged result, plus its `fusion_score`.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for results in ranked_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = merged.setdefault(result["id"], dict(result, fusion_score=0.0))
+            entry.update({key: value for key, value in result.items() if value is not None})
+            entry["fusion_score"] += 1.0 / (k + rank)
+    return sorted(merged.values(), key=lambda entry: entry["fusion_score"], reverse=True)[:n_results]
+
+def restrict_to_content_types(filters: Optional[Dict[str, Any]], content_types: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Adds a content_type condition to a `where` filter (with sharding, only those shards are searched)."""
+    if not content_types:
+        return filters
+    condition = {"content_type": {"$in": list(content_types)}}
+    return {"$and": [filters, condition]} if filters else condition
+
+def retrieve_relevant_chunks(query_text: str, filters: Optional[Dict[str, Any]] = None, n_results: int = 5,
+                             use_cache: bool = True, mode: Optional[str] = None,
+                             content_types: Optional[List[str]] = None, use_reranker: bool = True) -> List[Dict[str, Any]]:
+    """
+    Finds the chunks most relevant to `query_text`. `mode` (default RETRIEVAL_MODE) is 'hybrid' (BM25 and
+    vector results fused by reciprocal rank), 'vector' or 'lexical'; hybrid falls back to lexical search
+    when no query embedding is available. `content_types` limits the search to those sources.
+    Repeated and near-duplicate questions are answered from the retrieval cache until the next write to the collection.
+    With a reranker configured (ALETHEIA_RERANKER), RERANK_CANDIDATES chunks are retrieved and reranked, and
+    up to n_results of them are kept, fewer when only a few stand out.
+    """
+    if not query_text or not get_collection(): return []
+    reranker = get_reranker() if use_reranker else None
+    if reranker is not None:
+        candidates = retrieve_relevant_chunks(query_text, filters, max(n_results, RERANK_CANDIDATES), use_cache, mode,
+                                              content_types, use_reranker=False)
+        return rerank(query_text, candidates, n_results, reranker)
+    mode = mode or get_setting("ALETHEIA_RETRIEVAL_MODE", RETRIEVAL_MODE)
+    filters = restrict_to_content_types(filters, content_types)
 
-    formatted_results = []
-    if results and results.get('ids') and results['ids'] and len(results['ids'][0]) > 0: 
-        for i in range(len(results['ids'][0])):
-            distance = results['distances'][0][i] if results['distances'] and results['distances'][0] else None
-            formatted_results.append({
-                "id": results['ids'][0][i],
-                "text_chunk": results['documents'][0][i] if results['documents'] and results['documents'][0] else "N/A",
-                "metadata": results['metadatas'][0][i] if results['metadatas'] and results['metadatas'][0] else {},
-                "similarity_score": (1 - distance) if distance is not None else None
-            })
-        # print(f"Retrieved {len(formatted_results)} relevant chunks.") # Less verbose for ingest_all
+    if use_cache:
+        cached = retrieval_cache.get_exact(query_text, filters, n_results, mode)
+        if cached is not None: return cached
+    generation = retrieval_cache.generation # Results are only cached if no write lands during the search
+
+    query_embedding = None
+    if mode != "lexical":
+        with telemetry.span("query_embedding"):
+            query_embedding = get_embedding(query_text)
+        space_error = "no query embedding" if query_embedding is None else check_embedding_space(len(query_embedding))
+        if space_error:
+            if mode == "vector":
+                print(f"Error: Cannot query ChromaDB: {space_error}")
+                if use_cache:
+                    retrieval_cache.record_miss()
+                return []
+            print(f"[corememory] Vector search unavailable ({space_error}). Using lexical search only.")
+            query_embedding = None
+        elif use_cache:
+            cached = retrieval_cache.get_similar(query_embedding, filters, n_results, mode)
+            if cached is not None: return cached
+    if use_cache:
+        retrieval_cache.record_miss() # Once per query, whichever lookups were tried
+
+    if query_embedding is None:
+        results = _lexical_search(query_text, filters, n_results)
+    elif mode == "vector":
+        results = _vector_search(query_embedding, filters, n_results)
     else:
-        # print("No relevant chunks found or results format unexpected.") # Less verbose for ingest_all
-        pass
-    return formatted_results
+        candidates = n_results * HYBRID_CANDIDATE_FACTOR
+        results = fuse_ranked_results([_vector_search(query_embedding, filters, candidates),
+                                       _lexical_search(query_text, filters, candidates)], n_results)
+    # A hybrid search that fell back to lexical is not cached, so it is retried once embeddings work again
+    if use_cache and (mode == "lexical" or query_embedding is not None):
+        retrieval_cache.put(query_text, query_embedding, filters, n_results, results, generation, mode)
+    return results
+
+def merge_query_results(result_sets: List[List[Dict[str, Any]]], n_results: Optional[int] = None, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Dedupes chunks across per-query result lists and ranks them by reciprocal rank fusion over the lists,
+    so chunks that several queries found come first. Each merged result gets `merged_score` and `queries`
+    (the indices of the queries that retrieved it); per-query scores are kept from its best-ranked occurrence.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for query_index, results in enumerate(result_sets):
+        for rank, result in enumerate(results, start=1):
+            entry = merged.get(result["id"])
+            if entry is None:
+                entry = merged[result["id"]] = dict(result, merged_score=0.0, queries=[], _best_rank=rank)
+            elif rank < entry["_best_rank"]:
+                entry.update(result, _best_rank=rank)
+            entry["merged_score"] += 1.0 / (k + rank)
+            if query_index not in entry["queries"]:
+                entry["queries"].append(query_index)
+    ranked = sorted(merged.values(), key=lambda entry: entry["merged_score"], reverse=True)
+    for entry in ranked:
+        entry.pop("_best_rank")
+    return ranked[:n_results] if n_results is not None else ranked
+
+def retrieve_relevant_chunks_batch(queries: List[str], filters: Optional[Dict[str, Any]] = None, n_results: int = 5,
+                                   use_cache: bool = True, mode: Optional[str] = None,
+                                   content_types: Optional[List[str]] = None,
+                                   merged_results: Optional[int] = None, use_reranker: bool = True) -> Dict[str, Any]:
+    """
+    retrieve_relevant_chunks for several queries at once (e.g. the sub-questions of one lens, or every turn of
+    a conversation). Queries missing from the retrieval cache are embedded in one request and searched with one
+    multi-embedding vector query; lexical search runs locally per query.
+
+    Returns {"results": [...]} with one result list per query, aligned with `queries`, and {"merged": [...]},
+    the chunks of all result sets deduplicated and ranked by merge_query_results (at most merged_results).
+    With a reranker configured, each query's results are reranked as in retrieve_relevant_chunks.
+    """
+    batch: Dict[str, Any] = {"results": [[] for _ in queries], "merged": []}
+    if not queries or not get_collection(): return batch
+    reranker = get_reranker() if use_reranker else None
+    if reranker is not None:
+        candidates = retrieve_relevant_chunks_batch(queries, filters, max(n_results, RERANK_CANDIDATES), use_cache, mode,
+                                                    content_types, use_reranker=False)["results"]
+        batch["results"] = [rerank(query, results, n_results, reranker) for query, results in zip(queries, candidates)]
+        batch["merged"] = merge_query_results(batch["results"], merged_results)
+        return batch
+    mode = mode or get_setting("ALETHEIA_RETRIEVAL_MODE", RETRIEVAL_MODE)
+    filters = restrict_to_content_types(filters, content_types)
+    generation = retrieval_cache.generation
+
+    # Repeated queries are searched once
+    found: Dict[str, List[Dict[str, Any]]] = {}
+    pending = [query for query in dict.fromkeys(queries) if query]
+    if use_cache:
+        for query in list(pending):
+            cached = retrieval_cache.get_exact(query, filters, n_results, mode)
+            if cached is not None:
+                found[query] = cached
+                pending.remove(query)
+
+    embeddings: Dict[str, List[float]] = {}
+    if mode != "lexical" and pending:
+        with telemetry.span("query_embedding", queries=len(pending)):
+            vectors = get_embeddings(pending)
+        dimension = next((len(vector) for vector in vectors if vector is not None), None)
+        space_error = "no query embedding" if dimension is None else check_embedding_space(dimension)
+        if space_error:
+            if mode == "vector":
+                print(f"Error: Cannot query ChromaDB: {space_error}")
+                if use_cache:
+                    retrieval_cache.record_miss(len(pending))
+                return batch
+            print(f"[corememory] Vector search unavailable ({space_error}). Using lexical search only.")
+        else:
+            embeddings = {query: vector for query, vector in zip(pending, vectors) if vector is not None}
+        if use_cache:
+            for query, vector in embeddings.items():
+                cached = retrieval_cache.get_similar(vector, filters, n_results, mode)
+                if cached is not None:
+                    found[query] = cached
+            pending = [query for query in pending if query not in found]
+    if use_cache and pending:
+        retrieval_cache.record_miss(len(pending)) # Once per query, whichever lookups were tried
+
+    searched: Dict[str, List[Dict[str, Any]]] = {}
+    embedded = [query for query in pending if query in embeddings]
+    if mode != "lexical" and embedded:
+        candidates = n_results if mode == "vector" else n_results * HYBRID_CANDIDATE_FACTOR
+        vector_results = dict(zip(embedded, _vector_search_batch([embeddings[query] for query in embedded], filters, candidates)))
+    for query in pending:
+        if query not in embeddings:
+            # Lexical mode, or a query whose embedding failed (vector mode has nothing to fall back on)
+            searched[query] = [] if mode == "vector" else _lexical_search(query, filters, n_results)
+        elif mode == "vector":
+            searched[query] = vector_results[query]
+        else:
+            candidates = n_results * HYBRID_CANDIDATE_FACTOR
+            searched[query] = fuse_ranked_results([vector_results[query], _lexical_search(query, filters, candidates)], n_results)
+        if use_cache and (mode == "lexical" or query in embeddings):
+            retrieval_cache.put(query, embeddings.get(query), filters, n_results, searched[query], generation, mode)
+    found.update(searched)
+
+    batch["results"] = [[dict(result) for result in found.get(query, [])] for query in queries]
+    batch["merged"] = merge_query_results(batch["results"], merged_results)
+    return batch
 # --- Function to Ingest Raw Interaction Text ---
-def ingest_interaction_text(user_input: str, ai_response: str):
+def _write_interaction_batch(records: List[Dict[str, Any]]) -> Optional[List[str]]:
     """
-    Formats a user/AI interaction, gets its embedding, and stores it.
+    Embeds a batch of interaction records in one request and upserts them. Used by the write-behind worker.
+    Returns the ids written, or None if the store is unavailable (which does not count against the records).
     """
-    if not collection:
-        print("[corememory] Error: ChromaDB collection not initialized. Skipping interaction ingestion.")
-        return
+    if not get_collection():
+        print("[corememory] Error: ChromaDB collection not initialized. Interactions stay journaled.")
+        return None
+    embeddings = get_embeddings([record["document"] for record in records])
+    written_ids = add_document_chunks(f"{len(records)} interactions", records, embeddings)
+    telemetry.increment("interactions_written_total", len(written_ids))
+    if len(written_ids) != len(records):
+        telemetry.increment("errors_total", stage="interaction_write", error="IncompleteBatch")
+    return written_ids
 
-    # 1. Format the interaction text
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    interaction_text = f"Interaction at {timestamp}:\nUser: {user_input}\nAletheia: {ai_response}"
+INTERACTION_WAIT_SECONDS = 30.0 # Longest ingest_interaction_text(wait=True) blocks for the write
+_interaction_writer: Optional[InteractionWriteBehind] = None
 
-    # 2. Define Title and Content Type
-    doc_title = f"Interaction_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    content_type = "LiveInteraction"
+def get_interaction_writer() -> InteractionWriteBehind:
+    """Returns the process-wide write-behind queue for interactions, starting it on first use."""
+    global _interaction_writer
+    if _interaction_writer is None:
+        _interaction_writer = InteractionWriteBehind(_write_interaction_batch, os.path.join(get_memory_store().path, JOURNAL_FILE_NAME))
+        _interaction_writer.start()
+        atexit.register(_interaction_writer.close)
+    return _interaction_writer
+
+def flush_interactions(timeout: Optional[float] = None) -> bool:
+    """Waits until every queued interaction has been written to ChromaDB."""
+    return _interaction_writer.flush(timeout) if _interaction_writer else True
+
+# --- Store Lifecycle ---
+def warm_up_memory(background: bool = True) -> Optional[threading.Thread]:
+    """
+    Opens the store, the lexical and metadata indexes, the embedding provider (its model or API client) and
+    the reranker, if any, ahead of the first query, on a daemon thread unless `background` is False, so
+    startup does not wait for them.
+    Returns the thread, if any.
+    """
+    def warm_up():
+        try:
+            get_embedding_provider().warm_up()
+            reranker = get_reranker()
+            if reranker is not None:
+                reranker.warm_up()
+            if get_collection() is not None:
+                get_lexical_index()
+                get_metadata_index()
+        except Exception as e:
+            print(f"[corememory] Error warming up memory: {e}")
 
-    print(f"[corememory] Ingesting: {doc_title}...")
+    if not background:
+        warm_up()
+        return None
+    thread = threading.Thread(target=warm_up, name="memory-warm-up", daemon=True)
+    thread.start()
+    return thread
 
-    # 3. Get Embedding (We embed the whole small interaction as one chunk)
-    embedding_vector = get_openai_embedding(interaction_text)
+def close_memory_store():
+    """Writes queued interactions, then closes the lexical and metadata indexes and the ChromaDB client. Safe to call more than once."""
+    global _lexical_index, _metadata_index, _verified_embedding_space
+    if _interaction_writer is not None:
+        _interaction_writer.close()
+    with _lexical_index_lock:
+        if _lexical_index is not None:
+            _lexical_index.close()
+            _lexical_index = None
+    with _metadata_index_lock:
+        _metadata_index = None
+    _verified_embedding_space = None # Re-checked against the collection when it is opened again
+    if _store is not None:
+        _store.close()
 
-    if embedding_vector is None:
-        print(f"[corememory] Warning: Could not generate embedding for {doc_title}. Skipping.")
-        return
+atexit.register(close_memory_store)
 
-    # 4. Prepare Metadata and ID
+def ingest_interaction_text(user_input: str, ai_response: str, wait: bool = False) -> bool:
+    """
+    Formats a user/AI interaction and queues it for embedding and storage.
+    The write happens in the background (batched with other turns) unless `wait` is True, in which case
+    this waits up to INTERACTION_WAIT_SECONDS and returns whether the write finished.
+    The turn is journaled first, so it is kept (and written later) even while ChromaDB is unavailable.
+    """
+    # 1. Format the interaction text
+    now = datetime.datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    interaction_text = f"Interaction at {timestamp}:\nUser: {user_input}\nAletheia: {ai_response}"
+
+    # 2. Define Title and Content Type (microseconds keep turns within the same second distinct)
+    doc_title = f"Interaction_{now.strftime('%Y%m%d_%H%M%S_%f')}"
+    content_type = "LiveInteraction"
+
+    # 3. Prepare Metadata and ID (We embed the whole small interaction as one chunk)
     metadata = {
         "source_file_name": "LiveSession",
         "document_title": doc_title,
         "content_type": content_type,
         "chunk_sequence_id": 1, # Only one chunk per interaction
-        "timestamp": timestamp
+        "timestamp": timestamp,
+        "memory_tier": "hot" # Until compaction folds it into a session summary (core/memory_tiers.py)
     }
     unique_id = f"{doc_title}_chunk_1"
 
-    # 5. Add to ChromaDB
-    try:
-        collection.add(
-            embeddings=[embedding_vector],
-            documents=[interaction_text],
-            metadatas=[metadata],
-            ids=[unique_id]
-        )
-        print(f"[corememory] Successfully added {doc_title} to ChromaDB.")
-    except Exception as e:
-        print(f"[corememory] Error adding interaction {doc_title} to ChromaDB: {e}")
+    # 4. Hand off to the write-behind queue (journaled first, so nothing is lost on a crash)
+    print(f"[corememory] Queuing: {doc_title}...")
+    get_interaction_writer().submit({"id": unique_id, "document": interaction_text, "metadata": metadata})
+    if not wait:
+        return True
+    written = flush_interactions(timeout=INTERACTION_WAIT_SECONDS)
+    if not written:
+        print(f"[corememory] {doc_title} not written within {INTERACTION_WAIT_SECONDS:g}s; it stays journaled.")
+    return written
+
 # --- Main execution / Example Usage (for testing this file directly) ---
 if __name__ == "__main__":
     print("Memory System Direct Test (corememory_system.py)")
@@ -236,7 +972,7 @@ if __name__ == "__main__":
         test_file_path = os.path.join(DATA_DIR_FOR_TEST, "Aletheiapersonalnotes.txt") 
         
         if os.path.exists(test_file_path):
-            if collection:
+            if get_collection():
                 print(f"\n--- Test Ingestion from corememory_system.py: {test_file_path} ---")
                 ingest_document(
                     file_path=test_file_path,
@@ -0,0 +1,121 @@
+# core/documents.py
+# Document loading and chunk-record building. Nothing here touches ChromaDB or the OpenAI API,
+# so these functions are safe to run in worker processes during parallel ingestion.
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from docx import Document # pip install python-docx
+
+from core.chunking import Chunker, get_chunker, iter_chunk_text, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+from core.ingest_manifest import hash_chunk, hash_file
+from core.tokens import count_tokens
+
+# --- Document Loaders ---
+def load_text_file(file_path: str) -> Optional[str]:
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+        return None
+    except Exception as e:
+        print(f"Error loading text file {file_path}: {e}")
+        return None
+
+def load_docx_file(file_path: str) -> Optional[str]:
+    try:
+        doc = Document(file_path)
+        return "\n".join([para.text for para in doc.paragraphs])
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+        return None
+    except Exception as e:
+        print(f"Error loading DOCX file {file_path}: {e}")
+        return None
+
+# --- Streaming Document Loaders ---
+READ_BUFFER_SIZE = 1024 * 1024 # Characters read per buffer when streaming text files
+
+def iter_text_file(file_path: str, buffer_size: int = READ_BUFFER_SIZE) -> Iterator[str]:
+    """Yields a text file in fixed-size buffers so it never has to fit in memory at once."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for buffer in iter(lambda: f.read(buffer_size), ""):
+            yield buffer
+
+def iter_docx_file(file_path: str) -> Iterator[str]:
+    """Yields a DOCX file paragraph by paragraph, joined the same way as load_docx_file."""
+    # python-docx parses the whole package up front; streaming here keeps the joined text out of memory
+    doc = Document(file_path)
+    for i, para in enumerate(doc.paragraphs):
+        yield para.text if i == 0 else "\n" + para.text
+
+def iter_document_text(file_path: str) -> Iterator[str]:
+    """Streams a supported document (.txt, .yaml, .docx) as text segments. Read errors are raised to the caller."""
+    _, file_extension = os.path.splitext(file_path)
+    if file_extension.lower() == '.txt' or file_extension.lower() == '.yaml': 
+        return iter_text_file(file_path)
+    elif file_extension.lower() == '.docx':
+        return iter_docx_file(file_path)
+    print(f"Warning: Unsupported file type '{file_extension}' for {file_path}. Skipping.")
+    return iter(())
+
+# --- Text Chunking Strategy ---
+DEFAULT_CHUNKER = "tokens"
+# Sources made of speaker turns are chunked turn by turn (see core/chunking.py); UserAnalysis files are
+# prose without speaker lines, so they keep sentence packing and its overlap
+CHUNKER_BY_CONTENT_TYPE = {
+    "AletheiaDialogue_Primary": "dialogue",
+    "IRER_PhysicsNote": "dialogue",
+}
+
+def get_chunker_for_content_type(content_type: str) -> Chunker:
+    return get_chunker(CHUNKER_BY_CONTENT_TYPE.get(content_type, DEFAULT_CHUNKER))
+
+def chunk_text(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[str]:
+    if not text: return []
+    return list(iter_chunk_text([text], chunk_size, chunk_overlap))
+
+# --- Chunk Records ---
+def iter_document_chunks(file_path: str, document_title: str, content_type: str, chunker: Optional[Chunker] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streams a document's chunks as records (id, document, metadata), one per chunk.
+    Embeddings are not computed here so callers can batch them, across documents if they like.
+    """
+    chunker = chunker or get_chunker_for_content_type(content_type)
+    file_name = os.path.basename(file_path)
+    sane_title = "".join(c if c.isalnum() else "_" for c in document_title)
+    for i, chunk in enumerate(chunker.iter_chunks(iter_document_text(file_path))):
+        chunk_sequence_id = i + 1
+        yield {
+            "id": f"{sane_title}_chunk_{chunk_sequence_id}",
+            "document": chunk,
+            "metadata": {
+                "source_file_name": file_name, "document_title": document_title,
+                "content_type": content_type, "chunk_sequence_id": chunk_sequence_id,
+                "original_text_preview": chunk[:200] + "...",
+                "chunk_hash": hash_chunk(chunk),
+                "chunker": chunker.name,
+                "token_count": count_tokens(chunk)
+            }
+        }
+
+# --- Chunk Spooling (for parallel ingestion) ---
+def spool_document_chunks(file_path: str, document_title: str, content_type: str, chunker: Chunker, spool_path: str) -> Dict[str, Any]:
+    """
+    Parses and chunks a document into a JSON-lines spool file. Runs in a worker process, so the
+    CPU-heavy parsing happens in parallel while the spool keeps memory bounded on both sides.
+    """
+    content_hash = hash_file(file_path)
+    chunk_count = 0
+    with open(spool_path, 'w', encoding='utf-8') as spool:
+        for record in iter_document_chunks(file_path, document_title, content_type, chunker):
+            spool.write(json.dumps(record) + "\n")
+            chunk_count += 1
+    return {"spool_path": spool_path, "content_hash": content_hash, "chunk_count": chunk_count}
+
+def iter_spooled_chunks(spool_path: str) -> Iterator[Dict[str, Any]]:
+    """Reads chunk records back from a spool file written by spool_document_chunks."""
+    with open(spool_path, 'r', encoding='utf-8') as spool:
+        for line in spool:
+            yield json.loads(line)
@@ -0,0 +1,148 @@
+# core/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from core.telemetry import telemetry
+
+# --- Cache Setup ---
+EMBEDDING_CACHE_PATH = "cache/embedding_cache.sqlite3" # Relative to the project root, like CHROMA_DATA_PATH
+EMBEDDING_CACHE_MEMORY_ITEMS = 4096 # Size of the in-process LRU layer
+
+def normalize_text(text: str) -> str:
+    """Normalizes text so trivially different copies (unicode form, surrounding/runs of whitespace) share a key."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def make_cache_key(model: str, text: str) -> str:
+    """Builds the content-addressed key for an embedding: model name plus a hash of the normalized text."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache: an in-process LRU in front of a SQLite table on disk.
+    Vectors are stored as packed float32 so the file stays compact.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        self.path = path
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._connection is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+                )
+                self._connection.commit()
+            except Exception as e:
+                print(f"[embedding_cache] Error opening embedding cache at '{self.path}': {e}. Using memory only.")
+                self._connection = None
+        return self._connection
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Looks up embeddings for `texts`; the result is aligned with the input and None marks a miss."""
+        keys = [make_cache_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            disk_lookups: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[i] = self._memory[key]
+                    self.stats["memory_hits"] += 1
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+
+            connection = self._connect() if disk_lookups else None
+            if connection is not None:
+                pending = list(disk_lookups)
+                for start in range(0, len(pending), 500): # Stay under SQLite's bound-parameter limit
+                    batch = pending[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    try:
+                        rows = connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                    except Exception as e:
+                        print(f"[embedding_cache] Error reading embedding cache: {e}")
+                        rows = []
+                    for key, blob in rows:
+                        vector = array("f")
+                        vector.frombytes(blob)
+                        vector_list = vector.tolist()
+                        self._remember(key, vector_list)
+                        for i in disk_lookups.pop(key):
+                            results[i] = vector_list
+                            self.stats["disk_hits"] += 1
+
+            self.stats["misses"] += sum(len(positions) for positions in disk_lookups.values())
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[Optional[List[float]]]):
+        """Stores embeddings for `texts`; None entries are ignored."""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                if vector is None:
+                    continue
+                key = make_cache_key(model, text)
+                self._remember(key, list(vector))
+                rows.append((key, len(vector), array("f", vector).tobytes()))
+            if not rows:
+                return
+            connection = self._connect()
+            if connection is None:
+                return
+            try:
+                connection.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)", rows)
+                connection.commit()
+                self.stats["writes"] += len(rows)
+            except Exception as e:
+                print(f"[embedding_cache] Error writing embedding cache: {e}")
+
+    def get_stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters plus the overall hit rate."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        """Drops the in-process layer; the on-disk cache is kept."""
+        with self._lock:
+            self._memory.clear()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+# --- Shared Cache Instance ---
+embedding_cache = EmbeddingCache()
+telemetry.register_collector("embedding_cache", embedding_cache.get_stats)
+
+def get_embedding_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters for the shared embedding cache."""
+    return embedding_cache.get_stats()
@@ -0,0 +1,192 @@
+# core/embedding_providers.py
+import hashlib
+import math
+import re
+import threading
+from typing import Dict, List, Optional
+
+from core.config import get_setting
+from core.embedding_cache import embedding_cache
+from core.telemetry import telemetry
+from core.llm_interface import get_openai_embeddings
+from core.openai_client import warm_up_client
+
+# --- Provider Selection ---
+# Chosen via environment variables (or .env), read when the provider is first needed:
+#   ALETHEIA_EMBEDDING_PROVIDER   openai (default), local, or hashing
+#   ALETHEIA_EMBEDDING_MODEL      unset means the provider's default model
+#   ALETHEIA_EMBEDDING_DIMENSION  only used by the hashing provider
+DEFAULT_EMBEDDING_PROVIDER = "openai"
+
+class EmbeddingProvider:
+    """
+    Base class for embedding backends. embed() returns one vector per text (None where embedding failed)
+    and goes through the shared embedding cache unless the provider is cheaper than a cache lookup.
+    """
+    name = "base"
+    cacheable = True
+
+    def __init__(self, model: str, dimension: Optional[int]):
+        self.model = model
+        self.dimension = dimension
+
+    @property
+    def signature(self) -> Dict[str, object]:
+        """Identifies the vector space; stored in collection metadata to keep incompatible vectors apart."""
+        return {"embedding_provider": self.name, "embedding_model": self.model, "embedding_dimension": self.dimension}
+
+    def warm_up(self):
+        """Loads whatever the provider needs before its first embed() call, so that call is not slowed down."""
+
+    def _embed_uncached(self, texts: List[str]) -> List[Optional[List[float]]]:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        if not texts:
+            return []
+        if not self.cacheable:
+            return self._embed_uncached(texts)
+        cache_model = f"{self.name}/{self.model}"
+        results = embedding_cache.get_many(cache_model, texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            vectors = self._embed_uncached([texts[i] for i in missing])
+            embedding_cache.put_many(cache_model, [texts[i] for i in missing], vectors)
+            for i, vector in zip(missing, vectors):
+                results[i] = vector
+        return results
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embeddings via the batched, cached path in core/llm_interface.py."""
+    name = "openai"
+    DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+    def __init__(self, model: str = "text-embedding-3-small"):
+        super().__init__(model, self.DIMENSIONS.get(model))
+
+    def warm_up(self):
+        warm_up_client()
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        # get_openai_embeddings keeps its own cache keys (the bare model name), shared with direct callers
+        return get_openai_embeddings(texts, model=self.model)
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Local CPU embeddings. The default model is the all-MiniLM-L6-v2 ONNX export that ships with ChromaDB
+    (onnxruntime + NumPy, no network after the first model download); any other model name is loaded
+    with sentence-transformers if it is installed.
+    """
+    name = "local"
+    DEFAULT_MODEL = "all-MiniLM-L6-v2"
+    BATCH_SIZE = 64
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        super().__init__(model, 384 if model == self.DEFAULT_MODEL else None)
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._encoder is None:
+                if self.model == self.DEFAULT_MODEL:
+                    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+                    onnx_model = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+                    self._encoder = lambda batch: [list(map(float, vector)) for vector in onnx_model(batch)]
+                else:
+                    from sentence_transformers import SentenceTransformer # pip install sentence-transformers
+                    st_model = SentenceTransformer(self.model, device="cpu")
+                    self.dimension = st_model.get_sentence_embedding_dimension()
+                    self._encoder = lambda batch: st_model.encode(batch, normalize_embeddings=True).tolist()
+        return self._encoder
+
+    def warm_up(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"[embedding_providers] Error loading local embedding model '{self.model}': {e}")
+
+    def _embed_uncached(self, texts: List[str]) -> List[Optional[List[float]]]:
+        try:
+            encoder = self._load()
+        except Exception as e:
+            print(f"[embedding_providers] Error loading local embedding model '{self.model}': {e}")
+            return [None] * len(texts)
+        results: List[Optional[List[float]]] = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            batch = texts[start:start + self.BATCH_SIZE]
+            try:
+                results.extend(encoder(batch))
+            except Exception as e:
+                print(f"[embedding_providers] Error embedding batch of {len(batch)} locally: {e}")
+                results.extend([None] * len(batch))
+        return results
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic, offline stand-in for tests and benchmarks: signed feature hashing of word unigrams
+    and bigrams into a fixed number of dimensions, L2-normalized. Texts sharing words land close together,
+    so retrieval behaves sensibly without a model or network access.
+    """
+    name = "hashing"
+    cacheable = False # Hashing is cheaper than a cache lookup
+    WORD_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, dimension: int = 256):
+        super().__init__(f"feature-hash-{dimension}", dimension)
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        words = self.WORD_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+    def _embed_uncached(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return [self._embed_one(text) for text in texts]
+
+# --- Provider Registry ---
+PROVIDERS = {
+    OpenAIEmbeddingProvider.name: OpenAIEmbeddingProvider,
+    LocalEmbeddingProvider.name: LocalEmbeddingProvider,
+    HashingEmbeddingProvider.name: HashingEmbeddingProvider,
+}
+
+def create_embedding_provider(name: str, model: Optional[str] = None, dimension: Optional[int] = None) -> EmbeddingProvider:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{name}'. Available: {', '.join(PROVIDERS)}")
+    if name == HashingEmbeddingProvider.name:
+        return HashingEmbeddingProvider(dimension or 256)
+    return PROVIDERS[name](model) if model else PROVIDERS[name]()
+
+_provider: Optional[EmbeddingProvider] = None
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Returns the configured process-wide embedding provider."""
+    global _provider
+    if _provider is None:
+        dimension = get_setting("ALETHEIA_EMBEDDING_DIMENSION")
+        _provider = create_embedding_provider(get_setting("ALETHEIA_EMBEDDING_PROVIDER", DEFAULT_EMBEDDING_PROVIDER),
+                                              get_setting("ALETHEIA_EMBEDDING_MODEL"), int(dimension) if dimension else None)
+        print(f"[embedding_providers] Using '{_provider.name}' embeddings ({_provider.model}).")
+    return _provider
+
+def set_embedding_provider(provider: EmbeddingProvider):
+    """Overrides the configured provider, e.g. with the hashing stand-in for tests and benchmarks."""
+    global _provider
+    _provider = provider
+
+# --- Provider-Agnostic Embedding Functions ---
+def get_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    """Embeds many texts with the configured provider; the result is aligned with `texts`."""
+    provider = get_embedding_provider()
+    telemetry.increment("embedding_calls_total", provider=provider.name)
+    telemetry.increment("embedded_texts_total", len(texts), provider=provider.name)
+    return provider.embed(texts)
+
+def get_embedding(text: str) -> Optional[List[float]]:
+    return get_embeddings([text])[0]
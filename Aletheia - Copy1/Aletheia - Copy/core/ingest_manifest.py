@@ -0,0 +1,99 @@
+# core/ingest_manifest.py
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = "ingest_manifest.json" # Stored next to the ChromaDB data it describes
+
+def hash_file(file_path: str, buffer_size: int = 1024 * 1024) -> str:
+    """Streams a file through sha256 without loading it all into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(buffer_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_chunk(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+class IngestManifest:
+    """
+    Records what has been ingested for each source file: its mtime, size and content hash,
+    the title/content type/chunker it was ingested with, and the hash of every chunk id written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "IngestManifest":
+        manifest = cls(path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    manifest.files = data.get("files", {})
+                else:
+                    print(f"[ingest_manifest] Manifest version mismatch at {path}. Starting a fresh manifest.")
+            except Exception as e:
+                print(f"[ingest_manifest] Error reading manifest {path}: {e}. Starting a fresh manifest.")
+        return manifest
+
+    def save(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path) # Atomic, so a crash never leaves a half-written manifest
+        except Exception as e:
+            print(f"[ingest_manifest] Error saving manifest {self.path}: {e}")
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.normpath(file_path)
+
+    def get_entry(self, file_path: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(self._key(file_path))
+
+    def is_unchanged(self, file_path: str, document_title: str, content_type: str, chunker: str) -> bool:
+        """
+        True when the file was fully ingested before with the same settings and its content is unchanged.
+        A matching mtime and size is trusted without re-hashing; otherwise the content hash decides.
+        """
+        entry = self.get_entry(file_path)
+        if not entry or not entry.get("content_hash"):
+            return False
+        if (entry.get("document_title"), entry.get("content_type"), entry.get("chunker")) != (document_title, content_type, chunker):
+            return False
+        stat = os.stat(file_path)
+        if entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+            return True
+        if hash_file(file_path) == entry["content_hash"]:
+            # Touched but not modified: refresh the cheap check for next time
+            entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            return True
+        return False
+
+    def get_chunk_hashes(self, file_path: str) -> Optional[Dict[str, str]]:
+        entry = self.get_entry(file_path)
+        return dict(entry["chunks"]) if entry and "chunks" in entry else None
+
+    def record_file(self, file_path: str, document_title: str, content_type: str, chunker: str,
+                    content_hash: Optional[str], chunk_hashes: Dict[str, str]):
+        """
+        Stores the ingested state of a file. Pass content_hash=None when some chunks failed,
+        so the file is not skipped on the next run.
+        """
+        stat = os.stat(file_path)
+        self.files[self._key(file_path)] = {
+            "mtime": stat.st_mtime, "size": stat.st_size, "content_hash": content_hash,
+            "document_title": document_title, "content_type": content_type, "chunker": chunker,
+            "chunks": chunk_hashes
+        }
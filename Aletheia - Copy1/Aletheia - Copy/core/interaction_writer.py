@@ -0,0 +1,236 @@
+# core/interaction_writer.py
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# --- Write-Behind Defaults ---
+FLUSH_BATCH_SIZE = 16 # Interactions written per batch at most
+FLUSH_INTERVAL_SECONDS = 2.0 # Longest an interaction waits in the queue before a flush
+RETRY_BACKOFF_SECONDS = 5.0 # Wait after a failed batch before trying again
+MAX_WRITE_ATTEMPTS = 3 # Writes a record may fail before it is moved to the dead-letter file
+JOURNAL_FILE_NAME = "interaction_journal.jsonl"
+DEAD_LETTER_FILE_NAME = "interaction_dead_letter.jsonl"
+
+_STOP = object()
+
+class InteractionWriteBehind:
+    """
+    Background write-behind queue for interaction records.
+
+    `submit` journals the record to disk and returns immediately; a worker thread batches records
+    and hands them to `write_batch` (which embeds and stores them) when the batch is full or the
+    flush interval passes. `write_batch` returns the ids it wrote, or None if it could not write at all
+    (e.g. the store is unavailable). Records stay in the journal until they are written, so a crash or an
+    outage loses nothing: the journal is replayed the next time the writer starts. A record that is left
+    out of MAX_WRITE_ATTEMPTS otherwise successful writes is moved to the dead-letter file instead.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], Optional[List[str]]], journal_path: str,
+                 batch_size: int = FLUSH_BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 max_attempts: int = MAX_WRITE_ATTEMPTS):
+        self.write_batch = write_batch
+        self.journal_path = journal_path
+        self.dead_letter_path = os.path.join(os.path.dirname(journal_path), DEAD_LETTER_FILE_NAME)
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._unflushed: Dict[str, Dict[str, Any]] = {} # Journaled but not yet written, by id
+        self._attempts: Dict[str, int] = {} # Failed writes per unflushed record, this run
+        self._journal_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"submitted": 0, "written": 0, "failed_batches": 0, "replayed": 0, "dead_lettered": 0}
+
+    # --- Lifecycle ---
+    def start(self):
+        """
+        Starts the worker thread and re-queues anything left in the journal by a previous run (or by a
+        worker that close() stopped before it had written everything).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        for record in self._read_journal():
+            self._unflushed[record["id"]] = record
+            self._queue.put(record)
+            self.stats["replayed"] += 1
+        if self.stats["replayed"]:
+            print(f"[interaction_writer] Replaying {self.stats['replayed']} unflushed interactions from the journal.")
+        self._thread = threading.Thread(target=self._run, name="interaction-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: Dict[str, Any]):
+        """Journals a record durably and queues it for writing. Does not wait for the write."""
+        self.start()
+        with self._journal_lock:
+            self._unflushed[record["id"]] = record
+            self._append_journal(record)
+        self.stats["submitted"] += 1
+        self._queue.put(record)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until everything submitted so far has been written (or the timeout passes).
+        Returns False if that did not happen, including when a record was moved to the dead-letter file meanwhile.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        dead_lettered = self.stats["dead_lettered"]
+        while self.pending_count():
+            if self._thread is None or not self._thread.is_alive():
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return self.stats["dead_lettered"] == dead_lettered
+
+    def close(self, timeout: float = 30.0):
+        """Writes what it can within `timeout`, then stops the worker. Anything unwritten stays journaled."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._thread = None
+        else:
+            print(f"[interaction_writer] Worker still writing after {timeout:g}s; {self.pending_count()} interactions stay journaled.")
+
+    def pending_count(self) -> int:
+        with self._journal_lock:
+            return len(self._unflushed)
+
+    # --- Worker ---
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Dict[str, Any]] = []
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                stopping = True
+            else:
+                batch.append(first)
+            # Collect more until the batch is full or the first record has waited a full interval
+            deadline = time.monotonic() + self.flush_interval
+            while not stopping and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(0.0, remaining)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+            if stopping:
+                # Shutting down: drain whatever is still queued into this final flush
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+            if batch:
+                self._write(batch, retry=not stopping)
+
+    def _write(self, batch: List[Dict[str, Any]], retry: bool):
+        for start in range(0, len(batch), self.batch_size):
+            part = batch[start:start + self.batch_size]
+            try:
+                written_ids = self.write_batch(part)
+            except Exception as e:
+                print(f"[interaction_writer] Error writing batch of {len(part)} interactions: {e}")
+                written_ids = None
+            written = set(written_ids or [])
+            failed = [record for record in part if record["id"] not in written]
+            dead: List[Dict[str, Any]] = []
+            if written_ids is not None:
+                # write_batch ran but left these out (no embedding, a rejected embedding space, ...): count it against them
+                for record in failed:
+                    self._attempts[record["id"]] = self._attempts.get(record["id"], 0) + 1
+                dead = [record for record in failed if self._attempts[record["id"]] >= self.max_attempts]
+                failed = [record for record in failed if self._attempts[record["id"]] < self.max_attempts]
+            if written or dead:
+                self.stats["written"] += len(written)
+                with self._journal_lock:
+                    if dead and not self._append_dead_letter(dead):
+                        dead = [] # Left in the journal, to be tried again on the next start
+                    for record_id in written | {record["id"] for record in dead}:
+                        self._unflushed.pop(record_id, None)
+                        self._attempts.pop(record_id, None)
+                    self._rewrite_journal()
+            if failed:
+                self.stats["failed_batches"] += 1
+                if retry:
+                    # Keep the failed records queued and journaled; try again after a pause
+                    time.sleep(RETRY_BACKOFF_SECONDS)
+                    for record in failed:
+                        self._queue.put(record)
+
+    # --- Journal ---
+    def _append_journal(self, record: Dict[str, Any]):
+        try:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            print(f"[interaction_writer] Error journaling interaction {record.get('id')}: {e}")
+
+    def _append_dead_letter(self, records: List[Dict[str, Any]]) -> bool:
+        """Sets aside records that failed max_attempts writes, so they are neither retried nor lost. Caller holds the lock."""
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(dict(record, attempts=self._attempts.get(record["id"], 0))) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.stats["dead_lettered"] += len(records)
+            print(f"[interaction_writer] Moved {len(records)} interactions that failed {self.max_attempts} writes to {self.dead_letter_path}.")
+            return True
+        except Exception as e:
+            print(f"[interaction_writer] Error writing dead-letter file {self.dead_letter_path}: {e}")
+            return False
+
+    def _rewrite_journal(self):
+        """Rewrites the journal with only the records that are still unflushed. Caller holds the lock."""
+        try:
+            if not self._unflushed:
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                return
+            temp_path = self.journal_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for record in self._unflushed.values():
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.journal_path)
+        except Exception as e:
+            print(f"[interaction_writer] Error rewriting journal {self.journal_path}: {e}")
+
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.journal_path):
+            return []
+        records = {}
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # A torn final line from a crash mid-append
+                    records[record["id"]] = record
+        except Exception as e:
+            print(f"[interaction_writer] Error reading journal {self.journal_path}: {e}")
+        return list(records.values())
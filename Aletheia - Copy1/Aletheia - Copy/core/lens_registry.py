@@ -0,0 +1,242 @@
+# core/lens_registry.py
+# Reasoning lenses from configs/reasoning_lenses_v0_1.yaml, loaded once per process. Lens names, aliases
+# and acronyms are indexed in a prefix trie, so a "lens:" command resolves in one walk over its text, with
+# unique prefixes and small typos accepted. Each prompt_archetype is compiled once into a template whose
+# placeholders are checked when the file is loaded rather than on every turn.
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+# --- Lens Settings ---
+LENSES_FILE = "configs/reasoning_lenses_v0_1.yaml"
+LENS_COMMAND_PREFIX = "lens:"
+TEMPLATE_PLACEHOLDERS = ("CONTEXT_CHUNKS", "USER_QUERY") # Every archetype must use both, and nothing else
+MIN_PREFIX_LENGTH = 3 # Shorter abbreviations only match as exact aliases or acronyms
+MAX_EDIT_DISTANCE = 2 # Typos tolerated in a lens name; names under 8 characters get 1, under 4 get none
+
+PLACEHOLDER_PATTERN = re.compile(r"\{([A-Za-z_]+)\}")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+def normalize_lens_key(text: str) -> str:
+    """Lowercase words separated by single spaces: 'Schematic Reasoning (Flow Logic)' -> 'schematic reasoning flow logic'."""
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+# --- Templates and Lenses ---
+class LensTemplate:
+    """A prompt_archetype split once into literal text and placeholders, so rendering is a single join."""
+
+    def __init__(self, source: str):
+        self.source = source
+        parts = PLACEHOLDER_PATTERN.split(source)
+        self.literals = parts[0::2]
+        self.fields = parts[1::2]
+        unknown = sorted(set(self.fields) - set(TEMPLATE_PLACEHOLDERS))
+        missing = [field for field in TEMPLATE_PLACEHOLDERS if field not in self.fields]
+        if unknown or missing:
+            raise ValueError(f"prompt_archetype has unknown placeholders {unknown} or is missing {missing}")
+        self.static_text = "".join(self.literals) # The template without its placeholders, for token budgeting
+
+    def render(self, **values: str) -> str:
+        parts = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            parts.append(values[field])
+            parts.append(literal)
+        return "".join(parts)
+
+class Lens:
+    """
+    One reasoning lens. Besides name and prompt_archetype, a lens may list `aliases` and a `retrieval`
+    section with `n_results` and `content_types`, which limit what is fetched from memory when it is used.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.name: str = config["name"]
+        self.purpose: str = config.get("purpose", "")
+        self.aliases: List[str] = [str(alias) for alias in config.get("aliases") or []]
+        self.template = LensTemplate(config["prompt_archetype"])
+        retrieval = config.get("retrieval") or {}
+        self.n_results: Optional[int] = int(retrieval["n_results"]) if retrieval.get("n_results") else None
+        self.content_types: Optional[List[str]] = list(retrieval["content_types"]) if retrieval.get("content_types") else None
+
+    def keys(self) -> List[str]:
+        """The normalized name, aliases and, for names of two or more words, the acronym (e.g. 'csr')."""
+        words = normalize_lens_key(self.name).split()
+        keys = [" ".join(words)] + [normalize_lens_key(alias) for alias in self.aliases]
+        if len(words) > 1:
+            keys.append("".join(word[0] for word in words))
+        return [key for key in dict.fromkeys(keys) if key]
+
+    def render_prompt(self, context_text: str, user_query: str) -> str:
+        return self.template.render(CONTEXT_CHUNKS=context_text, USER_QUERY=user_query)
+
+# --- Prefix Trie ---
+class _TrieNode:
+    __slots__ = ("children", "lens", "lenses")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.lens: Optional[Lens] = None # Set where a key ends
+        self.lenses: Dict[str, Lens] = {} # Every lens with a key through this node, for unique-prefix matches
+
+class LensTrie:
+    """Normalized lens keys, character by character."""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, key: str, lens: Lens) -> bool:
+        """Adds a key; False (and nothing changes) if it already names another lens."""
+        node = self.root
+        for char in key:
+            node = node.children.get(char) or node.children.setdefault(char, _TrieNode())
+        if node.lens is not None and node.lens is not lens:
+            return False
+        node.lens = lens
+        node = self.root
+        for char in key:
+            node = node.children[char]
+            node.lenses[lens.name] = lens
+        return True
+
+    def get(self, key: str) -> Optional[Lens]:
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node.lens
+
+    def walk(self, text: str) -> Tuple[Optional[Tuple[Lens, int]], Optional[Tuple[Lens, int]]]:
+        """
+        One walk along normalized `text`. Returns the longest key that ends at a word boundary of the text,
+        and the longest prefix (of at least MIN_PREFIX_LENGTH) ending at a word boundary that only one lens
+        has, each as (lens, end) or None.
+        """
+        exact = unique = None
+        node = self.root
+        for position, char in enumerate(text):
+            node = node.children.get(char)
+            if node is None:
+                break
+            end = position + 1
+            if end < len(text) and text[end] != " ":
+                continue
+            if node.lens is not None:
+                exact = (node.lens, end)
+            if end >= MIN_PREFIX_LENGTH and len(node.lenses) == 1:
+                unique = (next(iter(node.lenses.values())), end)
+        return exact, unique
+
+    def nearest(self, text: str, max_distance: int) -> Optional[Tuple[int, Lens]]:
+        """The key closest to `text` by edit distance, if within max_distance and not tied with another lens."""
+        best: Dict[Lens, int] = {}
+        first_row = list(range(len(text) + 1))
+        stack = [(child, char, first_row) for char, child in self.root.children.items()]
+        while stack:
+            node, char, previous = stack.pop()
+            row = [previous[0] + 1]
+            for i in range(1, len(text) + 1):
+                row.append(min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + (text[i - 1] != char)))
+            if node.lens is not None and row[-1] <= max_distance:
+                best[node.lens] = min(row[-1], best.get(node.lens, row[-1]))
+            if min(row) <= max_distance:
+                stack.extend((grandchild, next_char, row) for next_char, grandchild in node.children.items())
+        if not best:
+            return None
+        ranked = sorted((distance, lens.name, lens) for lens, distance in best.items())
+        if len(ranked) > 1 and ranked[0][0] == ranked[1][0]:
+            return None
+        return ranked[0][0], ranked[0][2]
+
+# --- Registry ---
+class LensRegistry:
+    """The lenses in one file, in file order, with the trie that resolves names typed by the user."""
+
+    def __init__(self, path: str = LENSES_FILE):
+        self.path = path
+        self.lenses: Dict[str, Lens] = {}
+        self._trie = LensTrie()
+        self._max_key_words = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                config = yaml.safe_load(f) or {}
+        except Exception as e:
+            print(f"[lens_registry] Error loading lenses from {self.path}: {e}")
+            return
+        for entry in config.get('lenses') or []:
+            try:
+                lens = Lens(entry)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"[lens_registry] Skipping lens {entry.get('name', '?') if isinstance(entry, dict) else entry!r}: {e}")
+                continue
+            self.lenses[lens.name] = lens
+            for key in lens.keys():
+                if not self._trie.insert(key, lens):
+                    print(f"[lens_registry] '{key}' already names lens '{self._trie.get(key).name}'; ignored for '{lens.name}'.")
+                self._max_key_words = max(self._max_key_words, key.count(" ") + 1)
+
+    def __len__(self) -> int:
+        return len(self.lenses)
+
+    def names(self) -> List[str]:
+        return list(self.lenses)
+
+    def get(self, name: str) -> Optional[Lens]:
+        """A lens by its name, an alias or its acronym, ignoring case and punctuation."""
+        return self._trie.get(normalize_lens_key(name))
+
+    def match(self, text: str) -> Tuple[Optional[Lens], str]:
+        """
+        The lens named at the start of `text` and the rest of the text. A full name, alias or acronym wins,
+        then a name with a small typo, then an abbreviation that only one lens starts with.
+        """
+        words = list(WORD_PATTERN.finditer(text.lower()))
+        normalized = " ".join(word.group() for word in words)
+        exact, unique = self._trie.walk(normalized)
+
+        found: Optional[Tuple[Lens, int]] = None # The lens and how many words of the text name it
+        if exact:
+            found = (exact[0], normalized[:exact[1]].count(" ") + 1)
+        else:
+            best_distance = None
+            for count in range(min(len(words), self._max_key_words), 0, -1):
+                candidate = " ".join(word.group() for word in words[:count])
+                allowed = min(MAX_EDIT_DISTANCE, len(candidate) // 4)
+                nearest = self._trie.nearest(candidate, allowed) if allowed else None
+                if nearest and (best_distance is None or nearest[0] < best_distance):
+                    best_distance, found = nearest[0], (nearest[1], count)
+            if found is None and unique:
+                found = (unique[0], normalized[:unique[1]].count(" ") + 1)
+        if found is None:
+            return None, text.strip()
+        lens, word_count = found
+        return lens, text[words[word_count - 1].end():].lstrip(" \t)]}:,-").strip()
+
+    def resolve_command(self, user_input: str) -> Tuple[Optional[Lens], str, bool]:
+        """
+        Splits "lens: <name> <query>" into the lens and the query. Returns (lens, query, is_command);
+        input without the prefix comes back unchanged with is_command False.
+        """
+        if not user_input.lower().startswith(LENS_COMMAND_PREFIX):
+            return None, user_input, False
+        lens, query = self.match(user_input[len(LENS_COMMAND_PREFIX):])
+        return lens, query, True
+
+_registries: Dict[str, LensRegistry] = {}
+_registry_lock = threading.Lock()
+
+def get_lens_registry(path: str = LENSES_FILE) -> LensRegistry:
+    """The registry for `path`, loaded on first use and then shared by the whole process."""
+    registry = _registries.get(path)
+    if registry is None:
+        with _registry_lock:
+            registry = _registries.get(path)
+            if registry is None:
+                registry = _registries[path] = LensRegistry(path)
+    return registry
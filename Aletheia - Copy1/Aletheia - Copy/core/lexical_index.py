@@ -0,0 +1,198 @@
+# core/lexical_index.py
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple
+
+from core.metadata_filters import matches_where
+
+# --- Index Settings ---
+LEXICAL_INDEX_FILE_NAME = "lexical_index.sqlite3" # Stored next to the ChromaDB data it mirrors
+BM25_K1 = 1.2 # Term-frequency saturation
+BM25_B = 0.75 # Document-length normalization
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; acronyms such as IRER or OIW stay whole."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class LexicalIndex:
+    """
+    Persistent BM25 inverted index over chunk documents, kept in step with the ChromaDB collection.
+
+    Postings, document lengths and metadata live in memory for scoring; each document's term counts are
+    also written through to SQLite, so the index is reloaded (not rebuilt) on the next start and can
+    be updated one chunk at a time.
+    """
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {} # term -> {chunk id: term frequency}
+        self._lengths: Dict[str, int] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    # --- Storage ---
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._connection is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, length INTEGER NOT NULL, terms TEXT NOT NULL, metadata TEXT NOT NULL)"
+                )
+                self._connection.commit()
+            except Exception as e:
+                print(f"[lexical_index] Error opening lexical index at '{self.path}': {e}. Using memory only.")
+                self._connection = None
+        return self._connection
+
+    def _ensure_loaded(self):
+        """Loads the persisted index into memory on first use. Caller holds the lock."""
+        if self._loaded:
+            return
+        self._loaded = True
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            for chunk_id, length, terms, metadata in connection.execute("SELECT id, length, terms, metadata FROM documents"):
+                self._index(chunk_id, length, json.loads(terms), json.loads(metadata))
+        except Exception as e:
+            print(f"[lexical_index] Error loading lexical index from '{self.path}': {e}")
+
+    def _index(self, chunk_id: str, length: int, term_counts: Dict[str, int], metadata: Dict[str, Any]):
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, {})[chunk_id] = count
+        self._lengths[chunk_id] = length
+        self._metadata[chunk_id] = metadata
+        self._total_length += length
+
+    def _unindex(self, chunk_id: str, terms: Iterable[str]):
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(chunk_id, 0)
+        self._metadata.pop(chunk_id, None)
+
+    def _stored_terms(self, chunk_ids: List[str]) -> Dict[str, List[str]]:
+        """The indexed terms of existing chunks, read back from SQLite (memory keeps postings only)."""
+        connection = self._connect()
+        if connection is None:
+            # Memory only: fall back to scanning the postings
+            wanted = set(chunk_ids)
+            found: Dict[str, List[str]] = {}
+            for term, postings in self._postings.items():
+                for chunk_id in wanted.intersection(postings):
+                    found.setdefault(chunk_id, []).append(term)
+            return found
+        found = {}
+        for start in range(0, len(chunk_ids), 500): # Stay under SQLite's bound-parameter limit
+            part = chunk_ids[start:start + 500]
+            rows = connection.execute(f"SELECT id, terms FROM documents WHERE id IN ({','.join('?' * len(part))})", part)
+            found.update({chunk_id: list(json.loads(terms)) for chunk_id, terms in rows})
+        return found
+
+    # --- Updates ---
+    def add(self, chunk_ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Indexes chunks, replacing any earlier version of the same ids."""
+        with self._lock:
+            self._ensure_loaded()
+            existing = [chunk_id for chunk_id in chunk_ids if chunk_id in self._lengths]
+            for chunk_id, terms in self._stored_terms(existing).items():
+                self._unindex(chunk_id, terms)
+            rows = []
+            for chunk_id, document, metadata in zip(chunk_ids, documents, metadatas):
+                tokens = tokenize(document or "")
+                term_counts = dict(Counter(tokens))
+                self._index(chunk_id, len(tokens), term_counts, metadata or {})
+                rows.append((chunk_id, len(tokens), json.dumps(term_counts), json.dumps(metadata or {})))
+            connection = self._connect()
+            if connection is not None:
+                try:
+                    connection.executemany("INSERT OR REPLACE INTO documents (id, length, terms, metadata) VALUES (?, ?, ?, ?)", rows)
+                    connection.commit()
+                except Exception as e:
+                    print(f"[lexical_index] Error persisting {len(rows)} chunks: {e}")
+
+    def remove(self, chunk_ids: List[str]):
+        with self._lock:
+            self._ensure_loaded()
+            for chunk_id, terms in self._stored_terms([chunk_id for chunk_id in chunk_ids if chunk_id in self._lengths]).items():
+                self._unindex(chunk_id, terms)
+            connection = self._connect()
+            if connection is not None:
+                try:
+                    connection.executemany("DELETE FROM documents WHERE id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+                    connection.commit()
+                except Exception as e:
+                    print(f"[lexical_index] Error removing {len(chunk_ids)} chunks: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._postings, self._lengths, self._metadata, self._total_length = {}, {}, {}, 0
+            self._loaded = True
+            connection = self._connect()
+            if connection is not None:
+                connection.execute("DELETE FROM documents")
+                connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._lengths)
+
+    # --- Search ---
+    def search(self, query_text: str, n_results: int, where: Optional[Dict[str, Any]] = None,
+               candidates: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to n_results (chunk id, BM25 score) pairs, best first, among chunks matching `where`
+        and, if `candidates` is given, among those chunk ids only.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            document_count = len(self._lengths)
+            if not document_count:
+                return []
+            average_length = self._total_length / document_count or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query_text)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if candidates is not None and len(candidates) < len(postings):
+                    # A narrow pre-filter: look the candidates up rather than scanning the whole posting list
+                    matched = ((chunk_id, postings[chunk_id]) for chunk_id in candidates if chunk_id in postings)
+                else:
+                    matched = postings.items()
+                for chunk_id, frequency in matched:
+                    length_norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+            if candidates is not None:
+                scores = {chunk_id: score for chunk_id, score in scores.items() if chunk_id in candidates}
+            if where:
+                scores = {chunk_id: score for chunk_id, score in scores.items() if matches_where(self._metadata.get(chunk_id), where)}
+            return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
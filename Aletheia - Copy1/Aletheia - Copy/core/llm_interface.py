@@ -1,62 +1,174 @@
 # core/llm_interface.py
-import openai
-import os
-from dotenv import load_dotenv
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-load_dotenv() # Load environment variables from .env
+from core.tokens import count_tokens
+from core.embedding_cache import embedding_cache, get_embedding_cache_stats, make_cache_key
+from core.completion_cache import completion_cache, get_completion_cache_mode, make_completion_key
+from core.telemetry import telemetry
+# All API traffic goes through the shared, rate-limited client layer
+# (.env and the API key are read on first use, see core/config.py)
+from core.openai_client import is_configured, create_embeddings, create_chat_completion, stream_chat_completion
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    print("Error: OPENAI_API_KEY not found in .env file or environment variables.")
-    # Potentially raise an error or handle as needed
-else:
-    openai.api_key = OPENAI_API_KEY
+# --- Embedding Batch Limits ---
+EMBEDDING_BATCH_SIZE = 512 # Max inputs per request (the API allows up to 2048)
+EMBEDDING_MAX_TOKENS_PER_REQUEST = 250000 # Stays under the API's 300k per-request limit
 
 def get_openai_embedding(text_chunk: str, model: str = "text-embedding-3-small") -> Optional[List[float]]:
     """
     Generates an embedding for a given text chunk using OpenAI's API.
     """
-    if not openai.api_key:
-        print("OpenAI API key not configured. Cannot generate embedding.")
-        return None
+    return get_openai_embeddings([text_chunk], model=model)[0]
+
+def _pack_embedding_batches(texts: List[str], model: str, batch_size: int) -> List[List[int]]:
+    """Groups text indices into request-sized batches by item count and token total."""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text, model)
+        if current and (len(current) >= batch_size or current_tokens + tokens > EMBEDDING_MAX_TOKENS_PER_REQUEST):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _embed_batch(texts: List[str], indices: List[int], model: str, results: List[Optional[List[float]]]):
+    """
+    Embeds one sub-batch, writing vectors into `results` at their original positions.
+    Transient failures are retried by the client layer; a rejected batch is split in half
+    so that only the offending inputs end up without an embedding.
+    """
+    import openai # Already loaded by the client layer; needed here for its error type
     try:
-        response = openai.embeddings.create(
-            input=[text_chunk], # API expects a list of strings
-            model=model
-        )
-        embedding = response.data[0].embedding
-        return embedding
+        vectors = create_embeddings([texts[i] for i in indices], model)
+        for i, vector in zip(indices, vectors):
+            results[i] = vector
+    except openai.BadRequestError as e:
+        if len(indices) > 1:
+            middle = len(indices) // 2
+            _embed_batch(texts, indices[:middle], model, results)
+            _embed_batch(texts, indices[middle:], model, results)
+        else:
+            telemetry.increment("errors_total", stage="embedding", error=type(e).__name__)
+            print(f"Error generating embedding from OpenAI (input {indices[0]} rejected): {e}")
     except Exception as e:
-        print(f"Error generating embedding from OpenAI: {e}")
-        return None
+        telemetry.increment("errors_total", stage="embedding", error=type(e).__name__)
+        print(f"Error generating embeddings from OpenAI for batch of {len(indices)}: {e}")
 
-def get_llm_completion(prompt: str, system_prompt: Optional[str] = None, model: str = "gpt-4o") -> Optional[str]:
+def get_openai_embeddings(texts: List[str], model: str = "text-embedding-3-small", batch_size: int = EMBEDDING_BATCH_SIZE, use_cache: bool = True) -> List[Optional[List[float]]]:
     """
-    Gets a completion from the specified OpenAI LLM model.
+    Generates embeddings for many text chunks, packing them into as few API requests as the limits allow.
+    Texts already in the embedding cache are not sent to the API.
+    The result is aligned with `texts`; entries that could not be embedded are None.
     """
-    if not openai.api_key:
-        print("OpenAI API key not configured. Cannot get completion.")
-        return None
+    if not texts:
+        return []
+    results = embedding_cache.get_many(model, texts) if use_cache else [None] * len(texts)
+
+    # Only unseen texts go to the API, and each distinct (normalized) text only once
+    missing_positions: Dict[str, List[int]] = {}
+    for i, vector in enumerate(results):
+        if vector is None:
+            missing_positions.setdefault(make_cache_key(model, texts[i]), []).append(i)
+    if not missing_positions:
+        return results
+    if not is_configured():
+        print("OpenAI API key not configured. Cannot generate embedding.")
+        return results
 
+    missing_texts = [texts[positions[0]] for positions in missing_positions.values()]
+    missing_results: List[Optional[List[float]]] = [None] * len(missing_texts)
+    for indices in _pack_embedding_batches(missing_texts, model, batch_size):
+        _embed_batch(missing_texts, indices, model, missing_results)
+
+    if use_cache:
+        embedding_cache.put_many(model, missing_texts, missing_results)
+    for positions, vector in zip(missing_positions.values(), missing_results):
+        for i in positions:
+            results[i] = vector
+    return results
+
+def _build_messages(prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
     messages.append({"role": "user", "content": prompt})
+    return messages
+
+def _count_completion_tokens(messages: List[Dict[str, str]], response: str, model: str):
+    telemetry.increment("llm_tokens_in_total", sum(count_tokens(message["content"], model) for message in messages), model=model)
+    telemetry.increment("llm_tokens_out_total", count_tokens(response, model), model=model)
+
+def _cached_completion(messages: List[Dict[str, str]], model: str, params: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (cache key, cached response); the key is None when the completion cache is disabled."""
+    if get_completion_cache_mode() == "disabled":
+        return None, None
+    key = make_completion_key(model, messages, params)
+    return key, completion_cache.get(key)
+
+def get_llm_completion(prompt: str, system_prompt: Optional[str] = None, model: str = "gpt-4o", **params) -> Optional[str]:
+    """
+    Gets a completion from the specified OpenAI LLM model. `params` (e.g. temperature) are passed to the API.
+    In the completion cache's replay mode (ALETHEIA_COMPLETION_CACHE), a repeated request is answered from the cache.
+    """
+    messages = _build_messages(prompt, system_prompt)
+    key, cached = _cached_completion(messages, model, params)
+    if cached is not None:
+        return cached
+    if not is_configured():
+        print("OpenAI API key not configured. Cannot get completion.")
+        return None
 
     try:
-        response = openai.chat.completions.create(
-            model=model,
-            messages=messages
-        )
-        return response.choices[0].message.content
+        response = create_chat_completion(messages, model, **params)
     except Exception as e:
+        telemetry.increment("errors_total", stage="completion", error=type(e).__name__)
         print(f"Error getting completion from OpenAI: {e}")
         return None
+    _count_completion_tokens(messages, response or "", model)
+    if key is not None and response:
+        completion_cache.put(key, model, response)
+    return response
+
+class CompletionStreamError(Exception):
+    """A streamed completion broke off after part of the answer had been yielded."""
+
+def stream_llm_completion(prompt: str, system_prompt: Optional[str] = None, model: str = "gpt-4o", **params) -> Iterator[str]:
+    """
+    Streams a completion from the specified OpenAI LLM model, yielding text fragments as they arrive.
+    Yields nothing if the request fails before the first token; callers assemble the full text themselves.
+    If it fails after that, CompletionStreamError is raised, so a cut-off answer is never mistaken for a whole one.
+    In replay mode a cached answer is yielded as one fragment, and only streams that finish are cached.
+    """
+    messages = _build_messages(prompt, system_prompt)
+    key, cached = _cached_completion(messages, model, params)
+    if cached is not None:
+        yield cached
+        return
+    if not is_configured():
+        print("OpenAI API key not configured. Cannot get completion.")
+        return
+
+    fragments = []
+    try:
+        for fragment in stream_chat_completion(messages, model, **params):
+            fragments.append(fragment)
+            yield fragment
+    except Exception as e:
+        telemetry.increment("errors_total", stage="completion", error=type(e).__name__)
+        print(f"Error streaming completion from OpenAI: {e}")
+        _count_completion_tokens(messages, "".join(fragments), model)
+        if fragments:
+            raise CompletionStreamError(f"stream ended after {len(fragments)} fragments: {e}") from e
+        return
+    _count_completion_tokens(messages, "".join(fragments), model)
+    if key is not None and fragments:
+        completion_cache.put(key, model, "".join(fragments))
 
 # Example usage (optional, for testing this module)
 if __name__ == '__main__':
-    if OPENAI_API_KEY:
+    if is_configured():
         # Test embedding
         sample_text = "This is a test sentence for Aletheia's memory."
         embedding = get_openai_embedding(sample_text)
@@ -74,5 +186,11 @@ if __name__ == '__main__':
             print(f"\nLLM Response: {completion}")
         else:
             print("Failed to get completion.")
+
+        # Test streaming completion
+        print("\nStreamed LLM Response: ", end="", flush=True)
+        for fragment in stream_llm_completion(user_p, system_prompt=system_p):
+            print(fragment, end="", flush=True)
+        print()
     else:
         print("Please set your OPENAI_API_KEY in the .env file to run tests.")
\ No newline at end of file
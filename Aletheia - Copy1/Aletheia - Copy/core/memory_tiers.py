@@ -0,0 +1,310 @@
+# core/memory_tiers.py
+# Memory tiers for live interactions:
+#   hot      - recent turns, one LiveInteraction chunk each, searchable as written by ingest_interaction_text
+#   session  - older turns, deduplicated and consolidated into one SessionSummary chunk per conversation
+#   archive  - the original turns after consolidation, kept in a JSONL file outside the search index
+import datetime
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.corememory_system import get_collection, get_memory_store, add_document_chunks, delete_chunks
+from core.embedding_providers import get_embeddings
+from core.llm_interface import get_llm_completion
+from core.openai_client import is_configured
+from core.telemetry import telemetry
+from core.tokens import count_tokens
+
+# --- Compaction Settings ---
+HOT_TIER_MAX_AGE_HOURS = 72 # Interactions younger than this stay as individual chunks
+SESSION_GAP_MINUTES = 30 # A longer pause between turns starts a new session
+SESSION_MAX_INTERACTIONS = 24 # Longer sessions are consolidated in several parts
+DEDUP_SIMILARITY_THRESHOLD = 0.97 # Cosine similarity at which two turns count as the same exchange
+COMPACTION_BATCH_LIMIT = 2000 # Oldest interactions handled per run, so one run stays bounded
+COLD_SCAN_PAGE_SIZE = 1000 # Interaction metadata read per page while looking for cold turns
+SESSION_SUMMARY_MAX_TOKENS = 400
+SUMMARY_MODEL = "gpt-4o-mini"
+COMPACTION_INTERVAL_SECONDS = 6 * 60 * 60
+ARCHIVE_FILE_NAME = "interaction_archive.jsonl"
+COMPACTION_STATE_FILE_NAME = "compaction_state.json"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S" # As written by ingest_interaction_text
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You consolidate conversation logs into long-term memory. Summarize the exchanges between the user and "
+    "Aletheia below in at most {max_words} words. Keep names, decisions, open questions, stated preferences "
+    "and any specific terms (e.g. IRER concepts) verbatim; drop pleasantries."
+)
+
+def _archive_path() -> str:
+    return os.path.join(get_memory_store().path, ARCHIVE_FILE_NAME)
+
+def _state_path() -> str:
+    return os.path.join(get_memory_store().path, COMPACTION_STATE_FILE_NAME)
+
+def _parse_timestamp(metadata: Dict[str, Any]) -> Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.strptime(metadata.get("timestamp", ""), TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+# --- Selecting and Grouping ---
+def find_cold_interactions(max_age_hours: float = HOT_TIER_MAX_AGE_HOURS, limit: int = COMPACTION_BATCH_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Returns the oldest LiveInteraction chunks past the hot tier's age limit, oldest first (at most `limit`).
+    Metadata is read page by page, keeping only the oldest `limit` turns found so far, and documents are
+    then fetched for those alone, so a run's memory does not grow with the number of hot interactions.
+    """
+    collection = get_collection()
+    cutoff = datetime.datetime.now() - datetime.timedelta(hours=max_age_hours)
+    cold: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        page = collection.get(where={"content_type": "LiveInteraction"}, limit=COLD_SCAN_PAGE_SIZE, offset=offset, include=['metadatas'])
+        if not page['ids']:
+            break
+        for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+            timestamp = _parse_timestamp(metadata or {})
+            if timestamp is not None and timestamp < cutoff:
+                cold.append({"id": chunk_id, "metadata": metadata, "timestamp": timestamp})
+        cold = heapq.nsmallest(limit, cold, key=lambda interaction: interaction["timestamp"])
+        offset += len(page['ids'])
+    if not cold:
+        return []
+    stored = collection.get(ids=[interaction["id"] for interaction in cold], include=['documents'])
+    documents = dict(zip(stored['ids'], stored['documents']))
+    for interaction in cold:
+        interaction["document"] = documents.get(interaction["id"]) or ""
+    return cold
+
+def mark_duplicates(interactions: List[Dict[str, Any]], threshold: float = DEDUP_SIMILARITY_THRESHOLD) -> int:
+    """
+    Greedily marks turns whose text is within `threshold` cosine similarity of an earlier kept turn:
+    the duplicate gets "duplicate_of" and the kept turn's "repeats" count goes up. Returns how many were marked.
+    Turns are compared without their timestamp header, which would otherwise set every copy apart.
+    """
+    embeddings = get_embeddings([_strip_header(interaction["document"]) for interaction in interactions])
+    dimension = next((len(embedding) for embedding in embeddings if embedding is not None), 0)
+    kept_vectors = np.zeros((len(interactions), dimension), dtype=np.float32)
+    kept: List[Dict[str, Any]] = []
+    duplicates = 0
+    for interaction, embedding in zip(interactions, embeddings):
+        interaction["repeats"] = 0
+        if embedding is None or len(embedding) != dimension:
+            continue
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if not norm:
+            continue
+        vector /= norm
+        if kept:
+            similarities = kept_vectors[:len(kept)] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                interaction["duplicate_of"] = kept[best]["id"]
+                kept[best]["repeats"] += 1
+                duplicates += 1
+                continue
+        kept_vectors[len(kept)] = vector
+        kept.append(interaction)
+    return duplicates
+
+def group_sessions(interactions: List[Dict[str, Any]], gap_minutes: float = SESSION_GAP_MINUTES,
+                   max_interactions: int = SESSION_MAX_INTERACTIONS) -> List[List[Dict[str, Any]]]:
+    """Splits chronologically sorted turns into sessions wherever the conversation paused for longer than the gap."""
+    sessions: List[List[Dict[str, Any]]] = []
+    gap = datetime.timedelta(minutes=gap_minutes)
+    for interaction in interactions:
+        if (not sessions or len(sessions[-1]) >= max_interactions
+                or interaction["timestamp"] - sessions[-1][-1]["timestamp"] > gap):
+            sessions.append([])
+        sessions[-1].append(interaction)
+    return sessions
+
+# --- Consolidation ---
+def _strip_header(document: str) -> str:
+    """The User:/Aletheia: lines of an interaction, without its "Interaction at ..." header."""
+    lines = document.splitlines()
+    if lines and lines[0].startswith("Interaction at "):
+        lines = lines[1:]
+    return "\n".join(lines).strip()
+
+def _turn_text(interaction: Dict[str, Any]) -> str:
+    text = _strip_header(interaction["document"])
+    return f"{text}\n(Repeated {interaction['repeats']} more times.)" if interaction.get("repeats") else text
+
+def _extractive_summary(turns: List[str], max_tokens: int) -> str:
+    """Fallback when no LLM is available: the turns themselves, in order, up to the token budget."""
+    parts, used = [], 0
+    for i, turn in enumerate(turns):
+        tokens = count_tokens(turn)
+        if parts and used + tokens > max_tokens:
+            parts.append(f"(+{len(turns) - i} more exchanges archived.)")
+            break
+        parts.append(turn)
+        used += tokens
+    return "\n\n".join(parts)
+
+def summarize_session(session: List[Dict[str, Any]], use_llm: bool = True, max_tokens: int = SESSION_SUMMARY_MAX_TOKENS) -> str:
+    turns = [_turn_text(interaction) for interaction in session if "duplicate_of" not in interaction]
+    summary = None
+    if use_llm:
+        summary = get_llm_completion("\n\n".join(turns), SUMMARY_SYSTEM_PROMPT.format(max_words=int(max_tokens * 0.7)), model=SUMMARY_MODEL)
+    summary = (summary or "").strip() or _extractive_summary(turns, max_tokens)
+    start, end = session[0]["timestamp"], session[-1]["timestamp"]
+    header = f"Session summary, {start.strftime(TIMESTAMP_FORMAT)} to {end.strftime(TIMESTAMP_FORMAT)} ({len(session)} interactions):"
+    return f"{header}\n{summary}"
+
+def build_session_record(session: List[Dict[str, Any]], summary: str) -> Dict[str, Any]:
+    start = session[0]["timestamp"]
+    # Derived from the member ids, so re-running an interrupted compaction rewrites the same chunk
+    digest = hashlib.sha256("|".join(interaction["id"] for interaction in session).encode("utf-8")).hexdigest()[:8]
+    doc_title = f"Session_{start.strftime('%Y%m%d_%H%M%S')}_{digest}"
+    return {
+        "id": f"{doc_title}_chunk_1",
+        "document": summary,
+        "metadata": {
+            "source_file_name": "LiveSession",
+            "document_title": doc_title,
+            "content_type": "SessionSummary",
+            "chunk_sequence_id": 1,
+            "timestamp": start.strftime(TIMESTAMP_FORMAT),
+            "session_end": session[-1]["timestamp"].strftime(TIMESTAMP_FORMAT),
+            "interaction_count": len(session),
+            "duplicate_count": sum(1 for interaction in session if "duplicate_of" in interaction),
+            "memory_tier": "session"
+        }
+    }
+
+def archive_interactions(session: List[Dict[str, Any]], session_id: str):
+    """Appends the original turns to the archive (durably) before they are removed from the index."""
+    path = _archive_path()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for interaction in session:
+            f.write(json.dumps({"id": interaction["id"], "document": interaction["document"], "metadata": interaction["metadata"],
+                                "session_id": session_id, "duplicate_of": interaction.get("duplicate_of")}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def iter_archived_interactions():
+    """Yields archived interaction records, oldest first."""
+    if not os.path.exists(_archive_path()):
+        return
+    with open(_archive_path(), 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# --- Compaction Job ---
+_compaction_lock = threading.Lock()
+
+def compact_interactions(max_age_hours: float = HOT_TIER_MAX_AGE_HOURS, use_llm: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Moves live interactions older than the hot tier into session summaries: deduplicates them, consolidates
+    each session into one chunk, archives the originals and deletes them from the index. Each session is
+    written before its originals are archived and deleted, so an interrupted run never loses a turn.
+    Returns the run's stats, which are also saved for get_compaction_stats().
+    """
+    collection = get_collection()
+    if not collection:
+        print("[memory_tiers] Error: ChromaDB collection not initialized. Skipping compaction.")
+        return {}
+    with _compaction_lock, telemetry.span("compaction"):
+        started = time.perf_counter()
+        stats = {"started_at": datetime.datetime.now().strftime(TIMESTAMP_FORMAT), "dry_run": dry_run,
+                 "chunks_before": collection.count(), "cold_interactions": 0, "duplicates": 0,
+                 "sessions_written": 0, "interactions_archived": 0, "failed_sessions": 0}
+        use_llm = use_llm and is_configured() # Without an API key, sessions get extractive summaries
+        interactions = find_cold_interactions(max_age_hours)
+        stats["cold_interactions"] = len(interactions)
+        if interactions:
+            stats["duplicates"] = mark_duplicates(interactions)
+            for session in group_sessions(interactions):
+                record = build_session_record(session, "")
+                if dry_run:
+                    stats["sessions_written"] += 1
+                    stats["interactions_archived"] += len(session)
+                    continue
+                record["document"] = summarize_session(session, use_llm=use_llm)
+                title = record["metadata"]["document_title"]
+                if not add_document_chunks(title, [record], get_embeddings([record["document"]])):
+                    stats["failed_sessions"] += 1 # The originals stay hot and are retried next run
+                    continue
+                try:
+                    archive_interactions(session, record["id"])
+                except Exception as e:
+                    print(f"[memory_tiers] Error archiving {title}: {e}. Originals kept in the index.")
+                    stats["failed_sessions"] += 1
+                    continue
+                delete_chunks([interaction["id"] for interaction in session], f"{title} (archived interactions)")
+                stats["sessions_written"] += 1
+                stats["interactions_archived"] += len(session)
+        stats["chunks_after"] = collection.count()
+        stats["seconds"] = time.perf_counter() - started
+        print(f"[memory_tiers] Compaction {'(dry run) ' if dry_run else ''}finished: {stats['cold_interactions']} cold interactions, "
+              f"{stats['duplicates']} duplicates, {stats['sessions_written']} sessions, "
+              f"{stats['chunks_before']} -> {stats['chunks_after']} chunks in {stats['seconds']:.1f}s.")
+        if not dry_run:
+            _save_compaction_stats(stats)
+        return stats
+
+def _save_compaction_stats(stats: Dict[str, Any]):
+    state = get_compaction_stats()
+    totals = state.get("totals", {})
+    for key in ("duplicates", "sessions_written", "interactions_archived", "failed_sessions"):
+        totals[key] = totals.get(key, 0) + stats[key]
+    totals["runs"] = totals.get("runs", 0) + 1
+    try:
+        temp_path = _state_path() + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"last_run": stats, "totals": totals}, f, indent=1)
+        os.replace(temp_path, _state_path())
+    except Exception as e:
+        print(f"[memory_tiers] Error saving compaction stats: {e}")
+
+def get_compaction_stats() -> Dict[str, Any]:
+    """The last compaction run's stats and running totals ({} if compaction has never run)."""
+    try:
+        with open(_state_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_tier_counts() -> Dict[str, int]:
+    """Chunks currently in each interaction tier."""
+    counts = {}
+    for tier, content_type in (("hot", "LiveInteraction"), ("session", "SessionSummary")):
+        try:
+            counts[tier] = len(get_collection().get(where={"content_type": content_type}, include=[])['ids'])
+        except Exception:
+            counts[tier] = 0
+    counts["archived"] = sum(1 for _ in iter_archived_interactions())
+    return counts
+
+# --- Background Compaction ---
+_background_thread: Optional[threading.Thread] = None
+
+def start_background_compaction(interval_seconds: float = COMPACTION_INTERVAL_SECONDS, use_llm: bool = True):
+    """Runs compact_interactions on a daemon thread now and then every interval. Safe to call more than once."""
+    global _background_thread
+    if _background_thread is not None:
+        return
+
+    def run():
+        while True:
+            try:
+                compact_interactions(use_llm=use_llm)
+            except Exception as e:
+                print(f"[memory_tiers] Error during background compaction: {e}")
+            time.sleep(interval_seconds)
+
+    _background_thread = threading.Thread(target=run, name="memory-compaction", daemon=True)
+    _background_thread.start()
@@ -0,0 +1,46 @@
+# core/metadata_filters.py
+# Evaluates ChromaDB-style `where` filters against chunk metadata, for the retrieval paths that do not go
+# through collection.query (e.g. the lexical index), so every path honours the same filters.
+from typing import Any, Callable, Dict, Optional
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition # {"field": value} is shorthand for {"field": {"$eq": value}}
+    for operator, operand in condition.items():
+        if operator not in _OPERATORS:
+            raise ValueError(f"Unsupported filter operator '{operator}'")
+        try:
+            if not _OPERATORS[operator](value, operand):
+                return False
+        except TypeError:
+            return False # e.g. comparing a string field with a number never matches
+    return True
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """True when `metadata` satisfies the filter. Supports field conditions, $and and $or, as ChromaDB does."""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported filter operator '{key}'")
+        elif not _matches_condition(metadata.get(key), condition):
+            return False
+    return True
@@ -0,0 +1,233 @@
+# core/metadata_index.py
+# An in-memory column index over the chunk metadata that filters use most. A `where` filter on these fields is
+# resolved to candidate chunk ids with a few vectorized comparisons, which the vector and lexical searches then
+# score, instead of every search filtering metadata row by row. Timestamps are stored as numbers, so ranges such
+# as "timestamp > X" work even though ChromaDB only compares numbers, and the metadata holds strings.
+import datetime
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# --- Index Settings ---
+CATEGORY_FIELDS = ("content_type", "document_title", "source_file_name") # Dictionary-encoded: $eq, $ne, $in, $nin
+RANGE_FIELDS = ("timestamp",) # Epoch seconds: comparisons and ranges as well
+INITIAL_CAPACITY = 1024
+MISSING_CODE = -1 # A chunk without the field
+UNKNOWN_CODE = -2 # A value no chunk has
+
+def to_epoch(value: Any) -> Optional[float]:
+    """Seconds since the epoch for a number, datetime or ISO-format string ('2025-05-01 14:03:22'); else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return None
+
+def _split_clauses(where: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The top-level conjuncts of a filter: each field condition and each clause of a top-level $and."""
+    clauses = []
+    for key, condition in where.items():
+        if key == "$and":
+            for clause in condition:
+                clauses.extend(_split_clauses(clause))
+        else:
+            clauses.append({key: condition})
+    return clauses
+
+class MetadataIndex:
+    """
+    Columns of content_type, document_title, source_file_name (as integer codes) and timestamp (as floats), one
+    position per chunk. Replacing a chunk appends a new position and tombstones the old one; tombstones are
+    compacted away once they make up half the index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: List[Optional[str]] = []
+        self._position_by_id: Dict[str, int] = {}
+        self._alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._codes = {field: np.full(INITIAL_CAPACITY, MISSING_CODE, dtype=np.int32) for field in CATEGORY_FIELDS}
+        self._vocabulary: Dict[str, Dict[Any, int]] = {field: {} for field in CATEGORY_FIELDS}
+        self._values = {field: np.full(INITIAL_CAPACITY, np.nan) for field in RANGE_FIELDS}
+
+    # --- Updates ---
+    def _grow(self, needed: int):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+        for field, column in self._codes.items():
+            self._codes[field] = np.concatenate([column, np.full(capacity - len(column), MISSING_CODE, dtype=np.int32)])
+        for field, column in self._values.items():
+            self._values[field] = np.concatenate([column, np.full(capacity - len(column), np.nan)])
+
+    def _code(self, field: str, value: Any) -> int:
+        if value is None:
+            return MISSING_CODE
+        try:
+            return self._vocabulary[field].setdefault(value, len(self._vocabulary[field]))
+        except TypeError:
+            return MISSING_CODE # Unhashable values are left to the unindexed filter path
+
+    def add(self, chunk_ids: List[str], metadatas: List[Optional[Dict[str, Any]]]):
+        """Indexes chunks, replacing any earlier version of the same ids."""
+        with self._lock:
+            self._tombstone([chunk_id for chunk_id in chunk_ids if chunk_id in self._position_by_id])
+            start = len(self._ids)
+            self._grow(start + len(chunk_ids))
+            for offset, (chunk_id, metadata) in enumerate(zip(chunk_ids, metadatas)):
+                position, metadata = start + offset, metadata or {}
+                self._ids.append(chunk_id)
+                self._position_by_id[chunk_id] = position
+                self._alive[position] = True
+                for field in CATEGORY_FIELDS:
+                    self._codes[field][position] = self._code(field, metadata.get(field))
+                for field in RANGE_FIELDS:
+                    epoch = to_epoch(metadata.get(field))
+                    self._values[field][position] = np.nan if epoch is None else epoch
+
+    def remove(self, chunk_ids: List[str]):
+        with self._lock:
+            self._tombstone([chunk_id for chunk_id in chunk_ids if chunk_id in self._position_by_id])
+            if len(self._ids) > INITIAL_CAPACITY and len(self._position_by_id) < len(self._ids) // 2:
+                self._compact()
+
+    def _tombstone(self, chunk_ids: List[str]):
+        for chunk_id in chunk_ids:
+            position = self._position_by_id.pop(chunk_id)
+            self._ids[position] = None
+            self._alive[position] = False
+
+    def _compact(self):
+        """Rewrites the columns without tombstoned positions. Caller holds the lock."""
+        live = np.flatnonzero(self._alive[:len(self._ids)])
+        capacity = max(INITIAL_CAPACITY, 2 * len(live))
+        self._ids = [self._ids[position] for position in live]
+        self._position_by_id = {chunk_id: position for position, chunk_id in enumerate(self._ids)}
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:len(live)] = True
+        for field, column in self._codes.items():
+            self._codes[field] = np.concatenate([column[live], np.full(capacity - len(live), MISSING_CODE, dtype=np.int32)])
+        for field, column in self._values.items():
+            self._values[field] = np.concatenate([column[live], np.full(capacity - len(live), np.nan)])
+
+    def count(self) -> int:
+        return len(self._position_by_id)
+
+    # --- Filters ---
+    def _category_mask(self, field: str, condition: Any, size: int) -> Optional[np.ndarray]:
+        codes = self._codes[field][:size]
+        vocabulary = self._vocabulary[field]
+        mask = np.ones(size, dtype=bool)
+        for operator, operand in (condition.items() if isinstance(condition, dict) else [("$eq", condition)]):
+            try:
+                if operator in ("$eq", "$ne"):
+                    matches = codes == (MISSING_CODE if operand is None else vocabulary.get(operand, UNKNOWN_CODE))
+                elif operator in ("$in", "$nin") and isinstance(operand, (list, tuple, set)):
+                    matches = np.isin(codes, [vocabulary[value] for value in operand if value in vocabulary])
+                else:
+                    return None # e.g. a range on a category field: left to the unindexed path
+            except TypeError:
+                return None
+            mask &= ~matches if operator in ("$ne", "$nin") else matches
+        return mask
+
+    def _range_mask(self, field: str, condition: Any, size: int) -> Optional[np.ndarray]:
+        values = self._values[field][:size]
+        mask = np.ones(size, dtype=bool)
+        for operator, operand in (condition.items() if isinstance(condition, dict) else [("$eq", condition)]):
+            if operator in ("$in", "$nin"):
+                epochs = [to_epoch(value) for value in operand] if isinstance(operand, (list, tuple, set)) else [None]
+                if None in epochs:
+                    return None
+                matches = np.isin(values, epochs)
+                mask &= ~matches if operator == "$nin" else matches
+                continue
+            epoch = to_epoch(operand)
+            if epoch is None:
+                return None
+            with np.errstate(invalid='ignore'): # Chunks without the field (NaN) never compare true
+                if operator == "$eq":
+                    mask &= values == epoch
+                elif operator == "$ne":
+                    mask &= ~(values == epoch)
+                elif operator == "$gt":
+                    mask &= values > epoch
+                elif operator == "$gte":
+                    mask &= values >= epoch
+                elif operator == "$lt":
+                    mask &= values < epoch
+                elif operator == "$lte":
+                    mask &= values <= epoch
+                else:
+                    return None
+        return mask
+
+    def _mask(self, where: Dict[str, Any], size: int) -> Optional[np.ndarray]:
+        """Positions satisfying the filter, or None if any part of it is not on indexed fields. Caller holds the lock."""
+        mask = np.ones(size, dtype=bool)
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask(clause, size) for clause in condition]
+                if any(part is None for part in parts):
+                    return None
+                if key == "$and":
+                    for part in parts:
+                        mask &= part
+                else:
+                    mask &= np.logical_or.reduce(parts) if parts else np.zeros(size, dtype=bool)
+            elif key in CATEGORY_FIELDS:
+                part = self._category_mask(key, condition, size)
+                if part is None:
+                    return None
+                mask &= part
+            elif key in RANGE_FIELDS:
+                part = self._range_mask(key, condition, size)
+                if part is None:
+                    return None
+                mask &= part
+            else:
+                return None
+        return mask
+
+    def candidates(self, where: Optional[Dict[str, Any]]) -> Tuple[Optional[List[str]], Optional[Dict[str, Any]]]:
+        """
+        Splits a filter into the chunk ids allowed by its conditions on indexed fields (None if it has none)
+        and the rest of the filter (None if nothing is left), which the caller still has to apply.
+        """
+        if not where:
+            return None, where
+        with self._lock:
+            size = len(self._ids)
+            mask, residual = None, []
+            for clause in _split_clauses(where):
+                part = self._mask(clause, size)
+                if part is None:
+                    residual.append(clause)
+                else:
+                    mask = part if mask is None else mask & part
+            if mask is None:
+                return None, where
+            ids = [self._ids[position] for position in np.flatnonzero(mask & self._alive[:size])]
+        return ids, (residual[0] if len(residual) == 1 else {"$and": residual}) if residual else None
+
+    def content_types_of(self, chunk_ids: List[str]) -> Dict[str, List[str]]:
+        """The given chunk ids grouped by content_type (for routing them to content-type shards)."""
+        groups: Dict[str, List[str]] = {}
+        with self._lock:
+            names = {code: value for value, code in self._vocabulary["content_type"].items()}
+            for chunk_id in chunk_ids:
+                position = self._position_by_id.get(chunk_id)
+                if position is not None:
+                    groups.setdefault(names.get(int(self._codes["content_type"][position]), "Unknown"), []).append(chunk_id)
+        return groups
@@ -0,0 +1,346 @@
+# core/numpy_collection.py
+# An exact-search vector store for corpora small enough that one matrix product over every vector beats an
+# HNSW index: no index to load or rebuild, no recall loss, and predictable query times.
+#
+# Each collection is a directory holding an append-only file of embedding rows (float32, float16 or int8),
+# read through a read-only memory map, so opening it costs an mmap and the pages are shared by every process
+# that opens the same store. Ids, documents and metadata live in a small SQLite side table keyed by row.
+# Overwritten and deleted rows are tombstoned and reclaimed by compact(). Like ChromaDB's PersistentClient,
+# a store should have one writing process at a time; readers see rows written by another process once they reopen it.
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.metadata_filters import matches_where
+
+# --- Store Settings ---
+VECTOR_DTYPES = ("float32", "float16", "int8") # int8 keeps one float32 scale per row
+DEFAULT_VECTOR_DTYPE = "float32"
+VECTORS_FILE_NAME = "vectors.bin"
+SCALES_FILE_NAME = "scales.bin"
+TABLE_FILE_NAME = "table.sqlite3"
+SEARCH_BLOCK_ROWS = 32768 # Rows converted and multiplied at a time, bounding the float32 working set
+COMPACT_DEAD_FRACTION = 0.3 # compact() on open once this share of rows is tombstoned
+COMPACT_MIN_DEAD_ROWS = 1000
+
+def collection_directory(root: str, name: str) -> str:
+    return os.path.join(root, "numpy", re.sub(r"[^a-zA-Z0-9_.-]", "_", name))
+
+class NumpyCollection:
+    """
+    A collection with the parts of the ChromaDB Collection API this project uses (upsert, get, delete,
+    query, count, metadata, modify). Distances are squared L2, as in ChromaDB's default space, so results
+    rank and score the same way whichever backend holds them.
+    """
+
+    def __init__(self, directory: str, name: str, dtype: str = DEFAULT_VECTOR_DTYPE):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype '{dtype}'; use one of {', '.join(VECTOR_DTYPES)}")
+        self.directory = directory
+        self.name = name
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._table = sqlite3.connect(os.path.join(directory, TABLE_FILE_NAME), check_same_thread=False)
+        self._table.execute("PRAGMA journal_mode=WAL")
+        self._table.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._table.execute("CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT NOT NULL)")
+        self._table.commit()
+        settings = dict(self._table.execute("SELECT key, value FROM settings"))
+        # An existing store keeps the dtype it was written with
+        self.dtype = settings.get("dtype", dtype)
+        self.dimension: Optional[int] = int(settings["dimension"]) if "dimension" in settings else None
+        self._metadata: Optional[Dict[str, Any]] = json.loads(settings["metadata"]) if "metadata" in settings else None
+        if "dtype" not in settings:
+            self._set_setting("dtype", self.dtype)
+        self._load()
+        if len(self._ids) >= COMPACT_MIN_DEAD_ROWS and (len(self._ids) - len(self._row_by_id)) > COMPACT_DEAD_FRACTION * len(self._ids):
+            self.compact()
+
+    # --- Storage ---
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+    def _set_setting(self, key: str, value: str):
+        self._table.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        self._table.commit()
+
+    def _load(self):
+        """Reads the side table into memory and maps the vector file. Rows past the table (a write cut short) are dropped."""
+        rows = self._table.execute("SELECT row, id, metadata FROM chunks ORDER BY row").fetchall()
+        row_count = rows[-1][0] + 1 if rows else 0
+        self._ids: List[Optional[str]] = [None] * row_count # None marks a tombstoned row
+        self._metadatas: List[Optional[Dict[str, Any]]] = [None] * row_count
+        for row, chunk_id, metadata in rows:
+            self._ids[row] = chunk_id
+            self._metadatas[row] = json.loads(metadata)
+        self._row_by_id: Dict[str, int] = {chunk_id: row for row, chunk_id, _ in rows}
+        self._live = np.zeros(row_count, dtype=bool)
+        self._live[[row for row, _, _ in rows]] = True
+        for file_name, width in ((VECTORS_FILE_NAME, self._row_bytes()), (SCALES_FILE_NAME, 4 if self.dtype == "int8" else 0)):
+            path = self._path(file_name)
+            if width and os.path.exists(path) and os.path.getsize(path) > row_count * width:
+                with open(path, 'r+b') as f:
+                    f.truncate(row_count * width)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._remap(0)
+
+    def _row_bytes(self) -> int:
+        return (self.dimension or 0) * np.dtype(self.dtype).itemsize
+
+    def _remap(self, first_new_row: int):
+        """Maps the vector file read-only and computes the squared norms of rows from first_new_row on."""
+        row_count = len(self._ids)
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        if not row_count or not self.dimension:
+            self._norms = np.zeros(row_count, dtype=np.float32)
+            return
+        self._vectors = np.memmap(self._path(VECTORS_FILE_NAME), dtype=self.dtype, mode='r', shape=(row_count, self.dimension))
+        if self.dtype == "int8":
+            self._scales = np.fromfile(self._path(SCALES_FILE_NAME), dtype=np.float32, count=row_count)
+        norms = [self._norms[:first_new_row]]
+        for start in range(first_new_row, row_count, SEARCH_BLOCK_ROWS):
+            block = self._block(start, min(row_count, start + SEARCH_BLOCK_ROWS))
+            norms.append(np.einsum('ij,ij->i', block, block))
+        self._norms = np.concatenate(norms)
+
+    def _block(self, start: int, end: int) -> np.ndarray:
+        """Rows start..end as float32 (dequantized for int8)."""
+        block = np.asarray(self._vectors[start:end], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[start:end, None]
+        return block
+
+    def _encode(self, embeddings: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype != "int8":
+            return embeddings.astype(self.dtype), None
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _append(self, chunk_ids: List[str], embeddings: np.ndarray, documents: List[Optional[str]], metadatas: List[Dict[str, Any]]):
+        """Appends rows (vectors first, then the table rows that make them visible) and tombstones replaced ids. Caller holds the lock."""
+        first_row = len(self._ids)
+        encoded, scales = self._encode(embeddings)
+        for file_name, data in ((VECTORS_FILE_NAME, encoded), (SCALES_FILE_NAME, scales)):
+            if data is not None:
+                with open(self._path(file_name), 'ab') as f:
+                    f.truncate(first_row * data[0].nbytes) # Drops rows left by an append that failed part way
+                    f.write(data.tobytes())
+        replaced = [self._row_by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in self._row_by_id]
+        with self._table:
+            self._table.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in replaced])
+            self._table.executemany("INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                                    [(first_row + i, chunk_id, document, json.dumps(metadata or {}))
+                                     for i, (chunk_id, document, metadata) in enumerate(zip(chunk_ids, documents, metadatas))])
+        self._tombstone(replaced)
+        self._ids.extend(chunk_ids)
+        self._metadatas.extend(metadata or {} for metadata in metadatas)
+        self._row_by_id.update((chunk_id, first_row + i) for i, chunk_id in enumerate(chunk_ids))
+        self._live = np.concatenate([self._live, np.ones(len(chunk_ids), dtype=bool)])
+        self._remap(first_row)
+
+    def _tombstone(self, rows: List[int]):
+        for row in rows:
+            self._row_by_id.pop(self._ids[row], None)
+            self._ids[row] = None
+            self._metadatas[row] = None
+        if rows:
+            self._live[rows] = False
+
+    def compact(self):
+        """Rewrites the store without tombstoned rows."""
+        with self._lock:
+            live_rows = np.flatnonzero(self._live)
+            if len(live_rows) == len(self._ids):
+                return
+            rows = self._table.execute("SELECT row, id, document, metadata FROM chunks ORDER BY row").fetchall()
+            vectors = np.asarray(self._vectors[live_rows]) if self._vectors is not None else None
+            scales = self._scales[live_rows] if self._scales is not None else None
+            self._vectors = None # Release the map before the file is replaced
+            for file_name, data in ((VECTORS_FILE_NAME, vectors), (SCALES_FILE_NAME, scales)):
+                if data is not None:
+                    data.tofile(self._path(file_name) + ".tmp")
+                    os.replace(self._path(file_name) + ".tmp", self._path(file_name))
+            with self._table:
+                self._table.execute("DELETE FROM chunks")
+                self._table.executemany("INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                                        [(new_row, chunk_id, document, metadata) for new_row, (_, chunk_id, document, metadata) in enumerate(rows)])
+            print(f"[numpy_collection] Compacted '{self.name}': {len(self._ids)} -> {len(live_rows)} rows.")
+            self._load()
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._table.close()
+
+    # --- Collection API ---
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        return self._metadata
+
+    def modify(self, metadata: Dict[str, Any]):
+        with self._lock:
+            self._metadata = dict(metadata)
+            self._set_setting("metadata", json.dumps(self._metadata))
+
+    def count(self) -> int:
+        return len(self._row_by_id)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings of equal length")
+        unique = dict(zip(ids, range(len(ids)))) # The last of repeated ids wins, as in ChromaDB
+        positions = sorted(unique.values())
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                self._set_setting("dimension", str(self.dimension))
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality {self.dimension}")
+            self._append([ids[i] for i in positions], vectors[positions], [documents[i] for i in positions], [metadatas[i] for i in positions])
+
+    def _matching_rows(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> List[int]:
+        """Live rows, in the order of `ids` if given (else row order), that satisfy `where`. Caller holds the lock."""
+        if ids is not None:
+            rows = [self._row_by_id[chunk_id] for chunk_id in ids if chunk_id in self._row_by_id]
+        else:
+            rows = np.flatnonzero(self._live).tolist()
+        if where:
+            rows = [row for row in rows if matches_where(self._metadatas[row], where)]
+        return rows
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        if ids is None and not where:
+            return # As in ChromaDB, deleting needs ids or a filter
+        with self._lock:
+            rows = self._matching_rows(ids, where)
+            with self._table:
+                self._table.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._tombstone(rows)
+
+    def _rows_result(self, rows: List[int], include: List[str]) -> Dict[str, Any]:
+        """ids plus the included fields for `rows`. Caller holds the lock."""
+        result: Dict[str, Any] = {"ids": [self._ids[row] for row in rows]}
+        if 'documents' in include:
+            documents: Dict[int, str] = {}
+            for start in range(0, len(rows), 500): # Stay under SQLite's bound-parameter limit
+                part = rows[start:start + 500]
+                documents.update(self._table.execute(f"SELECT row, document FROM chunks WHERE row IN ({','.join('?' * len(part))})", part))
+            result['documents'] = [documents.get(row) for row in rows]
+        if 'metadatas' in include:
+            result['metadatas'] = [dict(self._metadatas[row]) for row in rows]
+        if 'embeddings' in include:
+            result['embeddings'] = [self._block(row, row + 1)[0].tolist() for row in rows] if self._vectors is not None else [None] * len(rows)
+        return result
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include if include is not None else ['metadatas', 'documents']
+        with self._lock:
+            rows = self._matching_rows(ids, where)
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            return dict(self._rows_result(rows, include), included=include)
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None, ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Exact top n_results per query embedding: one matrix product per block of rows, then argpartition.
+        `ids`, if given, limits the search to those chunks.
+        """
+        include = list(include if include is not None else ['metadatas', 'documents', 'distances'])
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        merged: Dict[str, Any] = {"ids": [], "included": include}
+        for field in include:
+            merged[field] = []
+        with self._lock:
+            if self._vectors is None or not len(queries):
+                for _ in range(len(queries)):
+                    merged["ids"].append([])
+                    for field in include:
+                        merged[field].append([])
+                return merged
+            if queries.shape[1] != self.dimension:
+                raise ValueError(f"Query embedding dimension {queries.shape[1]} does not match collection dimensionality {self.dimension}")
+            allowed = self._live
+            if where or ids is not None:
+                allowed = np.zeros(len(self._ids), dtype=bool)
+                allowed[self._matching_rows(ids, where)] = True
+            query_norms = np.einsum('ij,ij->i', queries, queries)
+            candidate_rows, candidate_distances = [], []
+            for start in range(0, len(self._ids), SEARCH_BLOCK_ROWS):
+                end = min(len(self._ids), start + SEARCH_BLOCK_ROWS)
+                # Squared L2 from dot products: |v|^2 + |q|^2 - 2 v.q, with filtered-out rows pushed to infinity
+                distances = self._norms[start:end, None] + query_norms[None, :] - 2.0 * (self._block(start, end) @ queries.T)
+                distances[~allowed[start:end]] = np.inf
+                keep = min(n_results, end - start)
+                top = np.argpartition(distances, keep - 1, axis=0)[:keep] if keep < end - start else np.arange(end - start)[:, None].repeat(len(queries), axis=1)
+                candidate_rows.append(top + start)
+                candidate_distances.append(np.take_along_axis(distances, top, axis=0))
+            rows = np.concatenate(candidate_rows)
+            distances = np.concatenate(candidate_distances)
+            for q in range(len(queries)):
+                order = np.argsort(distances[:, q], kind='stable')
+                best = [(int(rows[i, q]), float(distances[i, q])) for i in order if np.isfinite(distances[i, q])][:n_results]
+                part = self._rows_result([row for row, _ in best], include)
+                merged["ids"].append(part["ids"])
+                for field in include:
+                    merged[field].append([max(0.0, distance) for _, distance in best] if field == 'distances' else part.get(field, []))
+        return merged
+
+    def import_from(self, source, page_size: int = 1000) -> int:
+        """Copies every chunk (with its embedding) from another collection, e.g. an existing ChromaDB one."""
+        copied, offset = 0, 0
+        while True:
+            page = source.get(limit=page_size, offset=offset, include=['embeddings', 'documents', 'metadatas'])
+            if not page["ids"]:
+                break
+            self.upsert(page["ids"], [list(vector) for vector in page["embeddings"]], page["documents"], page["metadatas"])
+            copied += len(page["ids"])
+            offset += len(page["ids"])
+        return copied
+
+class NumpyClient:
+    """The client calls MemoryStore and ShardedCollection make, for collections stored under `path`/numpy/."""
+
+    def __init__(self, path: str, dtype: str = DEFAULT_VECTOR_DTYPE):
+        self.path = path
+        self.dtype = dtype
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str) -> NumpyCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = NumpyCollection(collection_directory(self.path, name), name, self.dtype)
+            return self._collections[name]
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        if name not in self._collections and not os.path.exists(os.path.join(collection_directory(self.path, name), TABLE_FILE_NAME)):
+            raise ValueError(f"Collection {name} does not exist.")
+        return self.get_or_create_collection(name)
+
+    def list_collections(self) -> List[str]:
+        root = os.path.join(self.path, "numpy")
+        if not os.path.isdir(root):
+            return []
+        names = {collection.name for collection in self._collections.values()}
+        for entry in os.listdir(root):
+            if os.path.exists(os.path.join(root, entry, TABLE_FILE_NAME)):
+                names.add(entry)
+        return sorted(names)
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections = {}
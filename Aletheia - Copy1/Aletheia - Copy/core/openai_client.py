@@ -0,0 +1,280 @@
+# core/openai_client.py
+# Shared OpenAI client layer: one async client and HTTP connection pool per process, driven by a
+# background event loop, with per-model rate limiting and retries. Sync wrappers let the CLI,
+# Streamlit app and ingestion scripts use the same pool from ordinary (threaded) code.
+# The openai SDK (and httpx) are imported on first use: they are a large part of a cold start.
+import asyncio
+import atexit
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from core.config import get_setting
+from core.telemetry import telemetry
+from core.tokens import count_tokens
+
+if TYPE_CHECKING:
+    import openai
+
+# --- Client Settings ---
+REQUEST_TIMEOUT_SECONDS = 60.0
+CONNECT_TIMEOUT_SECONDS = 10.0
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+COMPLETION_TOKEN_ESTIMATE = 800 # Output tokens assumed per completion when reserving rate-limit budget
+
+# Requests and tokens per minute allowed per model. Set these to your account's limits.
+RATE_LIMITS = {
+    "text-embedding-3-small": {"requests_per_minute": 3000, "tokens_per_minute": 1000000},
+    "gpt-4o": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+}
+DEFAULT_RATE_LIMIT = {"requests_per_minute": 500, "tokens_per_minute": 200000}
+
+def retryable_errors() -> tuple:
+    import openai
+    return (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """
+    Thread-safe token bucket. reserve() takes the amount immediately (the level may go negative)
+    and returns how long the caller must wait before using it, so concurrent callers queue fairly.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        amount = min(amount, self.capacity) # A single oversized request must still be able to run
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_per_second)
+            self.updated_at = now
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.refill_per_second
+
+class ModelRateLimiter:
+    """Request-rate and token-rate buckets for one model."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+
+    def reserve(self, token_count: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(token_count))
+
+_rate_limiters: Dict[str, ModelRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    with _rate_limiters_lock:
+        if model not in _rate_limiters:
+            _rate_limiters[model] = ModelRateLimiter(**RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT))
+        return _rate_limiters[model]
+
+# --- Retries ---
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Honours a Retry-After header when the API sends one; otherwise exponential backoff with full jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX_SECONDS, float(retry_after)) + random.uniform(0, BACKOFF_BASE_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+async def _with_retries(model: str, token_count: int, make_request):
+    """Runs `make_request` under the model's rate limit, retrying transient failures."""
+    limiter = get_rate_limiter(model)
+    attempt = 0
+    while True:
+        wait_seconds = limiter.reserve(token_count)
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+        try:
+            return await make_request()
+        except retryable_errors() as e:
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, e)
+            telemetry.increment("api_retries_total", model=model, error=type(e).__name__)
+            print(f"[openai_client] {type(e).__name__} from {model}. Retry {attempt}/{MAX_RETRIES} in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+# --- Shared Event Loop and Client ---
+class _LoopThread:
+    """A background asyncio loop that owns the async client, so every caller shares one connection pool."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="openai-client-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+_loop_thread: Optional[_LoopThread] = None
+_async_client: Optional["openai.AsyncOpenAI"] = None
+_client_lock = threading.Lock()
+
+def is_configured() -> bool:
+    return bool(get_setting("OPENAI_API_KEY"))
+
+def _get_loop_thread() -> _LoopThread:
+    global _loop_thread
+    with _client_lock:
+        if _loop_thread is None:
+            _loop_thread = _LoopThread()
+            atexit.register(close_clients)
+        return _loop_thread
+
+def get_async_client() -> "openai.AsyncOpenAI":
+    """Returns the process-wide async client. Use it only from coroutines running on the shared loop."""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            import httpx
+            import openai
+            http_client = openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+            )
+            # Retries are handled here (with rate-limit awareness), not by the SDK
+            _async_client = openai.AsyncOpenAI(api_key=get_setting("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+        return _async_client
+
+def warm_up_client() -> bool:
+    """Starts the shared loop and builds the client ahead of the first request. False if no API key is configured."""
+    if not is_configured():
+        return False
+    _get_loop_thread()
+    get_async_client()
+    return True
+
+async def _on_shared_loop(coroutine):
+    """Awaits `coroutine` on the shared loop, whichever loop the caller is running on."""
+    loop_thread = _get_loop_thread()
+    try:
+        if asyncio.get_running_loop() is loop_thread.loop:
+            return await coroutine
+    except RuntimeError:
+        pass
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop_thread.loop))
+
+def close_clients():
+    """Closes the shared client and its connection pool."""
+    global _async_client, _loop_thread
+    loop_thread, client = _loop_thread, _async_client
+    _async_client, _loop_thread = None, None
+    if loop_thread is None:
+        return
+    if client is not None:
+        try:
+            loop_thread.run(client.close())
+        except Exception as e:
+            print(f"[openai_client] Error closing OpenAI client: {e}")
+    loop_thread.stop()
+
+# --- Embeddings ---
+async def _create_embeddings(texts: List[str], model: str) -> List[List[float]]:
+    client = get_async_client()
+    token_count = sum(count_tokens(text, model) for text in texts)
+    telemetry.increment("embedding_requests_total", model=model)
+    telemetry.increment("embedding_tokens_total", token_count, model=model)
+    response = await _with_retries(model, token_count, lambda: client.embeddings.create(input=texts, model=model))
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+async def acreate_embeddings(texts: List[str], model: str) -> List[List[float]]:
+    """Embeds `texts` in one request. Raises the API error if it is not retryable or retries run out."""
+    return await _on_shared_loop(_create_embeddings(texts, model))
+
+def create_embeddings(texts: List[str], model: str) -> List[List[float]]:
+    """Sync wrapper for acreate_embeddings; safe to call from any thread."""
+    return _get_loop_thread().run(_create_embeddings(texts, model))
+
+# --- Chat Completions ---
+def _completion_token_estimate(messages: List[Dict[str, str]], params: Dict[str, Any]) -> int:
+    prompt_tokens = sum(count_tokens(message.get("content") or "") for message in messages)
+    return prompt_tokens + params.get("max_tokens", COMPLETION_TOKEN_ESTIMATE)
+
+async def _create_chat_completion(messages: List[Dict[str, str]], model: str, params: Dict[str, Any]) -> Optional[str]:
+    client = get_async_client()
+    response = await _with_retries(model, _completion_token_estimate(messages, params),
+                                   lambda: client.chat.completions.create(model=model, messages=messages, **params))
+    return response.choices[0].message.content
+
+async def acreate_chat_completion(messages: List[Dict[str, str]], model: str, **params) -> Optional[str]:
+    """Gets a chat completion. Raises the API error if it is not retryable or retries run out."""
+    return await _on_shared_loop(_create_chat_completion(messages, model, params))
+
+def create_chat_completion(messages: List[Dict[str, str]], model: str, **params) -> Optional[str]:
+    """Sync wrapper for acreate_chat_completion; safe to call from any thread."""
+    return _get_loop_thread().run(_create_chat_completion(messages, model, params))
+
+async def _open_chat_stream(messages: List[Dict[str, str]], model: str, params: Dict[str, Any]):
+    """Opens a streamed completion. Returns the stream (to close) and an async iterator over its events."""
+    client = get_async_client()
+    # Only opening the stream is retried; a stream that fails part-way is not replayed
+    stream = await _with_retries(model, _completion_token_estimate(messages, params),
+                                 lambda: client.chat.completions.create(model=model, messages=messages, stream=True, **params))
+    return stream, stream.__aiter__()
+
+async def _next_fragment(events) -> Optional[str]:
+    """Returns the next non-empty text fragment from a chat stream, or None at the end."""
+    while True:
+        try:
+            event = await events.__anext__()
+        except StopAsyncIteration:
+            return None
+        if event.choices and event.choices[0].delta.content:
+            return event.choices[0].delta.content
+
+async def _close_chat_stream(stream):
+    """Closes a chat stream's HTTP response, returning its connection to the pool (a no-op once fully read)."""
+    try:
+        await stream.close()
+    except Exception as e:
+        print(f"[openai_client] Error closing chat stream: {e}")
+
+async def astream_chat_completion(messages: List[Dict[str, str]], model: str, **params) -> AsyncIterator[str]:
+    """Yields chat completion text fragments as they arrive. The stream is closed however iteration ends."""
+    stream, events = await _on_shared_loop(_open_chat_stream(messages, model, params))
+    try:
+        while True:
+            fragment = await _on_shared_loop(_next_fragment(events))
+            if fragment is None:
+                return
+            yield fragment
+    finally:
+        await _on_shared_loop(_close_chat_stream(stream))
+
+def stream_chat_completion(messages: List[Dict[str, str]], model: str, **params) -> Iterator[str]:
+    """
+    Sync wrapper for astream_chat_completion: each fragment is pulled from the shared loop as it arrives.
+    The stream is closed on the shared loop however iteration ends (finished, failed or abandoned).
+    """
+    loop_thread = _get_loop_thread()
+    stream, events = loop_thread.run(_open_chat_stream(messages, model, params))
+    try:
+        while True:
+            fragment = loop_thread.run(_next_fragment(events))
+            if fragment is None:
+                return
+            yield fragment
+    finally:
+        if loop_thread.loop.is_running(): # Not after close_clients(), when waiting on the stopped loop would hang
+            loop_thread.run(_close_chat_stream(stream))
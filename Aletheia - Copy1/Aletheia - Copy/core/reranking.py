@@ -0,0 +1,226 @@
+# core/reranking.py
+# An optional second stage for retrieval: retrieve_relevant_chunks over-fetches candidates, a reranker scores
+# each (query, chunk) pair directly, and only the chunks that stand out in the score distribution are kept.
+# Scores are cached per (query, chunk id), so repeated and follow-up questions only score new candidates.
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import get_setting
+from core.embedding_cache import normalize_text
+from core.telemetry import telemetry
+
+# --- Reranker Selection ---
+# Chosen via environment variables (or .env), read when the reranker is first needed:
+#   ALETHEIA_RERANKER        none (default), cross-encoder, or overlap
+#   ALETHEIA_RERANK_MODEL    unset means the reranker's default model
+DEFAULT_RERANKER = "none"
+
+# --- Rerank Settings ---
+RERANK_CANDIDATES = 30 # Chunks retrieved for the reranker to choose from
+RERANK_BATCH_SIZE = 10 # (query, chunk) pairs scored per batch
+RERANK_MIN_KEEP = 2 # Chunks kept however flat the scores are
+RERANK_MIN_GAP = 0.15 # A drop of this much (on scores scaled to 0-1) between neighbours ends the kept chunks
+RERANK_CACHE_MAX_ENTRIES = 4096
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class RerankScoreCache:
+    """Least-recently-used scores by (reranker, query, chunk id); an entry only counts if the chunk text is unchanged."""
+
+    def __init__(self, max_entries: int = RERANK_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        # Chunk ids are positional (title + sequence number), so a re-ingested file can change the text behind an id
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+    def get(self, scorer: str, query: str, chunk_id: str, text: str) -> Optional[float]:
+        key = (scorer, normalize_text(query), chunk_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self._digest(text):
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, scorer: str, query: str, chunk_id: str, text: str, score: float):
+        key = (scorer, normalize_text(query), chunk_id)
+        with self._lock:
+            self._entries[key] = (self._digest(text), score)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+rerank_score_cache = RerankScoreCache()
+
+# --- Rerankers ---
+class Reranker:
+    """Base class for rerankers. score_batch() returns one relevance score per text, higher is better."""
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def warm_up(self):
+        """Loads the model ahead of the first query."""
+
+    def score_batch(self, query: str, texts: List[str]) -> List[float]:
+        raise NotImplementedError
+
+class CrossEncoderReranker(Reranker):
+    """
+    A cross-encoder run locally on the CPU with sentence-transformers. It reads query and chunk together, so
+    it judges relevance more precisely than comparing their embeddings; MiniLM-L-6 scores a batch of ten
+    chunks in a few tens of milliseconds.
+    """
+    name = "cross-encoder"
+    DEFAULT_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        super().__init__(model)
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._encoder is None:
+                from sentence_transformers import CrossEncoder # pip install sentence-transformers
+                self._encoder = CrossEncoder(self.model, device="cpu")
+        return self._encoder
+
+    def warm_up(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"[reranking] Error loading cross-encoder '{self.model}': {e}")
+
+    def score_batch(self, query: str, texts: List[str]) -> List[float]:
+        return [float(score) for score in self._load().predict([(query, text) for text in texts], batch_size=len(texts))]
+
+class OverlapReranker(Reranker):
+    """
+    A model-free scorer for machines without sentence-transformers: the share of the query's words (weighted
+    by how rare they are among the candidates) that a chunk contains, plus a bonus for query word pairs that
+    appear in the same order. Cheap enough to score every candidate, but far cruder than a cross-encoder.
+    """
+    name = "overlap"
+
+    def __init__(self, model: str = "word-overlap"):
+        super().__init__(model)
+
+    def score_batch(self, query: str, texts: List[str]) -> List[float]:
+        query_words = list(dict.fromkeys(WORD_PATTERN.findall(query.lower())))
+        if not query_words:
+            return [0.0] * len(texts)
+        chunk_words = [WORD_PATTERN.findall(text.lower()) for text in texts]
+        document_frequency = Counter(word for words in chunk_words for word in set(words))
+        weights = {word: 1.0 / (1 + document_frequency[word]) for word in query_words}
+        total = sum(weights.values())
+        pairs = set(zip(query_words, query_words[1:]))
+        scores = []
+        for words in chunk_words:
+            present = set(words)
+            coverage = sum(weight for word, weight in weights.items() if word in present) / total
+            ordered = len(pairs & set(zip(words, words[1:]))) / len(pairs) if pairs else 0.0
+            scores.append(coverage + 0.5 * ordered)
+        return scores
+
+# --- Reranker Registry ---
+RERANKERS = {
+    CrossEncoderReranker.name: CrossEncoderReranker,
+    OverlapReranker.name: OverlapReranker,
+}
+
+def create_reranker(name: str, model: Optional[str] = None) -> Optional[Reranker]:
+    if name == "none":
+        return None
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker '{name}'. Available: none, {', '.join(RERANKERS)}")
+    return RERANKERS[name](model) if model else RERANKERS[name]()
+
+_reranker: Optional[Reranker] = None
+_reranker_loaded = False
+
+def get_reranker() -> Optional[Reranker]:
+    """Returns the configured process-wide reranker, or None when reranking is off."""
+    global _reranker, _reranker_loaded
+    if not _reranker_loaded:
+        _reranker = create_reranker(get_setting("ALETHEIA_RERANKER", DEFAULT_RERANKER).lower(), get_setting("ALETHEIA_RERANK_MODEL"))
+        _reranker_loaded = True
+        if _reranker is not None:
+            print(f"[reranking] Reranking with '{_reranker.name}' ({_reranker.model}).")
+    return _reranker
+
+def set_reranker(reranker: Optional[Reranker]):
+    """Overrides the configured reranker (None turns reranking off), e.g. for tests and benchmarks."""
+    global _reranker, _reranker_loaded
+    _reranker, _reranker_loaded = reranker, True
+
+# --- Reranking ---
+def adaptive_depth(scores: List[float], max_keep: int, min_keep: int = RERANK_MIN_KEEP) -> int:
+    """
+    How many of the (descending) scores to keep: all up to max_keep, unless the scores fall off sharply
+    before that, in which case the chunks above the largest drop. Scores are scaled to 0-1 over all
+    candidates first, so the cut does not depend on the reranker's score range.
+    """
+    if len(scores) <= min_keep:
+        return len(scores)
+    spread = scores[0] - scores[-1]
+    if spread <= 0:
+        return min(max_keep, len(scores))
+    scaled = [(score - scores[-1]) / spread for score in scores]
+    end = min(max_keep, len(scores) - 1)
+    gaps = [(scaled[i - 1] - scaled[i], i) for i in range(min_keep, end + 1)]
+    largest, depth = max(gaps) if gaps else (0.0, end)
+    return depth if largest >= RERANK_MIN_GAP else min(max_keep, len(scores))
+
+def rerank(query: str, chunks: List[Dict[str, Any]], max_keep: int, reranker: Optional[Reranker] = None) -> List[Dict[str, Any]]:
+    """
+    Reorders retrieval results (best first) by reranker score and keeps adaptive_depth() of them, each with
+    its `rerank_score`. Candidates are scored in batches in retrieval order; once a batch places nothing in
+    the top max_keep, the candidates after it are left unscored (and dropped), since retrieval rank and
+    relevance rarely diverge that far. Without a reranker the first max_keep chunks come back unchanged.
+    """
+    reranker = reranker or get_reranker()
+    if reranker is None or not chunks:
+        return chunks[:max_keep]
+    scorer = f"{reranker.name}/{reranker.model}"
+    scored: List[Tuple[float, int, Dict[str, Any]]] = []
+    with telemetry.span("rerank", candidates=len(chunks)) as span:
+        cached = 0
+        for start in range(0, len(chunks), RERANK_BATCH_SIZE):
+            batch = chunks[start:start + RERANK_BATCH_SIZE]
+            texts = [chunk.get("text_chunk") or "" for chunk in batch]
+            scores = [rerank_score_cache.get(scorer, query, chunk["id"], text) for chunk, text in zip(batch, texts)]
+            missing = [i for i, score in enumerate(scores) if score is None]
+            cached += len(batch) - len(missing)
+            if missing:
+                try:
+                    fresh = reranker.score_batch(query, [texts[i] for i in missing])
+                except Exception as e:
+                    print(f"[reranking] Error scoring candidates with '{reranker.name}': {e}. Keeping retrieval order.")
+                    return chunks[:max_keep]
+                for i, score in zip(missing, fresh):
+                    scores[i] = score
+                    rerank_score_cache.put(scorer, query, batch[i]["id"], texts[i], score)
+            threshold = sorted((score for score, _, _ in scored), reverse=True)[max_keep - 1] if len(scored) >= max_keep else None
+            scored.extend((score, start + i, chunk) for i, (score, chunk) in enumerate(zip(scores, batch)))
+            if threshold is not None and all(score <= threshold for score in scores):
+                break
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        depth = adaptive_depth([score for score, _, _ in scored], max_keep)
+        span.update(scored=len(scored), cached=cached, kept=depth)
+    return [dict(chunk, rerank_score=score) for score, _, chunk in scored[:depth]]
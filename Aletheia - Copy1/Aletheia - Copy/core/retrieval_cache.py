@@ -0,0 +1,137 @@
+# core/retrieval_cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.embedding_cache import normalize_text
+from core.telemetry import telemetry
+
+# --- Cache Settings ---
+RETRIEVAL_CACHE_MAX_ENTRIES = 256
+RETRIEVAL_CACHE_TTL_SECONDS = 900.0
+RETRIEVAL_CACHE_SIMILARITY_THRESHOLD = 0.97 # Cosine similarity above which two queries count as the same question
+
+def _copy_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Callers may edit the chunks they get back (e.g. annotate metadata), so never hand out cached objects."""
+    return [dict(result, metadata=dict(result.get("metadata") or {})) for result in results]
+
+class RetrievalCache:
+    """
+    Caches retrieve_relevant_chunks results for repeated and rephrased questions.
+
+    Lookups go by exact query text first (no embedding or vector search at all), then by near-duplicate
+    query embedding among entries with the same filters, n_results and retrieval mode. Entries expire after a TTL, the
+    least recently used are evicted beyond max_entries, and invalidate() drops everything whenever the
+    collection is written to. A generation counter keeps a search that raced a write from being cached.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES, ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = RETRIEVAL_CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.generation = 0
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _scope(filters: Optional[Dict[str, Any]], n_results: int, mode: str) -> str:
+        return json.dumps([filters, n_results, mode], sort_keys=True, default=str)
+
+    def _expire(self, now: float):
+        """Drops entries past their TTL. Caller holds the lock."""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry["stored_at"] < self.ttl_seconds:
+                # Entries are kept in use order, not age order, so check the rest lazily on access
+                break
+            self._entries.pop(key)
+
+    def _live(self, key: Tuple[str, str], now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry["stored_at"] >= self.ttl_seconds:
+            self._entries.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, query_text: str, filters: Optional[Dict[str, Any]], n_results: int,
+                  mode: str = "vector") -> Optional[List[Dict[str, Any]]]:
+        key = (normalize_text(query_text).lower(), self._scope(filters, n_results, mode))
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None:
+                return None
+            self.stats["exact_hits"] += 1
+            return _copy_results(entry["results"])
+
+    def get_similar(self, query_embedding: List[float], filters: Optional[Dict[str, Any]], n_results: int,
+                    mode: str = "vector") -> Optional[List[Dict[str, Any]]]:
+        """Returns the results of the most similar cached query above the threshold, or None (see record_miss)."""
+        scope = self._scope(filters, n_results, mode)
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            candidates = [(key, entry) for key, entry in self._entries.items()
+                          if key[1] == scope and entry["vector"] is not None and len(entry["vector"]) == len(vector)]
+            if candidates and norm:
+                similarities = np.stack([entry["vector"] for _, entry in candidates]) @ (vector / norm)
+                best = int(np.argmax(similarities))
+                key, entry = candidates[best]
+                if similarities[best] >= self.similarity_threshold and self._live(key, now) is not None:
+                    self.stats["similar_hits"] += 1
+                    return _copy_results(entry["results"])
+            return None
+
+    def record_miss(self, count: int = 1):
+        """Counts lookups that found nothing. Callers record one per query once every lookup for it has failed."""
+        with self._lock:
+            self.stats["misses"] += count
+
+    def put(self, query_text: str, query_embedding: Optional[List[float]], filters: Optional[Dict[str, Any]],
+            n_results: int, results: List[Dict[str, Any]], generation: int, mode: str = "vector"):
+        """Stores results computed while the cache was at `generation`; skipped if a write happened since."""
+        vector = None
+        if query_embedding is not None:
+            vector = np.asarray(query_embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            vector = vector / norm if norm else None
+        key = (normalize_text(query_text).lower(), self._scope(filters, n_results, mode))
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = {"results": _copy_results(results), "vector": vector, "stored_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drops every cached result. Called after any write to or delete from the collection."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["similar_hits"]) / lookups if lookups else 0.0
+        return stats
+
+# Shared by every retrieval in the process
+retrieval_cache = RetrievalCache()
+telemetry.register_collector("retrieval_cache", retrieval_cache.get_stats)
+
+def get_retrieval_cache_stats() -> Dict[str, Any]:
+    return retrieval_cache.get_stats()
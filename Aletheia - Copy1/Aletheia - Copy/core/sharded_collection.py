@@ -0,0 +1,212 @@
+# core/sharded_collection.py
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from core.telemetry import telemetry
+
+SHARD_SEPARATOR = "__"
+REGISTRY_SUFFIX = "shards" # An empty collection that carries the sharded store's own metadata
+SHARD_QUERY_WORKERS = 8
+MIGRATION_PAGE_SIZE = 1000
+
+def shard_name(base_name: str, content_type: str) -> str:
+    """The shard collection for a content type, e.g. aletheia_memory__IRER_PhysicsNote."""
+    sane = re.sub(r"[^a-zA-Z0-9_-]", "_", content_type or "Unknown").strip("_-") or "Unknown"
+    return f"{base_name}{SHARD_SEPARATOR}{sane}"[:512]
+
+def content_types_in_filter(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """
+    The content types a `where` filter restricts results to, or None if it allows any.
+    Understands {"content_type": X}, {"content_type": {"$eq": X}}, {"content_type": {"$in": [...]}} and $and.
+    """
+    if not where:
+        return None
+    if "$and" in where:
+        allowed = None
+        for clause in where["$and"]:
+            types = content_types_in_filter(clause)
+            if types is not None:
+                allowed = types if allowed is None else [t for t in allowed if t in types]
+        return allowed
+    condition = where.get("content_type")
+    if condition is None:
+        return None
+    if not isinstance(condition, dict):
+        return [condition]
+    if "$eq" in condition:
+        return [condition["$eq"]]
+    if "$in" in condition:
+        return list(condition["$in"])
+    return None
+
+class ShardedCollection:
+    """
+    Presents one ChromaDB collection per content_type as a single collection, with the parts of the
+    Collection API this project uses (upsert, get, delete, query, count, metadata, modify).
+
+    Writes are routed by each chunk's content_type. Queries fan out concurrently to the shards that the
+    `where` filter allows (all of them otherwise) and are merged by distance, so a caller that filters on
+    content_type only searches those shards' indexes.
+    """
+
+    def __init__(self, client, base_name: str):
+        self.client = client
+        self.name = base_name
+        self.registry = client.get_or_create_collection(name=f"{base_name}{SHARD_SEPARATOR}{REGISTRY_SUFFIX}")
+        self._shards: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard-query")
+        prefix = f"{base_name}{SHARD_SEPARATOR}"
+        for listed in client.list_collections():
+            name = getattr(listed, "name", listed) # Collection objects or plain names, depending on the ChromaDB version
+            if name.startswith(prefix) and name != self.registry.name:
+                self._shards[name] = client.get_collection(name=name)
+
+    # --- Shards ---
+    @property
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        return self.registry.metadata
+
+    def modify(self, metadata: Dict[str, Any]):
+        self.registry.modify(metadata=metadata)
+
+    def shard_names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._shards)
+
+    def _shard_for_write(self, content_type: str):
+        name = shard_name(self.name, content_type)
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = self.client.get_or_create_collection(name=name)
+                print(f"[sharded_collection] Created shard '{name}'.")
+            return self._shards[name]
+
+    def _shards_for(self, where: Optional[Dict[str, Any]]) -> List[Any]:
+        types = content_types_in_filter(where)
+        with self._lock:
+            if types is None:
+                return [self._shards[name] for name in sorted(self._shards)]
+            names = {shard_name(self.name, content_type) for content_type in types}
+            return [self._shards[name] for name in sorted(names) if name in self._shards]
+
+    # --- Collection API ---
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault((metadata or {}).get("content_type") or "Unknown", []).append(i)
+        for content_type, positions in groups.items():
+            self._shard_for_write(content_type).upsert(
+                ids=[ids[i] for i in positions], embeddings=[embeddings[i] for i in positions],
+                documents=[documents[i] for i in positions], metadatas=[metadatas[i] for i in positions]
+            )
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self._shards_for(None))
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        for shard in self._shards_for(where):
+            shard.delete(ids=ids, where=where)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Gets from every allowed shard in turn; limit and offset apply across shards, in shard-name order."""
+        include = include if include is not None else ['metadatas', 'documents']
+        merged: Dict[str, Any] = {"ids": [], "included": include}
+        for field in include:
+            merged[field] = []
+        skip, remaining = offset or 0, limit
+        for shard in self._shards_for(where):
+            if remaining is not None and remaining <= 0:
+                break
+            if ids is None and where is None:
+                # Plain paging: whole shards before the offset are skipped by their count
+                size = shard.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+                part = shard.get(include=include, offset=skip, **({"limit": remaining} if remaining is not None else {}))
+                start, skip = 0, 0
+            else:
+                part = shard.get(ids=ids, where=where, include=include)
+                start = min(skip, len(part["ids"]))
+                skip -= start
+            end = len(part["ids"]) if remaining is None else min(len(part["ids"]), start + remaining)
+            merged["ids"].extend(part["ids"][start:end])
+            for field in include:
+                values = part.get(field)
+                merged[field].extend(list(values)[start:end] if values is not None else [None] * (end - start))
+            if remaining is not None:
+                remaining -= end - start
+        return merged
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None, ids_by_content_type: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+        """
+        Queries the allowed shards concurrently and keeps the n_results nearest per query embedding.
+        `ids_by_content_type`, if given, limits the search to those chunks: only their shards are queried,
+        each with its own ids (ChromaDB rejects ids that a collection does not hold).
+        A shard that fails is counted in errors_total and left out: the result then has "partial" set and
+        names it in "failed_shards". If every shard fails, the first error is raised.
+        """
+        include = list(include if include is not None else ['metadatas', 'documents', 'distances'])
+        shard_include = include if 'distances' in include else include + ['distances']
+        shard_ids: Dict[str, List[str]] = {}
+        if ids_by_content_type is not None:
+            for content_type, chunk_ids in ids_by_content_type.items():
+                shard_ids.setdefault(shard_name(self.name, content_type), []).extend(chunk_ids)
+
+        def query_shard(shard):
+            restriction = {"ids": shard_ids[shard.name]} if ids_by_content_type is not None else {}
+            try:
+                return shard.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=shard_include, **restriction), None
+            except Exception as e:
+                print(f"[sharded_collection] Error querying shard '{shard.name}': {e}")
+                telemetry.increment("errors_total", stage="shard_query", error=type(e).__name__)
+                return None, e
+
+        shards = self._shards_for(where)
+        if ids_by_content_type is not None:
+            shards = [shard for shard in shards if shard_ids.get(shard.name)]
+        outcomes = list(self._executor.map(query_shard, shards))
+        failed = [shard.name for shard, (_, error) in zip(shards, outcomes) if error is not None]
+        if failed and len(failed) == len(shards):
+            raise outcomes[0][1]
+        partials = [part for part, _ in outcomes if part]
+        merged: Dict[str, Any] = {"ids": [], "included": include, "partial": bool(failed), "failed_shards": failed}
+        for field in include:
+            merged[field] = []
+        for q in range(len(query_embeddings)):
+            candidates = []
+            for part in partials:
+                for i, chunk_id in enumerate(part["ids"][q]):
+                    candidates.append((part["distances"][q][i], chunk_id, part, i))
+            candidates.sort(key=lambda candidate: candidate[0])
+            top = candidates[:n_results]
+            merged["ids"].append([chunk_id for _, chunk_id, _, _ in top])
+            for field in include:
+                merged[field].append([part[field][q][i] if part.get(field) is not None else None for _, _, part, i in top])
+        return merged
+
+    def import_from(self, source, skip_existing: bool = False) -> int:
+        """
+        Copies every chunk (with its embedding) from an unsharded collection into the shards. With
+        skip_existing, chunks the shards already hold are left as they are (for resuming an interrupted copy).
+        """
+        copied, offset = 0, 0
+        while True:
+            page = source.get(limit=MIGRATION_PAGE_SIZE, offset=offset, include=['embeddings', 'documents', 'metadatas'])
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            positions = range(len(page["ids"]))
+            if skip_existing:
+                existing = set(self.get(ids=list(page["ids"]), include=[])["ids"])
+                positions = [i for i in positions if page["ids"][i] not in existing]
+            if positions:
+                self.upsert([page["ids"][i] for i in positions], [list(page["embeddings"][i]) for i in positions],
+                            [page["documents"][i] for i in positions], [page["metadatas"][i] for i in positions])
+            copied += len(positions)
+        return copied
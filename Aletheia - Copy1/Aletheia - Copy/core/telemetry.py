@@ -0,0 +1,286 @@
+# core/telemetry.py
+# Lightweight tracing and metrics for the chat pipeline. Spans time each stage of a turn, and counters
+# track tokens, embedding calls and errors. Each finished trace (one chat turn) is appended as a JSON
+# line to the trace log. The metrics, plus the caches' own stats, are rendered in the Prometheus text
+# format, written to a file and optionally served over HTTP.
+import atexit
+import contextvars
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.config import get_setting
+
+# --- Telemetry Settings ---
+# ALETHEIA_TRACE_LOG, ALETHEIA_METRICS_FILE and ALETHEIA_METRICS_PORT override these; an empty path disables that export
+TRACE_LOG_PATH = "logs/traces.jsonl" # Relative to the project root, like CHROMA_DATA_PATH
+TRACE_LOG_MAX_BYTES = 20 * 1024 * 1024 # The log is rotated to <path>.1 beyond this
+METRICS_FILE_PATH = "logs/metrics.prom" # For a Prometheus node_exporter textfile collector, or to read directly
+METRICS_EXPORT_INTERVAL_SECONDS = 15.0
+METRIC_PREFIX = "aletheia_"
+SPAN_SAMPLE_WINDOW = 1000 # Recent durations kept per span name for the quantiles
+SPAN_QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _metric_name(name: str) -> str:
+    return METRIC_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+class SpanStats:
+    """Count, total time and errors for one span name, plus a window of recent durations for quantiles."""
+
+    def __init__(self, window: int = SPAN_SAMPLE_WINDOW):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=window)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+class Telemetry:
+    """
+    Process-wide spans and counters. span() works anywhere. Spans opened inside trace() on the same thread
+    are also collected into that trace, which is logged as one JSON line when it finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._spans: Dict[str, SpanStats] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._current_trace: contextvars.ContextVar = contextvars.ContextVar("aletheia_trace", default=None)
+        self._log_lock = threading.Lock()
+
+    # --- Counters ---
+    def increment(self, name: str, amount: float = 1.0, **labels):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def get_counters(self) -> Dict[str, float]:
+        """Counter values keyed by name and labels, e.g. 'llm_tokens_in_total{model="gpt-4o"}'."""
+        with self._lock:
+            return {name + _format_labels(labels): value for (name, labels), value in sorted(self._counters.items())}
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, Any]]):
+        """Adds a stats function (e.g. a cache's get_stats) whose numeric values are exported as gauges named <name>_<key>."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    # --- Spans and Traces ---
+    def record_span(self, name: str, seconds: float, error: Optional[str] = None):
+        """Records a duration measured elsewhere (e.g. time to first token)."""
+        trace = self._current_trace.get()
+        entry = {"parent": trace["_open"][-1] if trace["_open"] else None} if trace is not None else {}
+        self._finish_span(name, seconds, error, entry, trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """
+        Times the block as stage `name`. Yields a dict the block may add attributes to (e.g. result counts);
+        they are logged with the span when it is part of a trace. An exception is counted and re-raised.
+        """
+        trace = self._current_trace.get()
+        entry: Dict[str, Any] = dict(attributes)
+        if trace is not None:
+            entry["parent"] = trace["_open"][-1] if trace["_open"] else None
+            trace["_open"].append(name)
+        error = None
+        started = time.perf_counter()
+        try:
+            yield entry
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            if trace is not None:
+                trace["_open"].pop()
+            self._finish_span(name, seconds, error, entry, trace)
+
+    def _finish_span(self, name: str, seconds: float, error: Optional[str], entry: Dict[str, Any], trace: Optional[Dict[str, Any]]):
+        with self._lock:
+            stats = self._spans.setdefault(name, SpanStats())
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.recent.append(seconds)
+            if error:
+                stats.errors += 1
+        if error:
+            self.increment("errors_total", stage=name, error=error)
+        if trace is not None:
+            trace["spans"].append(dict(entry, name=name, ms=round(seconds * 1000, 3), **({"error": error} if error else {})))
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """Times a whole unit of work (a chat turn) and logs it with its spans when it finishes."""
+        trace = {"trace_id": uuid.uuid4().hex[:16], "name": name,
+                 "started_at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                 "attributes": dict(attributes), "spans": [], "_open": []}
+        token = self._current_trace.set(trace)
+        error = None
+        started = time.perf_counter()
+        try:
+            yield trace
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self._current_trace.reset(token)
+            self._finish_span(name, seconds, error, {}, None)
+            trace.pop("_open")
+            trace["ms"] = round(seconds * 1000, 3)
+            if error:
+                trace["error"] = error
+            self._write_trace(trace)
+
+    def get_span_summary(self) -> List[Dict[str, Any]]:
+        """One row per span name: count, errors, mean and p50/p95 latency in ms (over the recent window)."""
+        with self._lock:
+            rows = []
+            for name, stats in self._spans.items():
+                rows.append({"stage": name, "count": stats.count, "errors": stats.errors,
+                             "mean ms": round(stats.total_seconds / stats.count * 1000, 1) if stats.count else 0.0,
+                             "p50 ms": round(stats.quantile(0.5) * 1000, 1), "p95 ms": round(stats.quantile(0.95) * 1000, 1)})
+        return rows
+
+    # --- Export ---
+    def _write_trace(self, trace: Dict[str, Any]):
+        path = get_setting("ALETHEIA_TRACE_LOG", TRACE_LOG_PATH)
+        if not path:
+            return
+        try:
+            line = json.dumps(trace, default=str)
+            with self._log_lock:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if os.path.exists(path) and os.path.getsize(path) > TRACE_LOG_MAX_BYTES:
+                    os.replace(path, path + ".1")
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            print(f"[telemetry] Error writing trace log {path}: {e}")
+
+    def render_prometheus(self) -> str:
+        """Every counter, span summary and collector stat in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            spans = {name: (stats.count, stats.total_seconds, stats.errors, [stats.quantile(q) for q in SPAN_QUANTILES])
+                     for name, stats in self._spans.items()}
+            collectors = dict(self._collectors)
+
+        typed = set()
+        for (name, labels), value in counters:
+            metric = _metric_name(name)
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+
+        metric = _metric_name("stage_duration_seconds")
+        if spans:
+            lines.append(f"# TYPE {metric} summary")
+        for name, (count, total, _, quantiles) in sorted(spans.items()):
+            for q, value in zip(SPAN_QUANTILES, quantiles):
+                lines.append(f"{metric}{_format_labels((('stage', name), ('quantile', str(q))))} {value:.6f}")
+            lines.append(f"{metric}_sum{_format_labels((('stage', name),))} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels((('stage', name),))} {count}")
+
+        for collector_name, collect in sorted(collectors.items()):
+            try:
+                stats = collect()
+            except Exception as e:
+                print(f"[telemetry] Error collecting {collector_name} stats: {e}")
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauge = _metric_name(f"{collector_name}_{key}")
+                    lines.append(f"# TYPE {gauge} gauge")
+                    lines.append(f"{gauge} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Optional[str] = None) -> bool:
+        """Writes the metrics file atomically, so a scraper never reads half of it."""
+        path = path if path is not None else get_setting("ALETHEIA_METRICS_FILE", METRICS_FILE_PATH)
+        if not path:
+            return False
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(temp_path, path)
+            return True
+        except Exception as e:
+            print(f"[telemetry] Error writing metrics file {path}: {e}")
+            return False
+
+# Shared by every module in the process
+telemetry = Telemetry()
+
+# --- Periodic Export ---
+_export_thread: Optional[threading.Thread] = None
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = telemetry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes would otherwise print a line each
+
+def start_metrics_export(interval_seconds: float = METRICS_EXPORT_INTERVAL_SECONDS):
+    """
+    Rewrites the metrics file every interval on a daemon thread (and once more at exit). If
+    ALETHEIA_METRICS_PORT is set, also serves the metrics at http://localhost:<port>/metrics.
+    Safe to call more than once.
+    """
+    global _export_thread, _metrics_server
+    if _export_thread is not None:
+        return
+    port = get_setting("ALETHEIA_METRICS_PORT")
+    if port:
+        try:
+            _metrics_server = ThreadingHTTPServer(("127.0.0.1", int(port)), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"[telemetry] Serving metrics at http://127.0.0.1:{port}/metrics")
+        except Exception as e:
+            print(f"[telemetry] Error starting metrics server on port {port}: {e}")
+
+    def run():
+        while True:
+            time.sleep(interval_seconds)
+            telemetry.write_prometheus()
+
+    _export_thread = threading.Thread(target=run, name="metrics-export", daemon=True)
+    _export_thread.start()
+    atexit.register(telemetry.write_prometheus)
@@ -0,0 +1,32 @@
+# core/tokens.py
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken # pip install tiktoken (optional, gives exact counts)
+except ImportError:
+    tiktoken = None
+
+DEFAULT_ENCODING = "cl100k_base" # Used by text-embedding-3-* and gpt-4 family models
+CHARS_PER_TOKEN_ESTIMATE = 4 # Rough English average when tiktoken is not installed
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Counts the tokens in a text for the given model.
+    Falls back to a character-based estimate when tiktoken is not available.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // CHARS_PER_TOKEN_ESTIMATE)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,5 +1,10 @@
+import argparse
 import os
+import shutil
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Add the project root to the Python path
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -8,10 +13,11 @@ if project_root not in sys.path:
 print(f"[ingest_all.py] Project root added to sys.path: {project_root}")
 
 try:
-    from core.corememory_system import ingest_document
-    print("[ingest_all.py] Successfully imported 'ingest_document' from 'core.corememory_system'.")
+    from core.corememory_system import get_collection, load_ingest_manifest, ChunkBatchWriter, stage_document_ingestion, finalize_document_ingestion
+    from core.documents import get_chunker_for_content_type, spool_document_chunks, iter_spooled_chunks
+    print("[ingest_all.py] Successfully imported ingestion functions from 'core.corememory_system'.")
 except ImportError as e:
-    print(f"[ingest_all.py] Error: Could not import 'ingest_document': {e}")
+    print(f"[ingest_all.py] Error: Could not import ingestion functions: {e}")
     sys.exit(1)
 
 DATA_DIR = "data/"
@@ -38,39 +44,133 @@ FILE_MAP = {
 }
 print(f"[ingest_all.py] FILE_MAP defined with {len(FILE_MAP)} items.")
 
-def run_ingestion():
+def _stage_files_serially(targets, manifest, writer, force, stats):
+    """Streams each file through chunking on this thread, one after another."""
+    plans = []
+    for filename, title, content_type, file_path in targets:
+        try:
+            plan = stage_document_ingestion(file_path, title, content_type, manifest, writer, force=force)
+            if plan is None:
+                stats["unchanged"] += 1
+            else:
+                print(f"\nProcessing: {filename}...")
+                stats["bytes"] += os.path.getsize(file_path)
+                plans.append((filename, plan))
+        except Exception as e:
+            print(f"!!! FAILED to ingest {filename}: {e} !!!")
+            stats["failed"] += 1
+    return plans
+
+def _stage_files_in_parallel(targets, manifest, writer, force, workers, stats):
+    """
+    Parses and chunks files in a process pool (each worker spools its chunks to a temp file),
+    then streams each finished spool through the diff into the shared writer as it completes.
+    """
+    plans = []
+    spool_dir = tempfile.mkdtemp(prefix="aletheia_ingest_")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for i, (filename, title, content_type, file_path) in enumerate(targets):
+                chunker = get_chunker_for_content_type(content_type)
+                if not force and manifest.is_unchanged(file_path, title, content_type, chunker.signature):
+                    print(f"Unchanged since last ingestion: {file_path}. Skipping.")
+                    stats["unchanged"] += 1
+                    continue
+                spool_path = os.path.join(spool_dir, f"{i}.jsonl")
+                future = pool.submit(spool_document_chunks, file_path, title, content_type, chunker, spool_path)
+                futures[future] = (filename, title, content_type, file_path, chunker)
+
+            for done_count, future in enumerate(as_completed(futures), 1):
+                filename, title, content_type, file_path, chunker = futures[future]
+                try:
+                    spool = future.result()
+                    print(f"\n[ingest_all.py] [{done_count}/{len(futures)}] Chunked {filename} ({spool['chunk_count']} chunks). Processing...")
+                    plan = stage_document_ingestion(
+                        file_path, title, content_type, manifest, writer, force=force, chunker=chunker,
+                        records=iter_spooled_chunks(spool["spool_path"]), content_hash=spool["content_hash"]
+                    )
+                    os.remove(spool["spool_path"])
+                    stats["bytes"] += os.path.getsize(file_path)
+                    plans.append((filename, plan))
+                except Exception as e:
+                    print(f"!!! FAILED to ingest {filename}: {e} !!!")
+                    stats["failed"] += 1
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return plans
+
+def run_ingestion(force: bool = False, workers: int = 1, embed_concurrency: int = 1):
+    """Ingests every file in FILE_MAP. Returns a summary of the run (None if nothing could run)."""
     print("[ingest_all.py] Entered run_ingestion() function.") # New debug print
     print("--- Starting Full Knowledge Ingestion ---")
-    ingested_count = 0
-    failed_count = 0
+    stats = {"ingested": 0, "unchanged": 0, "failed": 0, "bytes": 0}
+    start_time = time.perf_counter()
 
     if not FILE_MAP: # Check if FILE_MAP is empty
         print("[ingest_all.py] Warning: FILE_MAP is empty. No files to process.")
         return
 
+    if not get_collection():
+        print("[ingest_all.py] Error: ChromaDB collection not initialized. Aborting ingestion.")
+        return
+
+    targets = [] # (filename, title, content_type, file_path)
     for filename, (title, content_type) in FILE_MAP.items():
         base_dir = CONFIG_DIR if content_type == "AletheiaCoreConfig" else DATA_DIR
         file_path = os.path.join(base_dir, filename)
         print(f"[ingest_all.py] Checking for file: {file_path}") # New debug print
-
         if os.path.exists(file_path):
-            print(f"\nProcessing: {filename}...")
-            try:
-                ingest_document(file_path, title, content_type)
-                ingested_count += 1
-            except Exception as e:
-                print(f"!!! FAILED to ingest {filename}: {e} !!!")
-                failed_count += 1
+            targets.append((filename, title, content_type, file_path))
         else:
             print(f"--- SKIPPING: {filename} (Not found at {file_path}) ---")
-            failed_count += 1
-            
+            stats["failed"] += 1
+
+    manifest = load_ingest_manifest()
+    # Chunks stream from each file into one shared writer, so embedding requests are
+    # batched across files while memory stays bounded by the writer's batch size.
+    # Embedding batches may run concurrently, but only this thread writes to ChromaDB.
+    writer = ChunkBatchWriter(embed_concurrency=embed_concurrency)
+
+    # 1. Chunk every file and diff its chunks against the manifest
+    if workers > 1:
+        print(f"[ingest_all.py] Parallel mode: {workers} chunking processes, {embed_concurrency} concurrent embedding requests.")
+        plans = _stage_files_in_parallel(targets, manifest, writer, force, workers, stats)
+    else:
+        plans = _stage_files_serially(targets, manifest, writer, force, stats)
+
+    # 2. Write whatever is still pending, then delete orphans and record each file in the manifest
+    writer.close()
+    for filename, plan in plans:
+        try:
+            if finalize_document_ingestion(plan, writer, manifest):
+                stats["ingested"] += 1
+            else:
+                stats["failed"] += 1
+        except Exception as e:
+            print(f"!!! FAILED to ingest {filename}: {e} !!!")
+            stats["failed"] += 1
+    manifest.save()
+
+    elapsed = time.perf_counter() - start_time
+    chunk_count = sum(len(plan["chunk_hashes"]) for _, plan in plans)
+    megabytes = stats["bytes"] / (1024 * 1024)
     print("\n--- Full Knowledge Ingestion Finished ---")
-    print(f"Successfully processed (or attempted): {ingested_count} files.")
-    print(f"Skipped or Failed: {failed_count} files.")
+    print(f"Successfully processed (or attempted): {stats['ingested']} files.")
+    print(f"Unchanged since last run: {stats['unchanged']} files.")
+    print(f"Skipped or Failed: {stats['failed']} files.")
+    print(f"Chunks: {chunk_count} seen, {writer.written_count} embedded and written, {len(writer.failed_ids)} failed.")
+    print(f"Throughput: {megabytes:.2f} MB in {elapsed:.2f}s "
+          f"({chunk_count / elapsed if elapsed else 0:.1f} chunks/s, {megabytes / elapsed if elapsed else 0:.2f} MB/s).")
+    return dict(stats, chunks=chunk_count, written=writer.written_count, chunk_failures=len(writer.failed_ids), seconds=elapsed)
 
 if __name__ == "__main__":
     print("[ingest_all.py] Script started in __main__ block.") # New debug print
-    # Ensure .env is loaded by llm_interface.py which corememory_system.py imports
-    run_ingestion()
+    parser = argparse.ArgumentParser(description="Ingest Aletheia's knowledge files into memory.")
+    parser.add_argument("--force", action="store_true", help="Re-embed and rewrite every chunk, ignoring the ingest manifest.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to parse and chunk files in parallel (1 = serial streaming).")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Embedding requests allowed in flight at once.")
+    args = parser.parse_args()
+    # .env is loaded on first use by core/config.py
+    run_ingestion(force=args.force, workers=args.workers, embed_concurrency=args.embed_concurrency)
     print("[ingest_all.py] Script finished __main__ block.") # New debug print
\ No newline at end of file
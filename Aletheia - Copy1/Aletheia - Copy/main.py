@@ -1,7 +1,10 @@
 import os
 import sys
+import time
 import yaml # For loading our config files
 
+STARTED_AT = time.perf_counter() # For the startup time reported once the chat is ready
+
 # --- Add project root to path for imports ---
 project_root = os.path.dirname(os.path.abspath(__file__))
 if project_root not in sys.path:
@@ -9,8 +12,12 @@ if project_root not in sys.path:
 
 # --- Import Aletheia's Core Functions ---
 try:
-    from core.llm_interface import get_llm_completion
-    from core.corememory_system import retrieve_relevant_chunks, ingest_interaction_text
+    from core.llm_interface import stream_llm_completion, CompletionStreamError
+    from core.corememory_system import retrieve_relevant_chunks, ingest_interaction_text, flush_interactions, warm_up_memory
+    from core.memory_tiers import start_background_compaction
+    from core.context_assembly import assemble_context, context_budget, CONTEXT_CANDIDATES
+    from core.lens_registry import get_lens_registry
+    from core.telemetry import telemetry, start_metrics_export
     print("[main.py] Core functions imported successfully.")
 except ImportError as e:
     print(f"[main.py] Error importing core functions: {e}")
@@ -22,9 +29,6 @@ CONFIGS_DIR = "configs/"
 SYSTEM_PROMPT_FILE = os.path.join(CONFIGS_DIR, "system_prompt_aletheia_v0_1.yaml")
 REASONING_LENSES_FILE = os.path.join(CONFIGS_DIR, "reasoning_lenses_v0_1.yaml") # <-- NEW
 
-# --- Global variable for loaded lenses ---
-LOADED_LENSES = {}
-
 # --- Function to Load YAML ---
 def load_yaml(file_path):
     """Loads a YAML file and returns its content."""
@@ -38,19 +42,6 @@ def load_yaml(file_path):
         print(f"Error loading YAML file {file_path}: {e}")
         return None
 
-# --- Function to Load Reasoning Lenses ---
-def load_reasoning_lenses():
-    """Loads reasoning lenses from the YAML file into a dictionary."""
-    global LOADED_LENSES
-    lenses_config = load_yaml(REASONING_LENSES_FILE)
-    if lenses_config and 'lenses' in lenses_config:
-        for lens in lenses_config['lenses']:
-            if 'name' in lens:
-                LOADED_LENSES[lens['name'].lower()] = lens # Store by lowercase name for easy lookup
-        print(f"[main.py] Successfully loaded {len(LOADED_LENSES)} reasoning lenses.")
-    else:
-        print("[main.py] Warning: Could not load reasoning lenses or file is improperly formatted.")
-
 # --- Function to Build System Prompt ---
 def build_system_prompt():
     """Builds the full system prompt text from configuration files."""
@@ -77,13 +68,20 @@ def build_system_prompt():
 def run_chat():
     """Runs the main interactive chat loop with Aletheia."""
     print("\n--- Aletheia Initializing ---")
+    warm_up_memory() # Opens ChromaDB and the indexes in the background while the prompt and lenses load
     
     aletheia_system_prompt = build_system_prompt()
     print(f"[main.py] System prompt loaded. Length: {len(aletheia_system_prompt)} chars.")
     
-    load_reasoning_lenses() # <-- Load lenses at startup
+    lens_registry = get_lens_registry(REASONING_LENSES_FILE) # Loaded and compiled once; see core/lens_registry.py
+    if lens_registry:
+        print(f"[main.py] Successfully loaded {len(lens_registry)} reasoning lenses.")
+    else:
+        print("[main.py] Warning: Could not load reasoning lenses or file is improperly formatted.")
+    start_background_compaction() # Folds interactions older than the hot tier into session summaries
+    start_metrics_export() # Per-stage latencies and counters, see core/telemetry.py
     
-    print("\n--- Aletheia is ready. ---")
+    print(f"\n--- Aletheia is ready ({time.perf_counter() - STARTED_AT:.2f}s). ---")
     print("To use a specific lens, type: lens: [lens_name] [your query]")
     print("Example: lens: Contextual Self-Referencing How does my latest idea about OIWs fit our past discussions?")
     print("Type 'quit' to exit.")
@@ -93,91 +91,78 @@ def run_chat():
             user_input_full = input("\nYou: ")
             if user_input_full.lower() == 'quit':
                 print("Aletheia: Farewell. May your path be clear.")
+                flush_interactions(timeout=30) # Let queued interactions reach memory before exiting
                 break
             if not user_input_full.strip():
                 continue
 
-            user_query = user_input_full
-            selected_lens_name = None
-            lens_archetype = None
-
-            # Check if user wants to use a specific lens
-            if user_input_full.lower().startswith("lens:"):
-                parts = user_input_full.split(maxsplit=2) # lens: LensName query
-                if len(parts) > 1:
-                    potential_lens_name_command = parts[1].lower() 
-                    # Match lens name, allowing for multi-word lens names
-                    for known_lens_name_key in LOADED_LENSES.keys():
-                        # Check if the command starts with a known lens name (case-insensitive)
-                        # This allows for "lens: contextual self-referencing query" or "lens: contextual query"
-                        # For simplicity, let's assume the user types the full lens name for now or we find the best match
-                        # A more robust approach would be needed for partial matches or aliases
-                        # For now, we'll try an exact match of the first part of the user's lens command
-                        # to a known lens name (case-insensitive)
-                        
-                        # Attempt to match the user's specified lens name against loaded lenses
-                        # This simple check requires user to type the lens name accurately
-                        # More complex matching could be added later.
-                        
-                        # Let's split the command part into words for a more flexible match
-                        command_words = potential_lens_name_command.split()
-                        
-                        # Check if the command words match any full lens name
-                        # Trying to find a lens name that is a prefix of the user's command
-                        matched_lens = None
-                        for ln_key in LOADED_LENSES.keys():
-                            # Simple check: if user's command STARTS with the lens name
-                            # (e.g. "contextual self-referencing how does..." will match "contextual self-referencing")
-                            if potential_lens_name_command.startswith(ln_key):
-                                matched_lens = ln_key
-                                break
-                        
-                        if matched_lens:
-                            selected_lens_name = LOADED_LENSES[matched_lens]['name'] # Get the proper cased name
-                            lens_archetype = LOADED_LENSES[matched_lens].get('prompt_archetype')
-                            # The actual query is what remains after "lens: Lens Name "
-                            # Reconstruct the query part
-                            query_start_index = user_input_full.lower().find(matched_lens) + len(matched_lens)
-                            user_query = user_input_full[query_start_index:].strip()
-                            print(f"[main.py] Using Lens: '{selected_lens_name}' for query: '{user_query}'")
-                            break # Found and processed lens command
-
-            # 1. Retrieve Context from Memory (based on the actual user_query)
-            print(f"[main.py] Retrieving context for query: '{user_query}'...")
-            context_chunks = retrieve_relevant_chunks(user_query, n_results=3) 
+            with telemetry.trace("chat_turn", frontend="cli") as turn:
+                # Check if user wants to use a specific lens ("lens: <name> <query>"; unique prefixes, acronyms and small typos work)
+                with telemetry.span("lens_matching"):
+                    selected_lens, user_query, is_lens_command = lens_registry.resolve_command(user_input_full)
+                selected_lens_name = selected_lens.name if selected_lens else None
+                if selected_lens:
+                    print(f"[main.py] Using Lens: '{selected_lens_name}' for query: '{user_query}'")
+                elif is_lens_command:
+                    print(f"[main.py] No lens matches that command. Available lenses: {', '.join(lens_registry.names())}")
+
+                # 1. Retrieve Context from Memory (based on the actual user_query)
+                turn["attributes"]["lens"] = selected_lens_name
+                print(f"[main.py] Retrieving context for query: '{user_query}'...")
+                with telemetry.span("retrieval") as span:
+                    # A lens may narrow retrieval to the sources it reasons over, or fetch more candidates
+                    context_chunks = retrieve_relevant_chunks(user_query, n_results=(selected_lens and selected_lens.n_results) or CONTEXT_CANDIDATES,
+                                                              content_types=selected_lens.content_types if selected_lens else None)
+                    span["chunks"] = len(context_chunks)
             
-            context_text = "\n--- Relevant Context ---\n"
-            if context_chunks:
-                for i, chunk in enumerate(context_chunks):
-                    context_text += f"Context {i+1} (Source: {chunk['metadata'].get('source_file_name', 'N/A')} - Title: {chunk['metadata'].get('document_title', 'N/A')}):\n"
-                    context_text += f"{chunk['text_chunk']}\n---\n"
-            else:
-                context_text += "No specific context found in memory for this query.\n"
-
-            # 2. Construct the Full Prompt
-            if lens_archetype:
-                # Substitute placeholders in the lens archetype
-                full_prompt = lens_archetype.replace("{CONTEXT_CHUNKS}", context_text.strip())
-                full_prompt = full_prompt.replace("{USER_QUERY}", user_query)
-            else:
-                # Default prompt construction if no specific lens is used
-                full_prompt = f"{context_text}\nBased on the above context (if any) and your core identity, respond to the following:\nUser: {user_query}"
+                # 2. Construct the Full Prompt
+                with telemetry.span("prompt_construction") as span:
+                    # Deduplicated, merged context that fits what the lens template leaves of the prompt budget
+                    context = assemble_context(context_chunks, token_budget=context_budget(selected_lens and selected_lens.template.static_text, user_query))
+                    context_text = context["text"]
+                    span.update(tokens=context["tokens"], passages=len(context["passages"]),
+                                duplicates=context["duplicates"], merged=context["merged"], omitted=context["omitted"])
+
+                    if selected_lens:
+                        # Fill the lens's precompiled template
+                        full_prompt = selected_lens.render_prompt(context_text.strip(), user_query)
+                    else:
+                        # Default prompt construction if no specific lens is used
+                        full_prompt = f"{context_text}\nBased on the above context (if any) and your core identity, respond to the following:\nUser: {user_query}"
             
-            # 3. Get LLM Response
-            print("[main.py] Thinking...")
-            ai_response = get_llm_completion(full_prompt, system_prompt=aletheia_system_prompt)
-
-            # 4. Print Aletheia's Response
-            if ai_response:
-                print(f"Aletheia: {ai_response}")
-                # 5. Save this interaction back to memory
-                print("[main.py] Saving interaction to memory...")
-                ingest_interaction_text(user_input_full, ai_response) # Save the original full input
-            else:
-                print("Aletheia: I seem to be having trouble processing that right now. Could you rephrase?")
+                # 3. Get LLM Response, printing it as it streams in
+                print("[main.py] Thinking...")
+                response_fragments = []
+                completion_started = time.perf_counter()
+                stream_error = None
+                try:
+                    with telemetry.span("completion"):
+                        for fragment in stream_llm_completion(full_prompt, system_prompt=aletheia_system_prompt):
+                            if not response_fragments:
+                                telemetry.record_span("first_token", time.perf_counter() - completion_started)
+                                print("Aletheia: ", end="", flush=True)
+                            print(fragment, end="", flush=True)
+                            response_fragments.append(fragment)
+                except CompletionStreamError as e:
+                    stream_error = e
+                ai_response = "".join(response_fragments)
+
+                # 4. Finish Aletheia's Response
+                if stream_error is not None:
+                    # A cut-off answer is shown as such and not saved, so memory only holds complete turns
+                    print(f"\n[main.py] The response was cut off ({stream_error}). This turn is not saved to memory.")
+                elif ai_response:
+                    print()
+                    # 5. Save this interaction back to memory (written in the background)
+                    print("[main.py] Queuing interaction for memory...")
+                    with telemetry.span("memory_write"):
+                        ingest_interaction_text(user_input_full, ai_response) # Save the original full input
+                else:
+                    print("Aletheia: I seem to be having trouble processing that right now. Could you rephrase?")
 
         except KeyboardInterrupt: 
             print("\nAletheia: Session interrupted. Farewell.")
+            flush_interactions(timeout=30)
             break
         except Exception as e:
             print(f"\n[main.py] An unexpected error occurred: {e}")